@@ -2,16 +2,25 @@ from telegram.ext import ApplicationBuilder, CommandHandler, filters
 
 import constants
 from channel.handlers import handle_init, handle_add_pair, handle_remove_pair, handle_show_pairs, handle_set_posting_interval, handle_current_chart, \
-    handle_set_mode, handle_set_pair_interval, initiate_periodic_charting
-from channel.channel_utils import error_handler
+    handle_set_mode, handle_set_pair_interval, handle_set_album, initiate_periodic_charting
+from channel.channel_utils import error_handler, stop_handler, shutdown_handler, collect_image_garbage, log_dispatch_stats, initiate_metrics
 
-application = ApplicationBuilder().token(constants.BOT_TOKEN).build()
+application = ApplicationBuilder().token(constants.BOT_TOKEN).post_stop(stop_handler).post_shutdown(shutdown_handler).build()
 
 # Register the error handler
 application.add_error_handler(error_handler)
 
 initiate_periodic_charting(application)
 
+# Serve the pipeline timings and stats on the metrics endpoint
+initiate_metrics()
+
+# Garbage collect the image store in the background
+application.job_queue.run_repeating(collect_image_garbage, interval=constants.IMAGE_STORE_GC_INTERVAL_SECONDS, first=constants.IMAGE_STORE_GC_INTERVAL_SECONDS)
+
+# Log the outbound queue stats
+application.job_queue.run_repeating(log_dispatch_stats, interval=constants.DISPATCH_STATS_INTERVAL_SECONDS, first=constants.DISPATCH_STATS_INTERVAL_SECONDS)
+
 # Register the message handlers
 application.add_handler(CommandHandler("init", filters=filters.COMMAND, callback=handle_init))
 application.add_handler(CommandHandler("addpair", filters=filters.COMMAND, callback=handle_add_pair))
@@ -21,6 +30,7 @@ application.add_handler(CommandHandler("setinterval", filters=filters.COMMAND, c
 application.add_handler(CommandHandler("currentchart", filters=filters.COMMAND, callback=handle_current_chart))
 application.add_handler(CommandHandler("setmode", filters=filters.COMMAND, callback=handle_set_mode))
 application.add_handler(CommandHandler("setpairinterval", filters=filters.COMMAND, callback=handle_set_pair_interval))
+application.add_handler(CommandHandler("setalbum", filters=filters.COMMAND, callback=handle_set_album))
 
 # Start the Bot
 application.run_polling()
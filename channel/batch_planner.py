@@ -0,0 +1,90 @@
+# This module gathers the pairs of every channel that posts in the same tick into a single render batch. The scheduler makes most channels fire
+# in the same second, so without it every channel renders its own pair list, and the renders scale with channels x pairs instead of unique pairs.
+import asyncio
+
+import constants
+from data.render_executor import render_charts
+from data.utils import normalize_pair
+from utils.logger import logger
+
+
+class BatchPlanner:
+    def __init__(self, window_seconds: float):
+        """
+        Args:
+            window_seconds (float): How long a tick stays open for more channels after the first one asks for its pairs.
+        """
+        self.window_seconds = window_seconds
+
+        # The tick currently collecting channels: the channel ID -> pairs it asked for, and the future of the whole batch's image paths.
+        self.pending_pairs = None
+        self.pending_batch = None
+
+        # The event loop only keeps weak references to its tasks, the batches in progress are kept here so they aren't garbage collected.
+        self.batch_tasks = set()
+
+    async def render(self, chat_id: str, pair_list: list[str]) -> dict[str, str]:
+        """
+        Adds a channel's pairs to the current tick's batch and waits for the batch to render. The first channel of a tick opens it, and every
+        channel that asks within window_seconds joins the same batch.
+
+        Args:
+            chat_id (str): The ID of the channel, used for the tick's log.
+            pair_list (list[str]): The pairs the channel posts in this tick.
+
+        Returns:
+            dict[str, str]: The path to the image of every pair of the channel, or None for the pairs that failed to render.
+        """
+        pair_list = [normalize_pair(pair) for pair in pair_list]
+
+        if self.pending_batch is None:
+            self.pending_pairs = {}
+            self.pending_batch = asyncio.get_running_loop().create_future()
+            batch_task = asyncio.create_task(self.__render_batch(self.pending_pairs, self.pending_batch))
+            self.batch_tasks.add(batch_task)
+            batch_task.add_done_callback(self.batch_tasks.discard)
+
+        self.pending_pairs.setdefault(chat_id, []).extend(pair_list)
+
+        # shield() so that a cancelled channel doesn't cancel the batch for everyone else.
+        image_paths = await asyncio.shield(self.pending_batch)
+
+        return {pair: image_paths.get(pair) for pair in pair_list}
+
+    async def __render_batch(self, channel_pairs: dict[str, list[str]], batch: asyncio.Future):
+        await asyncio.sleep(self.window_seconds)
+
+        # Close the tick, the channels that ask from now on start the next one.
+        self.pending_pairs = None
+        self.pending_batch = None
+
+        unique_pairs = list(dict.fromkeys(pair for pair_list in channel_pairs.values() for pair in pair_list if pair))
+        n_requested = sum(len(pair_list) for pair_list in channel_pairs.values())
+        logger.info(f"Rendering a batch of {len(unique_pairs)} unique pairs for {len(channel_pairs)} channels ({n_requested} pairs requested)")
+
+        try:
+            batch.set_result(await self.__render_chunks(unique_pairs) if unique_pairs else {})
+        except Exception as e:
+            batch.set_exception(e)
+            # Mark the exception as retrieved, the channels waiting on the batch get it when they await the future.
+            batch.exception()
+
+    @staticmethod
+    async def __render_chunks(unique_pairs: list[str]) -> dict[str, str]:
+        # One render_charts call runs on a single worker with a single browser, so the batch is split into a chunk per render worker and the
+        # chunks render in parallel. A chunk that fails only fails its own pairs.
+        n_chunks = min(constants.RENDER_WORKERS, len(unique_pairs))
+        chunks = [unique_pairs[i::n_chunks] for i in range(n_chunks)]
+
+        image_paths = {}
+        for chunk, chunk_paths in zip(chunks, await asyncio.gather(*(render_charts(chunk) for chunk in chunks), return_exceptions=True)):
+            if isinstance(chunk_paths, Exception):
+                logger.error(f"Error rendering the pairs {chunk}: {chunk_paths}")
+                continue
+
+            image_paths.update(chunk_paths)
+
+        return image_paths
+
+
+batch_planner = BatchPlanner(window_seconds=constants.BATCH_PLANNER_WINDOW_SECONDS)
@@ -1,8 +1,15 @@
+import asyncio
 from datetime import datetime, timezone, timedelta
 
 import constants
-from utils.config_manager import load_config, save_config
+from data.image_store import image_store
+from data.file_id_cache import file_id_cache
+from data.render_cache import render_cache
+from data.render_executor import shutdown_render_executor
+from utils.config_manager import config_store
 from utils.logger import logger
+from utils.metrics import metrics, start_metrics_server, shutdown_metrics
+from utils.outbound_dispatcher import outbound_dispatcher
 
 
 # Error handler function
@@ -10,6 +17,49 @@ async def error_handler(update, context):
     logger.error(f"Update {update} caused error {context.error}")
 
 
+# Called by the application once it has stopped polling and running jobs, while the bot can still send. Lets the queued messages go out.
+async def stop_handler(application):
+    await outbound_dispatcher.shutdown()
+
+
+# Called by the application once it has stopped, releases everything that outlives a single job.
+async def shutdown_handler(application):
+    shutdown_render_executor()
+
+    # Write any config changes still waiting for their batch
+    config_store.shutdown()
+
+    shutdown_metrics()
+
+
+def initiate_metrics():
+    # Exposes the stats the render cache, the file_id cache and the outbound dispatcher already keep next to the stage timings, and starts the
+    # metrics endpoint.
+    metrics.register_callback("heatmap_render_cache_hits_total", "counter", "Pairs served from the render cache.", lambda: render_cache.hits)
+    metrics.register_callback("heatmap_render_cache_misses_total", "counter", "Pairs not in the render cache.", lambda: render_cache.misses)
+    metrics.register_callback(
+        "heatmap_render_cache_coalesced_total", "counter", "Pairs that joined an in-flight render.", lambda: render_cache.coalesced
+    )
+    metrics.register_callback("heatmap_file_id_hits_total", "counter", "Images sent by file_id.", lambda: file_id_cache.hits)
+    metrics.register_callback("heatmap_file_id_uploads_total", "counter", "Images uploaded.", lambda: file_id_cache.uploads)
+    metrics.register_callback("heatmap_dispatch_sent_total", "counter", "Messages sent.", lambda: outbound_dispatcher.sent)
+    metrics.register_callback("heatmap_dispatch_failed_total", "counter", "Messages that failed to send.", lambda: outbound_dispatcher.failed)
+    metrics.register_callback("heatmap_dispatch_retried_total", "counter", "Flood limit retries.", lambda: outbound_dispatcher.retried)
+    metrics.register_callback("heatmap_dispatch_queue_depth", "gauge", "Messages waiting to be sent.", outbound_dispatcher.get_queue_depth)
+
+    start_metrics_server()
+
+
+# Periodic job that removes old images from the image store, in a thread since it touches the disk.
+async def collect_image_garbage(context):
+    await asyncio.to_thread(image_store.collect_garbage)
+
+
+# Periodic job that logs the outbound queue depth, the send latency and the flood limit retries.
+async def log_dispatch_stats(context):
+    outbound_dispatcher.log_stats()
+
+
 def get_image_caption(pair, channel_link, posting_interval: int = None):
     if posting_interval:
         # Convert the seconds of posting_interval to hours
@@ -0,0 +1,135 @@
+# This module schedules every periodic chart post of every channel in one heap, instead of one job queue job per channel and pair. A single job
+# queue job wakes up at the earliest posting time and dispatches every post that's due in one batch, then sleeps until the next one.
+import heapq
+import itertools
+import math
+import time
+
+from utils.logger import logger
+
+WAKE_JOB_NAME = "chart_scheduler"
+
+
+class ChartScheduler:
+    def __init__(self):
+        # entry id -> {"chat_id", "interval", "data"}
+        self.entries = {}
+
+        # chat_id -> the ids of the channel's entries, so a channel can be rescheduled without touching the others.
+        self.channel_entries = {}
+
+        # (posting time, entry id). Removed entries are left in the heap and skipped when they come up.
+        self.heap = []
+        self.entry_ids = itertools.count()
+
+        # The job that wakes the scheduler up, and when.
+        self.callback = None
+        self.wake_job = None
+        self.wake_at = None
+
+    def add_entry(self, chat_id: str, starting_time: float, interval: int, data: dict):
+        """
+        Schedules a post that repeats every interval seconds from its starting time.
+
+        Args:
+            chat_id (str): The ID of the channel.
+            starting_time (float): The first posting time as a unix timestamp.
+            interval (int): The posting interval in seconds.
+            data (dict): Passed to the dispatch callback with every post.
+        """
+        entry_id = next(self.entry_ids)
+        self.entries[entry_id] = {"chat_id": chat_id, "interval": interval, "data": data}
+        self.channel_entries.setdefault(chat_id, []).append(entry_id)
+
+        heapq.heappush(self.heap, (starting_time, entry_id))
+
+    def remove_channel(self, chat_id: str) -> int:
+        # Removes every entry of the channel, returns how many there were.
+        entry_ids = self.channel_entries.pop(chat_id, [])
+        for entry_id in entry_ids:
+            del self.entries[entry_id]
+
+        # Rebuild the heap once the removed entries make up most of it, so it doesn't grow with every reschedule.
+        if len(self.heap) > 2 * len(self.entries) + 64:
+            self.heap = [item for item in self.heap if item[1] in self.entries]
+            heapq.heapify(self.heap)
+
+        return len(entry_ids)
+
+    def get_next_posting_time(self) -> float | None:
+        while self.heap and self.heap[0][1] not in self.entries:
+            heapq.heappop(self.heap)
+
+        return self.heap[0][0] if self.heap else None
+
+    def pop_due(self, now: float) -> list[tuple[float, dict]]:
+        """
+        Takes every post that's due at the given time off the heap, and schedules the next post of each.
+
+        Returns:
+            list[tuple[float, dict]]: The posting time and the entry of every due post.
+        """
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            posting_time, entry_id = heapq.heappop(self.heap)
+            entry = self.entries.get(entry_id)
+            if entry is None:
+                continue
+
+            due.append((posting_time, entry))
+
+            # The next post is a whole number of intervals after this one. If the bot fell behind, the missed posts are skipped rather than
+            # sent in a burst.
+            n_intervals = math.floor((now - posting_time) / entry["interval"]) + 1
+            heapq.heappush(self.heap, (posting_time + n_intervals * entry["interval"], entry_id))
+
+        return due
+
+    def start(self, job_queue, callback):
+        """
+        Starts dispatching the scheduled posts.
+
+        Args:
+            job_queue (JobQueue): The application's job queue.
+            callback (callable): Called with the context, the chat_id and the entry's data for every post, as a task of its own.
+        """
+        self.callback = callback
+        self.arm(job_queue)
+
+    def arm(self, job_queue):
+        # Makes sure the scheduler wakes up by the earliest posting time. Call it after adding entries.
+        if self.callback is None:
+            return
+
+        next_posting_time = self.get_next_posting_time()
+        if self.wake_job is not None:
+            if next_posting_time is not None and self.wake_at <= next_posting_time:
+                return
+
+            self.wake_job.schedule_removal()
+            self.wake_job = None
+
+        if next_posting_time is None:
+            return
+
+        # In seconds from now rather than as a datetime, a posting time that has just passed then runs right away.
+        self.wake_at = next_posting_time
+        self.wake_job = job_queue.run_once(self.__wake, when=max(0.0, next_posting_time - time.time()), name=WAKE_JOB_NAME)
+
+    async def __wake(self, context):
+        self.wake_job = None
+
+        due = self.pop_due(time.time())
+        for _, entry in due:
+            context.application.create_task(self.callback(context, entry["chat_id"], entry["data"]))
+
+        if due:
+            logger.info(f"Dispatched {len(due)} periodic chart posts, {len(self.entries)} scheduled")
+
+        self.arm(context.job_queue)
+
+    def compose_stats(self) -> str:
+        return f"Chart scheduler: {len(self.entries)} entries, {len(self.channel_entries)} channels, heap size = {len(self.heap)}"
+
+
+chart_scheduler = ChartScheduler()
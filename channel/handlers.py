@@ -1,75 +1,136 @@
-import os.path
+import time
 
 from telegram import Update
 from telegram.ext import ContextTypes
 
-from utils.config_manager import save_config, load_config, initiate_channel_config
+from utils.config_manager import load_config, get_channel_config, initiate_channel_config, update_channel_config
 from utils.logger import logger
-from data.chart import Chart
-from data.utils import send_image_with_caption
+from utils.metrics import span
+from utils.outbound_dispatcher import send_message, ON_DEMAND_PRIORITY
+from data.render_executor import render_charts
+from data.utils import send_image_with_caption, send_images_as_album, normalize_pair
+from channel.batch_planner import batch_planner
+from channel.chart_scheduler import chart_scheduler
 from channel.channel_utils import get_image_caption
 from channel.scheduler_utils import SimultaneousScheduler, SequentialScheduler
 
+MODES = ("simultaneous", "sequential")
 
-def initiate_periodic_charting(application):
-    # Set up a job to send a periodic message every hour
-    config = load_config()
-    for chat_id in config.keys():
-        if config[chat_id]["mode"] == "simultaneous":
-            posting_interval: int = config[chat_id].get("posting_interval", 14400)
-            pair_list = config[chat_id]["pair_list"]
 
-            starting_time = SimultaneousScheduler(posting_interval).starting_time
+def _parse_interval(text: str) -> int | None:
+    # An interval in whole seconds, or None if the text isn't a positive integer.
+    try:
+        interval = int(text)
+    except ValueError:
+        return None
 
-            logger.info(
-                f"Started periodic chart generation for {chat_id} "
-                f"mode = 'simultaneous', "
-                f"period = {posting_interval}, "
-                f"starting time {starting_time}"
-            )
+    return interval if interval > 0 else None
+
+
+def schedule_channel(chat_id: str, channel_config: dict, reference_time: float = None):
+    """
+    Adds the periodic chart posts of a single channel to the chart scheduler, with the first posting times computed by the channel mode's
+    scheduler.
+
+    Args:
+        chat_id (str): The ID of the channel.
+        channel_config (dict): The channel's config.
+        reference_time (float): The unix timestamp the posting times are computed from. Defaults to now.
+    """
+    # The handlers refuse these, but a config edited by hand could still have them.
+    if channel_config.get("posting_interval", 1) <= 0 or channel_config.get("pair_interval", 1) <= 0:
+        logger.warning(f"Invalid intervals in the config of {chat_id}, not scheduling its periodic charts")
+        return
+
+    if channel_config["mode"] == "simultaneous":
+        posting_interval: int = channel_config.get("posting_interval", 14400)
+        pair_list = channel_config["pair_list"]
+
+        starting_time = SimultaneousScheduler(posting_interval, reference_time).starting_time
+
+        logger.info(
+            f"Started periodic chart generation for {chat_id} "
+            f"mode = 'simultaneous', "
+            f"period = {posting_interval}, "
+            f"starting time {starting_time}"
+        )
+
+        chart_scheduler.add_entry(
+            chat_id,
+            starting_time.timestamp(),
+            posting_interval,
+            data={
+                "pair_list": pair_list,
+                "posting_interval": posting_interval,
+                "starting_time": starting_time,
+            },
+        )
+
+    elif channel_config["mode"] == "sequential":
+        # If mode is sequential, each pair has its own entry, with the starting point being different but with the same posting_interval.
+        # The starting point is determined by the order of the pairs in the list, and the starting points are spaced by the pair_interval value.
+        # All the logic for the sequential mode is contained in the scheduler_utils.py file's SequentialScheduler class.
+
+        posting_interval: int = channel_config.get("posting_interval", 43200)
+        pair_interval: int = channel_config.get("pair_interval", 3600)
+        pair_list = channel_config["pair_list"]
+
+        # There would be nothing to post.
+        if not pair_list:
+            logger.info(f"No pairs to schedule for {chat_id}")
+            return
+
+        scheduler = SequentialScheduler(posting_interval, pair_interval, pair_list, reference_time)
+        starting_schedule = scheduler.starting_schedule
 
-            application.job_queue.run_repeating(
-                send_periodic_chart,
-                interval=posting_interval,
-                first=starting_time,
-                chat_id=chat_id,
+        for starting_schedule_dict in starting_schedule:
+            pair = starting_schedule_dict["pair"]
+            starting_time = starting_schedule_dict["starting_time"]
+
+            chart_scheduler.add_entry(
+                chat_id,
+                starting_time.timestamp(),
+                posting_interval,
                 data={
-                    "pair_list": pair_list,
+                    "pair": pair,
                     "posting_interval": posting_interval,
+                    "pair_interval": pair_interval,
                     "starting_time": starting_time,
                 },
             )
 
-        elif config[chat_id]["mode"] == "sequential":
-            # If mode is sequential, each pair has its own queue, with the starting point being different but with the same posting_interval.
-            # The starting point is determined by the order of the pairs in the list, and the starting points are spaced by the pair_interval value.
-            # All the logic for the sequential mode is contained in the scheduler_utils.py file's SequentialScheduler class.
-
-            posting_interval: int = config[chat_id].get("posting_interval", 43200)
-            pair_interval: int = config[chat_id].get("pair_interval", 3600)
-            pair_list = config[chat_id]["pair_list"]
-
-            scheduler = SequentialScheduler(posting_interval, pair_interval, pair_list)
-            starting_schedule = scheduler.starting_schedule
-
-            for starting_schedule_dict in starting_schedule:
-                pair = starting_schedule_dict["pair"]
-                starting_time = starting_schedule_dict["starting_time"]
-
-                application.job_queue.run_repeating(
-                    send_periodic_chart,
-                    interval=posting_interval,
-                    first=starting_time,
-                    chat_id=chat_id,
-                    data={
-                        "pair": pair,
-                        "posting_interval": posting_interval,
-                        "pair_interval": pair_interval,
-                        "starting_time": starting_time,
-                    },
-                )
+        logger.info(scheduler.compose_starting_schedule())
+
 
-            logger.info(scheduler.compose_starting_schedule())
+def reschedule_channel(job_queue, chat_id: str):
+    """
+    Replaces a channel's periodic chart posts with ones built from its current config. Only this channel's posts are removed, and a post that
+    is already running finishes.
+
+    Args:
+        job_queue (JobQueue): The application's job queue.
+        chat_id (str): The ID of the channel.
+    """
+    n_removed = chart_scheduler.remove_channel(chat_id)
+    logger.info(f"Removed {n_removed} periodic chart posts of {chat_id}")
+
+    channel_config = get_channel_config(chat_id)
+    if channel_config is not None:
+        schedule_channel(chat_id, channel_config)
+
+    chart_scheduler.arm(job_queue)
+
+
+def initiate_periodic_charting(application):
+    # Set up the periodic chart posts of every channel, all computed from the same moment, and start dispatching them.
+    reference_time = time.time()
+
+    config = load_config()
+    for chat_id in config.keys():
+        schedule_channel(chat_id, config[chat_id], reference_time)
+
+    logger.info(chart_scheduler.compose_stats())
+    chart_scheduler.start(application.job_queue, send_periodic_chart)
 
 
 async def handle_init(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -85,15 +146,14 @@ async def handle_init(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     # Log the message
     logger.info(f"Config init message in chat {title}({chat_id}): {message_text}")
 
-    # Load the current configuration
-    config = initiate_channel_config(chat_id)
-
-    # Save the updated configuration
-    save_config(config)
+    # Initialize the configuration, if the channel doesn't have one yet
+    initiate_channel_config(chat_id)
+    reschedule_channel(context.job_queue, chat_id)
 
-    await context.bot.send_message(
+    await send_message(
+        context,
         chat_id=chat_id,
-        text=f"✅ Channel config initiated to defaults. The bot needs to be restarted for the changes to take effect.",
+        text=f"✅ Channel config initiated to defaults.",
     )
 
 
@@ -111,8 +171,9 @@ async def handle_set_mode(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
     # Separate the setup command and process the inputs
     parts = message_text.split(" ")
-    if len(parts) < 2:
-        await context.bot.send_message(
+    if len(parts) < 2 or parts[1] not in MODES:
+        await send_message(
+            context,
             chat_id=chat_id,
             text="❌ Invalid command format. Use /setmode <mode>, where mode is either 'simultaneous' or 'sequential'.",
         )
@@ -120,16 +181,14 @@ async def handle_set_mode(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
     mode = parts[1]
 
-    # Load the current configuration
-    config = initiate_channel_config(chat_id)
-    config[chat_id]["mode"] = mode
-
-    # Save the updated configuration
-    save_config(config)
+    # Update the configuration under the channel's lock
+    update_channel_config(chat_id, lambda channel_config: channel_config.update(mode=mode))
+    reschedule_channel(context.job_queue, chat_id)
 
-    await context.bot.send_message(
+    await send_message(
+        context,
         chat_id=chat_id,
-        text=f"✅ Set mode to {mode}. The bot needs to be restarted for the changes to take effect.",
+        text=f"✅ Set mode to {mode}.",
     )
 
 
@@ -149,29 +208,35 @@ async def handle_add_pair(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     parts = message_text.split(" ")
 
     if len(parts) < 2:
-        await context.bot.send_message(
+        await send_message(
+            context,
             chat_id=chat_id, text="❌ Invalid command format. Use /addpair <pair>"
         )
         return
 
-    pair = parts[1]
+    pair = parts[1].upper()
 
-    config = initiate_channel_config(chat_id)
+    def add_pair(channel_config) -> bool:
+        if pair in channel_config["pair_list"]:
+            return False
 
-    if pair not in config[chat_id]["pair_list"]:
-        config[chat_id]["pair_list"].append(pair.upper())
+        channel_config["pair_list"].append(pair)
+        return True
 
-        # Save the updated configuration
-        save_config(config)
+    # The check and the addition happen under the channel's lock, so concurrent commands can't lose each other's pairs
+    if update_channel_config(chat_id, add_pair):
+        reschedule_channel(context.job_queue, chat_id)
 
         # Post the update of the timeframe to the channel that requested it
-        await context.bot.send_message(
+        await send_message(
+            context,
             chat_id=chat_id, text=f"✅ Added pair {pair.upper()}"
         )
 
     # If pair is already on the list, nothing should change
     else:
-        await context.bot.send_message(
+        await send_message(
+            context,
             chat_id=chat_id, text=f"❌ {pair.upper()} already exists on the list."
         )
 
@@ -194,28 +259,35 @@ async def handle_remove_pair(
     parts = message_text.split(" ")
 
     if len(parts) < 2:
-        await context.bot.send_message(
+        await send_message(
+            context,
             chat_id=chat_id, text="❌ Invalid command format. Use /removepair <pair>"
         )
         return
 
-    pair = parts[1]
+    pair = parts[1].upper()
+
+    def remove_pair(channel_config) -> bool:
+        if pair not in channel_config["pair_list"]:
+            return False
 
-    config = initiate_channel_config(chat_id)
-    if pair in config[chat_id]["pair_list"]:
-        config[chat_id]["pair_list"].remove(pair.upper())
+        channel_config["pair_list"].remove(pair)
+        return True
 
-        # Save the updated configuration
-        save_config(config)
+    # The check and the removal happen under the channel's lock, so concurrent commands can't lose each other's changes
+    if update_channel_config(chat_id, remove_pair):
+        reschedule_channel(context.job_queue, chat_id)
 
         # Post the update of the pair removal to the channel that requested it
-        await context.bot.send_message(
+        await send_message(
+            context,
             chat_id=chat_id, text=f"✅ Removed pair {pair.upper()}"
         )
 
     # If the pair doesn't exist in the list, nothing would change.
     else:
-        await context.bot.send_message(
+        await send_message(
+            context,
             chat_id=chat_id,
             text=f"✅ {pair.upper()} doesn't exist in the channel pair list. Nothing changed.",
         )
@@ -230,15 +302,16 @@ async def handle_show_pairs(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     # message = "⚙️ Current pair and timeframe list:\n"
     message = "⚙️ Current pair list:\n"
-    config = load_config()
+    channel_config = get_channel_config(chat_id)
+    if channel_config is None:
+        logger.info(f"No config for {chat_id}, no pairs to show")
+        await send_message(context, chat_id=chat_id, text="❌ No data yet.")
+        return
 
-    try:
-        for pair in config[chat_id]["pair_list"]:
-            message += f"🔹 {pair}\n"
-    except:
-        message = "❌ No data yet."
+    for pair in channel_config["pair_list"]:
+        message += f"🔹 {pair}\n"
 
-    await context.bot.send_message(chat_id=chat_id, text=message)
+    await send_message(context, chat_id=chat_id, text=message)
 
 
 async def handle_set_posting_interval(
@@ -254,26 +327,23 @@ async def handle_set_posting_interval(
 
     # Separate the setup command and process the inputs
     parts = message_text.split(" ")
-    if len(parts) < 2:
-        await context.bot.send_message(
+    interval = _parse_interval(parts[1]) if len(parts) >= 2 else None
+    if interval is None:
+        await send_message(
+            context,
             chat_id=chat_id,
             text="❌ Invalid command format. Use /setinterval <interval>, where interval is in seconds.",
         )
         return
 
-    interval = parts[1]
-
-    # Load the current configuration
-    config = initiate_channel_config(chat_id)
-    config[chat_id]["posting_interval"] = int(interval)
+    # Update the configuration under the channel's lock
+    update_channel_config(chat_id, lambda channel_config: channel_config.update(posting_interval=interval))
+    reschedule_channel(context.job_queue, chat_id)
 
-    # Save the updated configuration
-    save_config(config)
-
-    await context.bot.send_message(
+    await send_message(
+        context,
         chat_id=chat_id,
-        text=f"✅ Set posting interval to {interval} seconds. "
-        f"The bot needs to be restarted for the changes to take effect.",
+        text=f"✅ Set posting interval to {interval} seconds.",
     )
 
 
@@ -290,85 +360,131 @@ async def handle_set_pair_interval(
 
     # Separate the setup command and process the inputs
     parts = message_text.split(" ")
-    if len(parts) < 2:
-        await context.bot.send_message(
+    interval = _parse_interval(parts[1]) if len(parts) >= 2 else None
+    if interval is None:
+        await send_message(
+            context,
             chat_id=chat_id,
             text="❌ Invalid command format. Use /setpairinterval <interval>, where interval is in seconds.",
         )
         return
 
-    interval = parts[1]
+    # Update the configuration under the channel's lock
+    update_channel_config(chat_id, lambda channel_config: channel_config.update(pair_interval=interval))
+    reschedule_channel(context.job_queue, chat_id)
+
+    await send_message(
+        context,
+        chat_id=chat_id,
+        text=f"✅ Set pair interval to {interval} seconds.",
+    )
+
+
+async def handle_set_album(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # Turn album posting on or off for the channel. With albums on, the simultaneous mode posts its charts as media groups of up to 10.
+    chat_id = str(update.channel_post.chat.id)
+    title = update.channel_post.chat.title
+    message_text = update.channel_post.text
+
+    # Log the message
+    logger.info(f"Config message in chat {title}({chat_id}): {message_text}")
+
+    # Separate the setup command and process the inputs
+    parts = message_text.split(" ")
+    if len(parts) < 2 or parts[1].lower() not in ("on", "off"):
+        await send_message(
+            context,
+            chat_id=chat_id,
+            text="❌ Invalid command format. Use /setalbum <on|off>",
+        )
+        return
 
-    # Load the current configuration
-    config = initiate_channel_config(chat_id)
-    config[chat_id]["pair_interval"] = int(interval)
+    album = parts[1].lower() == "on"
 
-    # Save the updated configuration
-    save_config(config)
+    # Update the configuration under the channel's lock
+    update_channel_config(chat_id, lambda channel_config: channel_config.update(album=album))
 
-    await context.bot.send_message(
+    await send_message(
+        context,
         chat_id=chat_id,
-        text=f"✅ Set pair interval to {interval} seconds. The bot needs to be restarted for the changes to take effect.",
+        text=f"✅ Album posting turned {parts[1].lower()}.",
     )
 
 
-async def send_periodic_chart(context: ContextTypes.DEFAULT_TYPE) -> None:
-    chat_id = str(context.job.chat_id)
-    posting_interval = int(context.job.data["posting_interval"])
+async def send_periodic_chart(context: ContextTypes.DEFAULT_TYPE, chat_id: str, data: dict) -> None:
+    # Called by the chart scheduler with the data of the post's entry.
+    posting_interval = int(data["posting_interval"])
 
-    config = load_config()
+    # The channel's config may have been removed since the post was scheduled.
+    channel_config = get_channel_config(chat_id)
+    if channel_config is None:
+        logger.warning(f"No config for {chat_id}, skipping its periodic chart")
+        return
 
-    if config[chat_id]["mode"] == "simultaneous":
-        pair_list = [
-            pair.replace("USDT", "").replace("USD", "").replace(" ", "")
-            for pair in config[chat_id]["pair_list"]
-        ]
+    if channel_config["mode"] == "simultaneous":
+        pair_list = [normalize_pair(pair) for pair in channel_config["pair_list"]]
 
-        # Initialize the Chart class and download the chart
-        chart = Chart(headless_mode=True)
-        chart.download_chart(pair_list)
+        # Render the charts along with the other channels posting in this tick, without blocking the event loop
+        with span("render_wait", job="periodic"):
+            image_paths = await batch_planner.render(chat_id, pair_list)
 
+        images = []
         for pair in pair_list:
             # Skip placeholder pairs
             if len(pair) == 0 or pair == "":
-                return
+                break
 
-            caption = get_image_caption(
-                pair,
-                channel_link=config[chat_id]["channel_link"],
-                posting_interval=posting_interval,
-            )
+            with span("caption_build", pair=pair, job="periodic"):
+                caption = get_image_caption(
+                    pair,
+                    channel_link=channel_config["channel_link"],
+                    posting_interval=posting_interval,
+                )
 
-            output_path = os.path.join(chart.download_dir, f"heatmap_{pair}.png")
+            output_path = image_paths[pair]
+            if output_path is None:
+                logger.warning(f"Chart for {pair} failed to render, not sending it to {chat_id}")
+                continue
 
-            await send_image_with_caption(output_path, context, chat_id, caption)
+            images.append((pair, output_path, caption))
 
-    elif config[chat_id]["mode"] == "sequential":
-        # The pair is passed from the job queue through the context.job.data property as a dict.
-        pair = (
-            context.job.data["pair"]
-            .replace("USDT", "")
-            .replace("USD", "")
-            .replace(" ", "")
-        )
+        # Albums send up to 10 charts per call, a single chart is sent on its own. The send_wait spans take in the time the sends spend queued,
+        # paced and retried in the outbound dispatcher, the dispatcher times the Bot API calls themselves as telegram_upload.
+        if channel_config.get("album", False) and len(images) > 1:
+            with span("send_wait", job="periodic"):
+                await send_images_as_album([(output_path, caption) for _, output_path, caption in images], context, chat_id)
+
+        else:
+            for pair, output_path, caption in images:
+                with span("send_wait", pair=pair, job="periodic"):
+                    await send_image_with_caption(output_path, context, chat_id, caption)
+
+    elif channel_config["mode"] == "sequential":
+        # The pair is passed from the chart scheduler through the entry's data as a dict.
+        pair = normalize_pair(data["pair"])
 
         # Skip placeholder pairs
         if len(pair) == 0 or pair == "":
             return
 
-        # Initialize the Chart class and download the chart
-        chart = Chart(headless_mode=True)
-        chart.download_chart(pair)
+        # Render the chart along with the other channels posting in this tick, without blocking the event loop
+        with span("render_wait", pair=pair, job="periodic"):
+            image_paths = await batch_planner.render(chat_id, [pair])
 
-        caption = get_image_caption(
-            pair,
-            channel_link=config[chat_id]["channel_link"],
-            posting_interval=posting_interval,
-        )
+        with span("caption_build", pair=pair, job="periodic"):
+            caption = get_image_caption(
+                pair,
+                channel_link=channel_config["channel_link"],
+                posting_interval=posting_interval,
+            )
 
-        output_path = os.path.join(chart.download_dir, f"heatmap_{pair}.png")
+        output_path = image_paths[pair]
+        if output_path is None:
+            logger.warning(f"Chart for {pair} failed to render, not sending it to {chat_id}")
+            return
 
-        await send_image_with_caption(output_path, context, chat_id, caption)
+        with span("send_wait", pair=pair, job="periodic"):
+            await send_image_with_caption(output_path, context, chat_id, caption)
 
 
 async def handle_current_chart(
@@ -392,22 +508,32 @@ async def handle_current_chart(
 
     pairs = parts[1:]
 
-    # Initialize the Chart class and download the chart
-    pairs = [
-        pair.replace("USDT", "").replace("USD", "").replace(" ", "") for pair in pairs
-    ]
+    # Normalize the pairs to the coin names the chart website uses
+    pairs = [normalize_pair(pair) for pair in pairs]
 
-    await context.bot.send_message(
+    # The caption needs the channel's link, so the channel has to be set up first.
+    channel_config = get_channel_config(chat_id)
+    if channel_config is None:
+        logger.info(f"No config for {chat_id}, not generating the {pairs} chart")
+        await send_message(context, chat_id=chat_id, text="❌ No data yet.")
+        return
+
+    await send_message(
+        context,
         chat_id=chat_id, text=f"⏳ Generating {pairs} chart, please wait..."
     )
 
-    chart = Chart(headless_mode=True)
-    chart.download_chart(pairs)
+    with span("render_wait", job="on_demand"):
+        image_paths = await render_charts(pairs)
 
-    config = load_config()
     for pair in pairs:
-        caption = get_image_caption(pair, channel_link=config[chat_id]["channel_link"])
+        with span("caption_build", pair=pair, job="on_demand"):
+            caption = get_image_caption(pair, channel_link=channel_config["channel_link"])
 
-        output_path = os.path.join(chart.download_dir, f"heatmap_{pair}.png")
+        output_path = image_paths[pair]
+        if output_path is None:
+            await send_message(context, chat_id=chat_id, text=f"❌ Couldn't generate the {pair} chart.")
+            continue
 
-        await send_image_with_caption(output_path, context, chat_id, caption)
+        with span("send_wait", pair=pair, job="on_demand"):
+            await send_image_with_caption(output_path, context, chat_id, caption, ON_DEMAND_PRIORITY)
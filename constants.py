@@ -27,3 +27,67 @@ CHART_X_OFFSET = int(params["CHART_X_MARGIN"])
 CHART_Y_OFFSET = int(params["CHART_Y_MARGIN"])
 
 CHART_DELAY_SECONDS = int(params["CHART_DELAY_SECONDS"])
+
+DRIVER_POOL_SIZE = int(params["DRIVER_POOL_SIZE"])
+DRIVER_MAX_RENDERS = int(params["DRIVER_MAX_RENDERS"])
+DRIVER_MAX_RSS_MB = int(params["DRIVER_MAX_RSS_MB"])
+
+RENDER_EXECUTOR = params["RENDER_EXECUTOR"]
+RENDER_WORKERS = int(params["RENDER_WORKERS"])
+
+RENDER_CACHE_TTL_SECONDS = int(params["RENDER_CACHE_TTL_SECONDS"])
+RENDER_CACHE_MAX_ENTRIES = int(params["RENDER_CACHE_MAX_ENTRIES"])
+
+IMAGE_STORE_RETENTION_SECONDS = int(params["IMAGE_STORE_RETENTION_SECONDS"])
+IMAGE_STORE_GC_INTERVAL_SECONDS = int(params["IMAGE_STORE_GC_INTERVAL_SECONDS"])
+
+RENDER_MAX_TABS = int(params["RENDER_MAX_TABS"])
+
+HEATMAP_DATA_URL_PATTERN = params["HEATMAP_DATA_URL_PATTERN"]
+
+CHART_MODE = params["CHART_MODE"]
+LOCAL_RENDER_WIDTH = int(params["LOCAL_RENDER_WIDTH"])
+LOCAL_RENDER_HEIGHT = int(params["LOCAL_RENDER_HEIGHT"])
+LOCAL_RENDER_WORKERS = int(params["LOCAL_RENDER_WORKERS"])
+
+BINANCE_API_URL = params["BINANCE_API_URL"]
+KLINE_MAX_CONNECTIONS = int(params["KLINE_MAX_CONNECTIONS"])
+KLINE_TIMEOUT_SECONDS = float(params["KLINE_TIMEOUT_SECONDS"])
+KLINE_CACHE_SIZE = int(params["KLINE_CACHE_SIZE"])
+
+CONFIG_BACKEND = params["CONFIG_BACKEND"]
+CONFIG_DB_FILE = params["CONFIG_DB_FILE"]
+
+BATCH_PLANNER_WINDOW_SECONDS = float(params["BATCH_PLANNER_WINDOW_SECONDS"])
+
+DISPATCH_GLOBAL_RATE = float(params["DISPATCH_GLOBAL_RATE"])
+DISPATCH_CHAT_RATE_PER_MINUTE = float(params["DISPATCH_CHAT_RATE_PER_MINUTE"])
+DISPATCH_CHAT_BURST = float(params["DISPATCH_CHAT_BURST"])
+DISPATCH_WORKERS = int(params["DISPATCH_WORKERS"])
+DISPATCH_MAX_RETRIES = int(params["DISPATCH_MAX_RETRIES"])
+DISPATCH_STATS_INTERVAL_SECONDS = int(params["DISPATCH_STATS_INTERVAL_SECONDS"])
+
+POSTPROCESS_FORMAT = params["POSTPROCESS_FORMAT"]
+POSTPROCESS_MAX_WIDTH = int(params["POSTPROCESS_MAX_WIDTH"])
+POSTPROCESS_MAX_HEIGHT = int(params["POSTPROCESS_MAX_HEIGHT"])
+POSTPROCESS_QUALITY = int(params["POSTPROCESS_QUALITY"])
+POSTPROCESS_WORKERS = int(params["POSTPROCESS_WORKERS"])
+
+REQUEST_BLOCKING = params["REQUEST_BLOCKING"] == "on"
+BLOCKED_URL_PATTERNS = params["BLOCKED_URL_PATTERNS"]
+BLOCKED_RESOURCE_TYPES = params["BLOCKED_RESOURCE_TYPES"]
+
+SESSION_COOKIE_NAMES = params["SESSION_COOKIE_NAMES"]
+SESSION_REFRESH_MARGIN_SECONDS = int(params["SESSION_REFRESH_MARGIN_SECONDS"])
+SESSION_CHECK_INTERVAL_SECONDS = int(params["SESSION_CHECK_INTERVAL_SECONDS"])
+
+PAGE_LOAD_TIMEOUT_SECONDS = float(params["PAGE_LOAD_TIMEOUT_SECONDS"])
+CHART_READY_TIMEOUT_SECONDS = float(params["CHART_READY_TIMEOUT_SECONDS"])
+CHART_DOWNLOAD_TIMEOUT_SECONDS = float(params["CHART_DOWNLOAD_TIMEOUT_SECONDS"])
+
+CHROME_PROFILE_CLONES = params["CHROME_PROFILE_CLONES"] == "on"
+CHROME_PROFILE_CLONE_DIR = params["CHROME_PROFILE_CLONE_DIR"]
+
+METRICS_HOST = params["METRICS_HOST"]
+METRICS_PORT = int(params["METRICS_PORT"])
+METRICS_DUMP_FILE = params["METRICS_DUMP_FILE"]
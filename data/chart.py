@@ -1,6 +1,12 @@
+import base64
+import json
+import re
 import shutil
 import time
 import os
+from collections import deque
+
+import psutil
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -8,25 +14,126 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.remote.webelement import WebElement
 
 import constants
+from data.heatmap_data import HeatmapData
+from data.image_store import image_store
+from data.profile_manager import profile_manager
+from data.session_store import session_store, to_cookie_param
 from utils.logger import logger
+from utils.metrics import span, observe_stage
+
+
+# CDP can only block requests by URL, so the blockable resource types are matched by their file extensions. The trailing wildcard covers the
+# query strings.
+RESOURCE_TYPE_PATTERNS = {
+    "Font": ["*.woff*", "*.ttf*", "*.otf*"],
+    "Media": ["*.mp4*", "*.webm*", "*.mp3*", "*.ogg*"],
+    "Image": ["*.png*", "*.jpg*", "*.jpeg*", "*.gif*", "*.webp*", "*.svg*", "*.ico*"],
+}
+
+# Returns the resource count and the transferred bytes of the current page, from the browser's Performance API.
+PAGE_WEIGHT_SCRIPT = """
+    var resources = performance.getEntriesByType('resource');
+    var navigation = performance.getEntriesByType('navigation')[0];
+    var transferred = resources.reduce(function (total, entry) { return total + (entry.transferSize || 0); }, 0);
+    return [resources.length, transferred + (navigation ? navigation.transferSize : 0)];
+"""
+
+
+# Resolves once the download button is enabled and the chart element is in the page with a sized canvas, then waits two animation frames so
+# the canvas has painted. A MutationObserver re-checks on every DOM change, so it resolves at the exact moment instead of at the next poll.
+# Resolves to false if the timeout passes first.
+CHART_READY_SCRIPT = """
+    var buttonSelector = arguments[0], chartSelector = arguments[1], timeoutMs = arguments[2];
+    var done = arguments[arguments.length - 1];
+    var finished = false, observer = null, timer = null;
+
+    function isReady() {
+        var button = document.querySelector(buttonSelector);
+        var chart = document.querySelector(chartSelector);
+        if (!button || button.classList.contains('Mui-disabled') || !chart) {
+            return false;
+        }
+        // The chart element may be the canvas itself.
+        var canvas = chart.tagName === 'CANVAS' ? chart : chart.querySelector('canvas');
+        return Boolean(canvas && canvas.width > 0 && canvas.height > 0);
+    }
+
+    function finish(isLoaded) {
+        if (finished) {
+            return;
+        }
+        finished = true;
+        if (observer) {
+            observer.disconnect();
+        }
+        clearTimeout(timer);
+
+        if (!isLoaded) {
+            done(false);
+            return;
+        }
+        requestAnimationFrame(function () { requestAnimationFrame(function () { done(true); }); });
+    }
+
+    if (isReady()) {
+        finish(true);
+        return;
+    }
+
+    observer = new MutationObserver(function () {
+        if (isReady()) {
+            finish(true);
+        }
+    });
+    observer.observe(document.documentElement, {childList: true, subtree: true, attributes: true, attributeFilter: ['class', 'width', 'height']});
+    timer = setTimeout(function () { finish(false); }, timeoutMs);
+"""
+
+
+def get_blocked_url_patterns() -> list[str]:
+    # The URL patterns from BLOCKED_URL_PATTERNS, plus the patterns of the resource types in BLOCKED_RESOURCE_TYPES.
+    patterns = [pattern.strip() for pattern in constants.BLOCKED_URL_PATTERNS.split(",") if pattern.strip()]
+
+    for resource_type in constants.BLOCKED_RESOURCE_TYPES.split(","):
+        resource_type = resource_type.strip()
+        if not resource_type:
+            continue
+
+        if resource_type not in RESOURCE_TYPE_PATTERNS:
+            raise ValueError(f"Invalid resource type {resource_type} in BLOCKED_RESOURCE_TYPES, must be one of {list(RESOURCE_TYPE_PATTERNS)}")
+
+        patterns += RESOURCE_TYPE_PATTERNS[resource_type]
+
+    return patterns
 
 
 class Chart:
-    def __init__(self, headless_mode: bool = False):
+    def __init__(self, headless_mode: bool = False, capture_data: bool = False, clone_profile: bool = None):
+        """
+        Args:
+            headless_mode (bool): Run the browser without a window.
+            capture_data (bool): Record the browser's network traffic, which capture_chart_data needs to pull the heatmap's data out of it.
+            clone_profile (bool): Run on a clone of the chrome profile instead of the profile itself, so several browsers can run at the same
+                time. Defaults to CHROME_PROFILE_CLONES.
+        """
         options = webdriver.ChromeOptions()
 
         if headless_mode:
             options.add_argument("--headless")  # Run in headless mode
 
-        # Set the download directory.
-        download_dir = os.path.abspath("output_images")
-        if not os.path.exists(download_dir):
-            os.makedirs(download_dir)
+        # Keep the background tabs rendering at full speed, the batch mode loads several charts in parallel tabs.
+        options.add_argument("--disable-background-timer-throttling")
+        options.add_argument("--disable-backgrounding-occluded-windows")
+        options.add_argument("--disable-renderer-backgrounding")
+
+        # Set the default download directory. Every render points the downloads at its own work directory, this is just the fallback.
+        download_dir = image_store.work_root
 
-        # Set the chrome profile directory.
-        profile_dir = os.path.abspath("chrome_profile")
-        if not os.path.exists(profile_dir):
-            os.makedirs(profile_dir)
+        # Set the chrome profile directory. Chrome locks the profile it runs on, a clone lets the browser run next to the others.
+        if clone_profile is None:
+            clone_profile = constants.CHROME_PROFILE_CLONES
+
+        profile_dir = profile_manager.create_clone() if clone_profile else profile_manager.template_dir
 
         options.add_argument(f"user-data-dir={profile_dir}")
 
@@ -40,16 +147,158 @@ class Chart:
         options.page_load_strategy = "eager"
         options.add_experimental_option("excludeSwitches", ["enable-logging"])
 
+        if capture_data:
+            # The performance log carries the CDP Network events, which is how the data responses are found.
+            options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+
         # Initiate the driver.
-        driver = webdriver.Chrome(options=options)
+        startup_start = time.perf_counter()
+        try:
+            driver = webdriver.Chrome(options=options)
+        except Exception:
+            if clone_profile:
+                profile_manager.remove_clone(profile_dir)
+            raise
+
+        self.startup_seconds = time.perf_counter() - startup_start
+        observe_stage("driver_launch", self.startup_seconds)
+        logger.info(f"Started Chrome in {self.startup_seconds:.2f}s on {'a clone of ' if clone_profile else ''}the chrome profile")
 
         # Set the window size to a large value, in a square aspect ratio
         driver.set_window_size(constants.WEBPAGE_WIDTH, constants.WEBPAGE_WIDTH)
 
+        # The navigation stage's share of a render's timeout budget.
+        driver.set_page_load_timeout(constants.PAGE_LOAD_TIMEOUT_SECONDS)
+
         self.download_dir = download_dir
+        self.profile_dir = profile_dir
+        self.clone_profile = clone_profile
         self.driver = driver
+        self.capture_data = capture_data
 
-        self.download_dir = download_dir
+        # The requests the pages shouldn't make, the ads, analytics, fonts and the consent manager aren't needed for the heatmap.
+        self.blocked_url_patterns = get_blocked_url_patterns() if constants.REQUEST_BLOCKING else []
+        self.enable_request_blocking()
+
+        # Until when the login check can be skipped, as a unix timestamp. Set by every check that finds the session logged in.
+        self.session_valid_until = 0
+        self.inject_session()
+
+        # The latest page load timings, to compare the loads with and without request blocking.
+        self.load_timings = deque(maxlen=100)
+
+        # The number of download_chart calls this driver has served, used by the driver pool to recycle old browsers.
+        self.render_count = 0
+
+    def enable_request_blocking(self):
+        # Blocks the requests matching blocked_url_patterns. CDP settings apply to a single tab, so every new tab needs this too.
+        if not self.blocked_url_patterns:
+            return
+
+        self.driver.execute_cdp_cmd("Network.enable", {})
+        self.driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": self.blocked_url_patterns})
+
+    def record_load_timing(self, pair: str, started_at: float):
+        """
+        Logs how long the pair's chart took to load in the current tab, along with the number of requests and the bytes the page transferred.
+
+        Args:
+            pair (str): The pair whose chart is loaded.
+            started_at (float): The time.monotonic() the page load started at.
+        """
+        load_seconds = time.monotonic() - started_at
+
+        try:
+            n_requests, transferred_bytes = self.driver.execute_script(PAGE_WEIGHT_SCRIPT)
+        except Exception:
+            n_requests, transferred_bytes = None, None
+
+        self.load_timings.append({
+            "pair": pair,
+            "load_seconds": load_seconds,
+            "requests": n_requests,
+            "transferred_bytes": transferred_bytes,
+            "request_blocking": bool(self.blocked_url_patterns),
+        })
+
+        logger.info(
+            f"Loaded the {pair} chart in {load_seconds:.2f}s, {n_requests} requests, "
+            f"{(transferred_bytes or 0) / 1024:.0f} KB transferred (request blocking {'on' if self.blocked_url_patterns else 'off'})"
+        )
+
+    def inject_session(self) -> bool:
+        """
+        Sets the saved session's cookies in the browser, before its first navigation, so it starts out logged in.
+
+        Returns:
+            bool: Whether there was a saved session to inject.
+        """
+        cookies = session_store.load()
+        if not cookies:
+            return False
+
+        self.driver.execute_cdp_cmd("Network.setCookies", {"cookies": [to_cookie_param(cookie) for cookie in cookies]})
+        logger.info(f"Injected {len(cookies)} saved session cookies")
+
+        return True
+
+    def export_session(self):
+        # Saves the browser's cookies of every domain for the next browsers, driver.get_cookies() only returns the current domain's.
+        session_store.save(self.driver.execute_cdp_cmd("Network.getAllCookies", {})["cookies"])
+
+    def __get_session_valid_until(self) -> float:
+        # The login is checked again after SESSION_CHECK_INTERVAL_SECONDS, or earlier if the session is about to expire. If the refresh already
+        # failed, it's retried at the next interval instead of on every render.
+        now = time.time()
+        valid_until = now + constants.SESSION_CHECK_INTERVAL_SECONDS
+
+        expiry = session_store.get_session_expiry()
+        if expiry is not None:
+            refresh_at = expiry - constants.SESSION_REFRESH_MARGIN_SECONDS
+            valid_until = min(valid_until, refresh_at if refresh_at > now else expiry)
+
+        return valid_until
+
+    def warm_up(self):
+        """Loads the chart page once and makes sure the session is logged in, so the first real render doesn't pay for it."""
+        self.driver.get(constants.CHART_URL)
+        self.ensure_logged_in(constants.CHART_URL)
+
+    def is_healthy(self) -> bool:
+        """Check if the browser is still responsive by running a trivial script in it."""
+        try:
+            return self.driver.execute_script("return 1;") == 1
+        except:
+            return False
+
+    def get_memory_usage(self) -> int:
+        """
+        Returns the resident memory of the whole browser, which is the chromedriver process and every Chrome process spawned by it, in bytes.
+        """
+        try:
+            driver_process = psutil.Process(self.driver.service.process.pid)
+            processes = [driver_process] + driver_process.children(recursive=True)
+        except (psutil.Error, AttributeError):
+            return 0
+
+        rss = 0
+        for process in processes:
+            try:
+                rss += process.memory_info().rss
+            except psutil.Error:
+                pass
+
+        return rss
+
+    def quit(self):
+        try:
+            self.driver.quit()
+        except Exception as e:
+            logger.error(f"Error quitting the driver: {e}")
+
+        # Chrome has written its session files out by now, the template gets the session the browser ended with.
+        if self.clone_profile:
+            profile_manager.release_clone(self.profile_dir)
 
     def is_logged_in(self) -> bool:
         """Check if logged in by checking absence of logged-out indicator."""
@@ -104,14 +353,34 @@ class Chart:
         logger.info("Login successful")
 
     def ensure_logged_in(self, referral_link: str):
-        """Ensures the user is logged in, then navigates back to the page that referred to the login."""
+        """
+        Ensures the user is logged in, then navigates back to the page that referred to the login. While the last check is recent and the
+        session isn't about to expire, the check is skipped entirely.
+        """
+        if time.time() < self.session_valid_until:
+            return
+
         if not self.is_logged_in():
             logger.warning("Not logged in, trying login again.")
             self.login()
             self.driver.get(referral_link)
 
         else:
-            print("Already logged in.")
+            logger.info("Already logged in.")
+
+        self.export_session()
+
+        # Log in again before the session expires, rather than finding it expired in the middle of a render.
+        if session_store.needs_refresh():
+            logger.info("The session expires soon, logging in again to refresh it")
+            try:
+                self.login()
+                self.driver.get(referral_link)
+                self.export_session()
+            except Exception as e:
+                logger.warning(f"Error refreshing the session: {e}")
+
+        self.session_valid_until = self.__get_session_valid_until()
 
     def click_element(self, css_selector):
         # Simply click on an element given its CSS selector. Replace : and - characters with \: and \-
@@ -165,24 +434,25 @@ class Chart:
         self.driver.execute_script(script1)
         self.driver.execute_script(script2)
 
-    def chart_has_finished_loading(self):
+    def wait_for_chart_ready(self, timeout: float = None):
         """
-        Finds the download button element, and checks if it's disabled. If the button element is not
-        found or is disabled, returns False.
+        Waits for the chart to finish loading, in a single round trip: the wait runs inside the page and returns as soon as the chart is ready
+        and painted.
+
+        Args:
+            timeout (float): The number of seconds to wait before raising a TimeoutError. Defaults to CHART_READY_TIMEOUT_SECONDS.
         """
-        try:
-            # JavaScript function to check if the chart has loaded
-            js_script = f"""
-                        var button = document.querySelector('{constants.DOWNLOAD_CHART_BUTTON_SELECTOR}');
-                        return (button && !button.classList.contains('Mui-disabled'))
-                    """
+        if timeout is None:
+            timeout = constants.CHART_READY_TIMEOUT_SECONDS
 
-            # Execute the JavaScript and return the result
-            is_loaded = self.driver.execute_script(js_script)
-            return is_loaded
+        # The script times itself out, the driver's script timeout is only a backstop for a page that hangs.
+        self.driver.set_script_timeout(timeout + 5)
 
-        except:
-            return False
+        is_loaded = self.driver.execute_async_script(
+            CHART_READY_SCRIPT, constants.DOWNLOAD_CHART_BUTTON_SELECTOR, constants.CHART_ELEMENT_SELECTOR, int(timeout * 1000)
+        )
+        if not is_loaded:
+            raise TimeoutError(f"The chart didn't finish loading in {timeout} seconds")
 
     def download_chart_with_button(self):
         # This function clicks the download button to download the chart.
@@ -197,100 +467,361 @@ class Chart:
         )
         download_button.click()
 
-    def download_chart(self, pair_list: list[str] | str):
+    def set_download_directory(self, directory: str):
+        # Point the browser's downloads at the given directory. Giving every download its own directory maps each file to its pair exactly.
+        self.driver.execute_cdp_cmd(
+            "Browser.setDownloadBehavior",
+            {"behavior": "allow", "downloadPath": directory},
+        )
+
+    @staticmethod
+    def wait_for_download(directory: str, timeout: float = 30) -> str:
+        """
+        Waits for the download in the given directory to finish, and returns the path to the downloaded file. Chrome writes the download to a
+        .crdownload file and renames it once it's complete, so the download is done as soon as a file without that extension shows up.
+
+        Args:
+            directory (str): The directory the browser was downloading to. It should only contain the one download.
+            timeout (float): The number of seconds to wait before raising a TimeoutError.
+        """
+        deadline = time.monotonic() + timeout
+
+        while time.monotonic() < deadline:
+            with os.scandir(directory) as entries:
+                filenames = [entry.name for entry in entries if entry.is_file()]
+
+            finished_filenames = [filename for filename in filenames if not filename.endswith((".crdownload", ".tmp"))]
+            if finished_filenames and len(finished_filenames) == len(filenames):
+                return os.path.join(directory, finished_filenames[0])
+
+            time.sleep(0.05)
+
+        raise TimeoutError(f"Download in {directory} didn't finish in {timeout} seconds")
+
+    def download_pair_chart(self, pair: str, work_dir: str) -> str:
+        """
+        Clicks the download button of the currently loaded chart and publishes the finished download to the image store, as soon as that
+        particular file is complete.
+
+        Args:
+            pair (str): The pair whose chart is loaded.
+            work_dir (str): The work directory of the current render.
+
+        Returns:
+            str: The path to the chart image in the image store.
+        """
+        pair_download_dir = os.path.join(work_dir, pair)
+        os.makedirs(pair_download_dir)
+
+        with span("download", pair=pair):
+            self.set_download_directory(pair_download_dir)
+            self.download_chart_with_button()
+
+            downloaded_file_path = self.wait_for_download(pair_download_dir, constants.CHART_DOWNLOAD_TIMEOUT_SECONDS)
+
+        with span("file_finalize", pair=pair):
+            output_path = image_store.publish(downloaded_file_path)
+        logger.info(f"Downloaded the {pair} chart to {output_path}")
+
+        return output_path
+
+    def download_chart(self, pair_list: list[str] | str) -> dict[str, str]:
+        """
+        Downloads the charts of the given pairs one by one.
+
+        Returns:
+            dict[str, str]: The path to the image of every pair that was downloaded successfully.
+        """
         # If a single pair is given instead of a list of pairs, convert it to a list to standardize it.
         if isinstance(pair_list, list):
             pair_list = pair_list
         else:
             pair_list = [pair_list]
 
+        image_paths = {}
+
+        # Every render downloads into a work directory of its own, so concurrent renders of the same pair don't clobber each other.
+        work_dir = image_store.create_work_dir()
+
         try:
-            # Loop indefinitely
-            while True:
-                # Find each pair in the pair_list property in the list and save its chart
-                for pair in pair_list:
+            # Find each pair in the pair_list property in the list and save its chart
+            if not constants.CHART_ELEMENT_SELECTOR:
+                raise ValueError(
+                    "CHART_ELEMENT_SELECTOR is not set in environment variables"
+                )
+
+            for pair in pair_list:
+                # A pair that fails doesn't take the rest of the list down with it.
+                try:
                     request_url = f"{constants.CHART_URL}?coin={pair}&type=symbol"
-                    self.driver.get(request_url)
-                    self.ensure_logged_in(request_url)
+                    started_at = time.monotonic()
+                    with span("navigation", pair=pair):
+                        self.driver.get(request_url)
+
+                    with span("ensure_logged_in", pair=pair):
+                        self.ensure_logged_in(request_url)
+
                     self.prevent_cookie_window()
                     self.hide_loading_elements()
-                    print("Waiting for the chart to load...")
+                    logger.info(f"Waiting for the {pair} chart to load...")
 
-                    WebDriverWait(self.driver, 30).until(
-                        lambda driver: self.chart_has_finished_loading()
-                    )
-                    time.sleep(1)
+                    # The chart element, the enabled download button and a painted canvas, all in one round trip
+                    with span("chart_ready", pair=pair):
+                        self.wait_for_chart_ready()
+                    self.record_load_timing(pair, started_at)
 
-                    # Find the chart element
-                    chart_selector = constants.CHART_ELEMENT_SELECTOR
+                    image_paths[pair] = self.download_pair_chart(pair, work_dir)
 
-                    WebDriverWait(self.driver, 10).until(
-                        EC.presence_of_element_located(
-                            (By.CSS_SELECTOR, chart_selector)
-                        )
-                    )
+                except Exception as e:
+                    logger.error(f"Error downloading the {pair} chart: {e}")
 
-                    if not chart_selector:
-                        raise ValueError(
-                            "CHART_ELEMENT_SELECTOR is not set in environment variables"
-                        )
+                    # A session that ended early looks like a chart that won't load, check the login again before the next pair.
+                    self.session_valid_until = 0
 
-                    self.download_chart_with_button()
+        except Exception as e:
+            logger.error(f"Error downloading chart: {e}")
 
-                time.sleep(3)
+        finally:
+            image_store.remove_work_dir(work_dir)
+
+            # The driver is kept alive for the next render, it's up to the owner (usually the driver pool) to quit it.
+            self.render_count += 1
+
+        return image_paths
+
+    def __tab_is_ready(self, pair: str) -> bool:
+        # Checks that the current tab has navigated to the pair's chart (and isn't still showing the previous pair) and that the chart has loaded.
+        js_script = """
+            var params = new URLSearchParams(window.location.search);
+            if (params.get('coin') !== arguments[0] || document.readyState === 'loading') {
+                return false;
+            }
+            var button = document.querySelector(arguments[1]);
+            return Boolean(button && !button.classList.contains('Mui-disabled') && document.querySelector(arguments[2]));
+        """
 
-                # Clear the download directory
-                self.clear_download_directory()
+        try:
+            return self.driver.execute_script(
+                js_script, pair, constants.DOWNLOAD_CHART_BUTTON_SELECTOR, constants.CHART_ELEMENT_SELECTOR
+            )
+        except:
+            return False
 
-                break
+    def __tab_has_navigated(self, pair: str) -> bool:
+        try:
+            return self.driver.execute_script(
+                "return new URLSearchParams(window.location.search).get('coin') === arguments[0] && document.readyState !== 'loading';",
+                pair,
+            )
+        except:
+            return False
+
+    def __start_loading(self, pair: str):
+        # Starts the navigation in the current tab without waiting for the page to load, unlike driver.get
+        request_url = f"{constants.CHART_URL}?coin={pair}&type=symbol"
+        self.driver.execute_script("window.location.href = arguments[0];", request_url)
+
+    def download_chart_batch(self, pair_list: list[str], max_tabs: int = None) -> dict[str, str]:
+        """
+        Downloads the charts of the given pairs, loading up to max_tabs of them at the same time in separate tabs of the same browser. Each chart
+        is downloaded as soon as its tab is ready and the tab moves on to the next pending pair, so the batch takes about as long as the slowest
+        pairs instead of the sum of all of them.
+
+        Args:
+            pair_list (list[str]): The pairs to download.
+            max_tabs (int): The maximum number of tabs loading at the same time. Defaults to RENDER_MAX_TABS.
+
+        Returns:
+            dict[str, str]: The path to the image of every pair that was downloaded successfully.
+        """
+        if max_tabs is None:
+            max_tabs = constants.RENDER_MAX_TABS
+
+        image_paths = {}
+        pending_pairs = list(dict.fromkeys(pair_list))
+        work_dir = image_store.create_work_dir()
+        main_tab = self.driver.current_window_handle
+
+        # tab handle -> the state of the pair loading in it
+        tabs = {}
+
+        try:
+            # Load the first pair normally, to make sure the session is logged in before the rest of the tabs start loading.
+            first_pair = pending_pairs.pop(0)
+            request_url = f"{constants.CHART_URL}?coin={first_pair}&type=symbol"
+            first_started_at = time.monotonic()
+            with span("navigation", pair=first_pair):
+                self.driver.get(request_url)
+
+            with span("ensure_logged_in", pair=first_pair):
+                self.ensure_logged_in(request_url)
+
+            tabs[main_tab] = {"pair": first_pair, "started_at": first_started_at, "styled": False, "ready_at": None, "navigation_timed": True}
+
+            while pending_pairs and len(tabs) < max_tabs:
+                self.driver.switch_to.new_window("tab")
+                self.enable_request_blocking()
+                pair = pending_pairs.pop(0)
+                self.__start_loading(pair)
+                tabs[self.driver.current_window_handle] = {"pair": pair, "started_at": time.monotonic(), "styled": False, "ready_at": None}
+
+            while tabs:
+                made_progress = False
+
+                for tab, state in list(tabs.items()):
+                    self.driver.switch_to.window(tab)
+                    pair = state["pair"]
+                    is_done = False
+
+                    try:
+                        if not state["styled"]:
+                            if self.__tab_has_navigated(pair):
+                                self.prevent_cookie_window()
+                                self.hide_loading_elements()
+                                state["styled"] = True
+                                state["navigated_at"] = time.monotonic()
+
+                                # The first pair's navigation was timed around driver.get already.
+                                if not state.get("navigation_timed"):
+                                    observe_stage("navigation", state["navigated_at"] - state["started_at"], pair=pair)
+
+                        elif state["ready_at"] is None:
+                            if self.__tab_is_ready(pair):
+                                state["ready_at"] = time.monotonic()
+                                observe_stage("chart_ready", state["ready_at"] - state["navigated_at"], pair=pair)
+                                self.record_load_timing(pair, state["started_at"])
+
+                        # Give the chart a second to settle after it's ready, without holding up the other tabs. The background tabs get no
+                        # animation frames, so the painted check of wait_for_chart_ready can't be used here.
+                        elif time.monotonic() - state["ready_at"] >= 1:
+                            image_paths[pair] = self.download_pair_chart(pair, work_dir)
+                            is_done = True
+
+                        if not is_done and time.monotonic() - state["started_at"] > constants.CHART_READY_TIMEOUT_SECONDS:
+                            raise TimeoutError("Timed out waiting for the chart to load")
+
+                    except Exception as e:
+                        logger.error(f"Error downloading the {pair} chart: {e}")
+                        is_done = True
+
+                    if not is_done:
+                        continue
+
+                    made_progress = True
+
+                    # Reuse the tab for the next pending pair, or close it if there's none left (the main tab is always kept).
+                    if pending_pairs:
+                        next_pair = pending_pairs.pop(0)
+                        self.__start_loading(next_pair)
+                        tabs[tab] = {"pair": next_pair, "started_at": time.monotonic(), "styled": False, "ready_at": None}
+
+                    else:
+                        del tabs[tab]
+                        if tab != main_tab:
+                            self.driver.close()
+
+                if not made_progress:
+                    time.sleep(0.1)
 
         except Exception as e:
-            logger.error(f"Error downloading chart: {e}")
+            logger.error(f"Error downloading chart batch: {e}")
+            self.session_valid_until = 0
 
         finally:
-            self.driver.quit()
-            pass
+            image_store.remove_work_dir(work_dir)
+
+            # Leave the browser with only the main tab open for the next render.
+            try:
+                for tab in self.driver.window_handles:
+                    if tab != main_tab:
+                        self.driver.switch_to.window(tab)
+                        self.driver.close()
+                self.driver.switch_to.window(main_tab)
+            except Exception as e:
+                logger.error(f"Error closing the batch tabs: {e}")
+
+            self.render_count += 1
 
-    def clear_download_directory(self):
-        """Cleans up the download directory by:
-        1. Removing non-PNG files
-        2. Renaming PNG files to keep only the pair name in the format 'pair.png'
+        return image_paths
+
+    def __find_data_response(self, pair: str, seen_request_ids: dict):
+        """
+        Goes through the network events logged since the last call, and returns the request ID of the pair's heatmap data response once it has
+        finished loading, or None if it hasn't yet.
         """
+        finished_request_ids = set()
+        data_request_ids = []
 
-        for filename in os.listdir(self.download_dir):
-            file_path = os.path.join(self.download_dir, filename)
+        for entry in self.driver.get_log("performance"):
+            message = json.loads(entry["message"])["message"]
 
-            # Skip directories
-            if os.path.isdir(file_path):
-                continue
+            if message["method"] == "Network.responseReceived":
+                response_url = message["params"]["response"]["url"]
+                if re.search(constants.HEATMAP_DATA_URL_PATTERN, response_url) and pair in response_url:
+                    data_request_ids.append(message["params"]["requestId"])
 
-            # Remove non-PNG files
-            if not filename.lower().endswith(".png"):
-                try:
-                    os.unlink(file_path)
-                except Exception as e:
-                    pass
-                continue
+            elif message["method"] == "Network.loadingFinished":
+                finished_request_ids.add(message["params"]["requestId"])
 
-            # Process PNG files - extract the pair name and rename
-            try:
-                # Extract the pair name which is between the first and second underscore
-                if "_" in filename and "heatmap" not in filename:
-                    # Split by underscore and get the second part (index 1)
-                    parts = filename.split("_")
-                    if len(parts) > 1:
-                        # The pair name is in the second part (index 1). When separated again using a space, it's the 0-th element.
-                        pair = parts[1].split(" ")[0]
-                        new_filename = f"heatmap_{pair}.png"
-                        new_filepath = os.path.join(self.download_dir, new_filename)
-
-                        # Remove if a file with the new name already exists
-                        if os.path.exists(new_filepath):
-                            os.unlink(new_filepath)
-
-                        # Rename the file
-                        os.rename(file_path, new_filepath)
-                        logger.info(f"Renamed {filename} to {new_filename}")
+        seen_request_ids["data"].update(data_request_ids)
+        seen_request_ids["finished"].update(finished_request_ids)
 
-            except Exception as e:
-                logger.error(f"Error processing {filename}: {e}")
+        for request_id in seen_request_ids["data"]:
+            if request_id in seen_request_ids["finished"]:
+                return request_id
+
+        return None
+
+    def capture_chart_data(self, pair: str, timeout: float = 30) -> HeatmapData:
+        """
+        Loads the pair's chart page and captures the heatmap's underlying data from the page's network traffic instead of downloading an image of
+        it. The data is saved as compact arrays in the heatmap data directory.
+
+        Args:
+            pair (str): The pair to capture.
+            timeout (float): The number of seconds to wait for the data response.
+
+        Returns:
+            HeatmapData: The captured heatmap.
+        """
+        if not self.capture_data:
+            raise RuntimeError("capture_chart_data needs a Chart created with capture_data=True")
+
+        # Drop the events of the previous pages, so only this page's responses are looked at.
+        self.driver.get_log("performance")
+
+        request_url = f"{constants.CHART_URL}?coin={pair}&type=symbol"
+        started_at = time.monotonic()
+        with span("navigation", pair=pair):
+            self.driver.get(request_url)
+
+        with span("ensure_logged_in", pair=pair):
+            self.ensure_logged_in(request_url)
+
+        seen_request_ids = {"data": set(), "finished": set()}
+        navigated_at = time.monotonic()
+        deadline = navigated_at + timeout
+        while True:
+            request_id = self.__find_data_response(pair, seen_request_ids)
+            if request_id:
+                observe_stage("data_capture", time.monotonic() - navigated_at, pair=pair)
+                self.record_load_timing(pair, started_at)
+                break
+
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Timed out waiting for the {pair} heatmap data response")
+
+            time.sleep(0.1)
+
+        response = self.driver.execute_cdp_cmd("Network.getResponseBody", {"requestId": request_id})
+        response_body = response["body"]
+        if response.get("base64Encoded"):
+            response_body = base64.b64decode(response_body)
+
+        heatmap_data = HeatmapData.from_response(pair, response_body)
+        output_path = heatmap_data.save()
+        logger.info(f"Captured the {pair} heatmap data to {output_path}")
+
+        self.render_count += 1
+
+        return heatmap_data
@@ -0,0 +1,157 @@
+# This module keeps a bounded pool of warm, logged-in Chart instances, so the jobs don't have to launch a whole Chrome process for every render.
+import queue
+import threading
+from contextlib import contextmanager
+
+import constants
+from data.chart import Chart
+from utils.logger import logger
+
+
+class DriverPool:
+    def __init__(self, size: int, max_renders: int, max_rss_mb: int, headless_mode: bool = True, capture_data: bool = False):
+        """
+        Args:
+            size (int): The maximum number of browsers alive at the same time.
+            max_renders (int): The number of download_chart calls after which a browser gets recycled.
+            max_rss_mb (int): The resident memory, in MB, after which a browser gets recycled.
+            headless_mode (bool): Passed to every Chart created by the pool.
+            capture_data (bool): Passed to every Chart created by the pool.
+        """
+        self.size = size
+        self.max_renders = max_renders
+        self.max_rss_bytes = max_rss_mb * 1024 * 1024
+        self.headless_mode = headless_mode
+        self.capture_data = capture_data
+
+        # Idle charts, last in first out so the warmest browser gets reused first.
+        self.idle_charts = queue.LifoQueue()
+
+        # The number of charts currently alive, idle or checked out.
+        self.n_alive = 0
+        self.is_closed = False
+        self.lock = threading.Condition()
+
+    def __create_chart(self) -> Chart:
+        chart = Chart(headless_mode=self.headless_mode, capture_data=self.capture_data)
+
+        try:
+            chart.warm_up()
+        except Exception as e:
+            # A failed warm-up isn't fatal, download_chart checks the login again anyway.
+            logger.warning(f"Error warming up a new driver: {e}")
+
+        logger.info(f"Started a new pooled driver, {self.n_alive}/{self.size} alive")
+        return chart
+
+    def __discard_chart(self, chart: Chart, reason: str):
+        logger.info(f"Recycling a pooled driver after {chart.render_count} renders: {reason}")
+        chart.quit()
+
+        with self.lock:
+            self.n_alive -= 1
+            self.lock.notify()
+
+    def __should_recycle(self, chart: Chart):
+        # Returns the reason the chart should be recycled, or None if it's fine to keep using it.
+        if chart.render_count >= self.max_renders:
+            return "render limit reached"
+
+        rss = chart.get_memory_usage()
+        if rss > self.max_rss_bytes:
+            return f"memory limit reached ({rss // (1024 * 1024)} MB)"
+
+        if not chart.is_healthy():
+            return "driver is unresponsive"
+
+        return None
+
+    def __acquire(self, timeout: float = None) -> Chart:
+        while True:
+            with self.lock:
+                if self.is_closed:
+                    raise RuntimeError("The driver pool has been shut down")
+
+                try:
+                    chart = self.idle_charts.get_nowait()
+
+                except queue.Empty:
+                    if self.n_alive < self.size:
+                        # Reserve a slot, the chart itself is created outside the lock since launching Chrome takes a while.
+                        self.n_alive += 1
+                        chart = None
+
+                    else:
+                        if not self.lock.wait(timeout):
+                            raise TimeoutError("Timed out waiting for a free driver")
+                        continue
+
+            if chart is None:
+                try:
+                    return self.__create_chart()
+                except Exception:
+                    with self.lock:
+                        self.n_alive -= 1
+                        self.lock.notify()
+                    raise
+
+            # Health check idle charts before handing them out, the browser may have crashed while it was sitting in the pool.
+            if chart.is_healthy():
+                return chart
+
+            self.__discard_chart(chart, "driver is unresponsive")
+
+    def __release(self, chart: Chart):
+        if self.is_closed:
+            self.__discard_chart(chart, "pool is shutting down")
+            return
+
+        recycle_reason = self.__should_recycle(chart)
+        if recycle_reason:
+            self.__discard_chart(chart, recycle_reason)
+            return
+
+        with self.lock:
+            self.idle_charts.put(chart)
+            self.lock.notify()
+
+    @contextmanager
+    def checkout(self, timeout: float = None):
+        """
+        Checks out a warm chart from the pool, blocking until one is free. The chart is returned to the pool when the block exits.
+
+        Usage:
+            with chart_pool.checkout() as chart:
+                chart.download_chart(pair_list)
+        """
+        chart = self.__acquire(timeout)
+        try:
+            yield chart
+        finally:
+            self.__release(chart)
+
+    def shutdown(self):
+        """Quits every idle browser. Browsers that are checked out are quit as soon as they're returned."""
+        with self.lock:
+            self.is_closed = True
+            self.lock.notify_all()
+
+        while True:
+            try:
+                chart = self.idle_charts.get_nowait()
+            except queue.Empty:
+                break
+
+            self.__discard_chart(chart, "pool is shutting down")
+
+        logger.info("Driver pool shut down")
+
+
+chart_pool = DriverPool(
+    # Only one Chrome at a time can run on the shared chrome_profile, several browsers need a clone each.
+    size=constants.DRIVER_POOL_SIZE if constants.CHROME_PROFILE_CLONES else 1,
+    max_renders=constants.DRIVER_MAX_RENDERS,
+    max_rss_mb=constants.DRIVER_MAX_RSS_MB,
+    # The local chart mode pulls the heatmap data out of the network traffic instead of downloading the image.
+    capture_data=constants.CHART_MODE == "local",
+)
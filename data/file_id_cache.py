@@ -0,0 +1,60 @@
+# This module remembers the file_id Telegram returns for every uploaded image, keyed by the image's content hash. The same chart usually goes
+# to many channels, and after the first upload the others only need to send the file_id instead of the image bytes.
+import asyncio
+import time
+
+
+class FileIdCache:
+    def __init__(self):
+        # image hash -> (file_id, expiry as a unix timestamp)
+        self.entries = {}
+
+        # image hash -> lock held while the image is being uploaded, so concurrent sends of a new image upload it once.
+        self.upload_locks = {}
+
+        self.hits = 0
+        self.uploads = 0
+
+    def get(self, image_hash: str) -> str | None:
+        entry = self.entries.get(image_hash)
+        if entry is None:
+            return None
+
+        if entry[1] <= time.time():
+            del self.entries[image_hash]
+            return None
+
+        self.hits += 1
+        return entry[0]
+
+    def put(self, image_hash: str, file_id: str):
+        """
+        Stores the file_id of an uploaded image until the end of the current render slot. An image is only sent again within its own slot,
+        the next slot renders a new one.
+        """
+        # Imported here, render_cache imports data.utils, which imports this module.
+        from data.render_cache import render_cache
+
+        self.uploads += 1
+        self.__evict_expired()
+
+        self.entries[image_hash] = (file_id, render_cache.get_slot_start() + render_cache.ttl_seconds)
+
+    def discard(self, image_hash: str):
+        # For file_ids Telegram refuses, the image is uploaded again on the next send.
+        self.entries.pop(image_hash, None)
+
+    def get_upload_lock(self, image_hash: str) -> asyncio.Lock:
+        return self.upload_locks.setdefault(image_hash, asyncio.Lock())
+
+    def __evict_expired(self):
+        now = time.time()
+        for image_hash in [image_hash for image_hash, entry in self.entries.items() if entry[1] <= now]:
+            del self.entries[image_hash]
+
+        # The locks of images that aren't being uploaded and have no file_id are left over from finished or failed uploads.
+        for image_hash in [image_hash for image_hash, lock in self.upload_locks.items() if not lock.locked() and image_hash not in self.entries]:
+            del self.upload_locks[image_hash]
+
+
+file_id_cache = FileIdCache()
@@ -0,0 +1,95 @@
+# This module contains the compact, array-based form of a liquidation heatmap, as captured from the chart website's network traffic.
+import json
+import os
+import threading
+
+import numpy as np
+
+# The directory the captured heatmaps are saved to, one file per pair.
+HEATMAP_DATA_DIR = os.path.abspath("heatmap_data")
+
+
+class HeatmapData:
+    def __init__(self, pair: str, price_levels: np.ndarray, times: np.ndarray, intensity: np.ndarray, klines: np.ndarray):
+        """
+        Args:
+            pair (str): The pair the heatmap belongs to.
+            price_levels (np.ndarray): The price of every row of the grid, ascending, shape (n_prices,).
+            times (np.ndarray): The open time of every column of the grid in milliseconds, shape (n_times,).
+            intensity (np.ndarray): The liquidation intensity grid, shape (n_prices, n_times).
+            klines (np.ndarray): The open, high, low and close price of every column, shape (n_times, 4).
+        """
+        self.pair = pair
+        self.price_levels = price_levels
+        self.times = times
+        self.intensity = intensity
+        self.klines = klines
+
+    @classmethod
+    def from_response(cls, pair: str, response_body: str | bytes) -> "HeatmapData":
+        """
+        Parses the body of the chart website's heatmap data response. The response holds the price levels in "y", the liquidations as sparse
+        [time index, price index, intensity] triplets in "liq", and the candles as [time, open, high, low, close] rows in "prices".
+        """
+        payload = json.loads(response_body)
+        data = payload.get("data", payload)
+
+        price_levels = np.asarray(data["y"], dtype=np.float64)
+        candles = np.asarray(data["prices"], dtype=np.float64).reshape(-1, 5)
+        liquidations = np.asarray(data["liq"], dtype=np.float64).reshape(-1, 3)
+
+        times = candles[:, 0].astype(np.int64)
+        klines = candles[:, 1:5]
+
+        # Scatter the sparse triplets into the dense grid in one go.
+        intensity = np.zeros((len(price_levels), len(times)), dtype=np.float32)
+        time_indices = liquidations[:, 0].astype(np.intp)
+        price_indices = liquidations[:, 1].astype(np.intp)
+        np.add.at(intensity, (price_indices, time_indices), liquidations[:, 2].astype(np.float32))
+
+        return cls(pair, price_levels, times, intensity, klines)
+
+    def save(self, path: str = None) -> str:
+        """
+        Saves the heatmap as a compressed .npz file, atomically, so readers never load a partially written file.
+
+        Returns:
+            str: The path the heatmap was saved to.
+        """
+        if path is None:
+            path = os.path.join(HEATMAP_DATA_DIR, f"{self.pair}.npz")
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as file:
+            np.savez_compressed(
+                file,
+                price_levels=self.price_levels,
+                times=self.times,
+                intensity=self.intensity,
+                klines=self.klines,
+            )
+        os.replace(temp_path, path)
+
+        return path
+
+    @classmethod
+    def load(cls, pair: str, path: str = None) -> "HeatmapData":
+        if path is None:
+            path = os.path.join(HEATMAP_DATA_DIR, f"{pair}.npz")
+
+        with np.load(path) as arrays:
+            return cls(pair, arrays["price_levels"], arrays["times"], arrays["intensity"], arrays["klines"])
+
+    def diff(self, other: "HeatmapData") -> np.ndarray:
+        """
+        Returns the change in intensity from another capture of the same pair, over the columns both captures share. Comparing two captures is
+        just an array subtraction, no re-rendering needed.
+        """
+        if not np.array_equal(self.price_levels, other.price_levels):
+            raise ValueError("Can't diff heatmaps with different price levels")
+
+        _, own_columns, other_columns = np.intersect1d(self.times, other.times, return_indices=True)
+
+        return self.intensity[:, own_columns] - other.intensity[:, other_columns]
@@ -0,0 +1,248 @@
+# This module renders the channel image locally from a captured heatmap and the pair's candles, without any browser involved. Every step, the
+# binning, the colormapping and the candle drawing, works on whole NumPy arrays at once.
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from PIL import Image, ImageDraw
+
+import constants
+from data.heatmap_data import HeatmapData
+from data.kline_fetcher import BINANCE_INTERVALS
+from utils.logger import logger
+
+# The colormap anchors, from purple (no liquidations) to yellow (the most liquidations), like the captions describe.
+COLORMAP_ANCHORS = np.array(
+    [
+        [68, 1, 84],
+        [72, 40, 120],
+        [62, 74, 137],
+        [49, 104, 142],
+        [38, 130, 142],
+        [31, 158, 137],
+        [53, 183, 121],
+        [109, 205, 89],
+        [180, 222, 44],
+        [253, 231, 37],
+    ],
+    dtype=np.float64,
+)
+
+BULLISH_COLOR = np.array([14, 203, 129], dtype=np.uint8)
+BEARISH_COLOR = np.array([246, 70, 93], dtype=np.uint8)
+TEXT_COLOR = (255, 255, 255)
+
+# The width of the price axis on the right side of the image, in pixels.
+AXIS_WIDTH = 110
+
+
+def build_colormap(n_colors: int = 256) -> np.ndarray:
+    # Interpolates the anchors into a lookup table of n_colors RGB colors.
+    anchor_positions = np.linspace(0, 1, len(COLORMAP_ANCHORS))
+    color_positions = np.linspace(0, 1, n_colors)
+
+    colormap = np.stack(
+        [np.interp(color_positions, anchor_positions, COLORMAP_ANCHORS[:, channel]) for channel in range(3)],
+        axis=1,
+    )
+
+    return colormap.round().astype(np.uint8)
+
+
+COLORMAP = build_colormap()
+
+
+def get_binance_interval(heatmap: HeatmapData) -> str:
+    # The Binance interval closest to the spacing of the heatmap's columns.
+    column_ms = int(np.median(np.diff(heatmap.times))) if len(heatmap.times) > 1 else BINANCE_INTERVALS["5m"]
+
+    return min(BINANCE_INTERVALS, key=lambda interval: abs(BINANCE_INTERVALS[interval] - column_ms))
+
+
+def klines_to_array(klines: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+    # Converts a get_pair_data DataFrame to an array of open times in milliseconds and an (n, 4) array of open, high, low and close prices.
+    times = klines.index.values.astype("datetime64[ms]").astype(np.int64)
+    ohlc = klines[["open", "high", "low", "close"]].to_numpy(dtype=np.float64)
+
+    return times, ohlc
+
+
+def bin_intensity(heatmap: HeatmapData, price_edges: np.ndarray, n_columns: int) -> np.ndarray:
+    """
+    Resamples the heatmap's price x time grid to the image's pixel grid, in one indexing operation.
+
+    Args:
+        heatmap (HeatmapData): The heatmap to resample.
+        price_edges (np.ndarray): The price of every pixel row, from the top of the image to the bottom.
+        n_columns (int): The number of pixel columns of the plot area.
+
+    Returns:
+        np.ndarray: The intensity of every pixel, shape (len(price_edges), n_columns).
+    """
+    n_prices, n_times = heatmap.intensity.shape
+
+    # The grid row whose price level is closest to each pixel row's price, and the grid column each pixel column falls in. searchsorted gives
+    # the first level at or above the price, the level below it is taken instead when it's nearer.
+    upper_indices = np.clip(np.searchsorted(heatmap.price_levels, price_edges), 0, n_prices - 1)
+    lower_indices = np.maximum(upper_indices - 1, 0)
+    is_lower_nearer = np.abs(price_edges - heatmap.price_levels[lower_indices]) <= np.abs(heatmap.price_levels[upper_indices] - price_edges)
+    row_indices = np.where(is_lower_nearer, lower_indices, upper_indices)
+    column_indices = np.minimum((np.arange(n_columns) * n_times) // n_columns, n_times - 1)
+
+    return heatmap.intensity[np.ix_(row_indices, column_indices)]
+
+
+def colorize(intensity: np.ndarray) -> np.ndarray:
+    # Maps the intensities to colors. The top percent is clipped, otherwise a handful of huge levels would wash the rest of the map out.
+    ceiling = np.percentile(intensity, 99) if intensity.any() else 1
+    levels = np.clip(intensity / max(ceiling, 1e-12), 0, 1)
+
+    return COLORMAP[(levels * (len(COLORMAP) - 1)).astype(np.intp)]
+
+
+def draw_candles(image: np.ndarray, times: np.ndarray, ohlc: np.ndarray, heatmap_times: np.ndarray, price_to_row):
+    """
+    Draws the candles onto the image in place. Every pixel column is assigned to its candle, then the bodies and wicks are drawn with a single
+    boolean mask each, instead of a loop over the candles.
+    """
+    height, n_columns = image.shape[0], image.shape[1]
+    if len(times) == 0 or len(heatmap_times) == 0:
+        return
+
+    # The time of every pixel column, spread over the heatmap's time range.
+    time_span = heatmap_times[-1] - heatmap_times[0] + (heatmap_times[1] - heatmap_times[0] if len(heatmap_times) > 1 else 1)
+    column_times = heatmap_times[0] + np.arange(n_columns) * time_span / n_columns
+
+    candle_indices = np.searchsorted(times, column_times, side="right") - 1
+    has_candle = candle_indices >= 0
+    candle_indices = np.clip(candle_indices, 0, len(times) - 1)
+
+    # Columns past the last candle's period have no candle.
+    candle_duration = np.median(np.diff(times)) if len(times) > 1 else time_span
+    has_candle &= column_times < times[candle_indices] + candle_duration
+
+    column_ohlc = ohlc[candle_indices]
+    open_rows = price_to_row(column_ohlc[:, 0])
+    high_rows = price_to_row(column_ohlc[:, 1])
+    low_rows = price_to_row(column_ohlc[:, 2])
+    close_rows = price_to_row(column_ohlc[:, 3])
+
+    body_top = np.minimum(open_rows, close_rows)
+    body_bottom = np.maximum(open_rows, close_rows)
+
+    # Leave a gap between neighbouring candles, and draw the wick only on each candle's middle column.
+    candle_starts = np.searchsorted(candle_indices, candle_indices, side="left")
+    candle_ends = np.searchsorted(candle_indices, candle_indices, side="right")
+    position_in_candle = np.arange(n_columns) - candle_starts
+    candle_widths = candle_ends - candle_starts
+    in_body = has_candle & ((position_in_candle < candle_widths * 0.8) | (candle_widths < 3))
+    is_wick = has_candle & (position_in_candle == (candle_widths * 0.8 / 2).astype(np.intp))
+
+    rows = np.arange(height)[:, None]
+    body_mask = in_body[None, :] & (rows >= body_top[None, :]) & (rows <= body_bottom[None, :])
+    wick_mask = is_wick[None, :] & (rows >= high_rows[None, :]) & (rows <= low_rows[None, :])
+
+    is_bullish = np.broadcast_to((column_ohlc[:, 3] >= column_ohlc[:, 0])[None, :], (height, n_columns))
+    candle_mask = body_mask | wick_mask
+
+    image[candle_mask & is_bullish] = BULLISH_COLOR
+    image[candle_mask & ~is_bullish] = BEARISH_COLOR
+
+
+def render_heatmap_image(heatmap: HeatmapData, klines: pd.DataFrame | None, output_path: str, width: int = None, height: int = None) -> str:
+    """
+    Renders the channel image of a heatmap with its candles on top, and saves it as a PNG.
+
+    Args:
+        heatmap (HeatmapData): The captured heatmap.
+        klines (pd.DataFrame | None): The pair's candles from get_pair_data. If None, the candles captured along with the heatmap are used.
+        output_path (str): The path to save the image to.
+        width (int): The width of the image in pixels. Defaults to LOCAL_RENDER_WIDTH.
+        height (int): The height of the image in pixels. Defaults to LOCAL_RENDER_HEIGHT.
+
+    Returns:
+        str: The path the image was saved to.
+    """
+    width = width or constants.LOCAL_RENDER_WIDTH
+    height = height or constants.LOCAL_RENDER_HEIGHT
+    plot_width = width - AXIS_WIDTH
+
+    if klines is not None and len(klines):
+        times, ohlc = klines_to_array(klines)
+    else:
+        times, ohlc = heatmap.times, heatmap.klines
+
+    # The price of every pixel row, the highest price at the top.
+    min_price, max_price = heatmap.price_levels[0], heatmap.price_levels[-1]
+    if max_price <= min_price:
+        # A single price level, or all of them equal, would make the price span zero. Centre the level on a small span around it instead.
+        half_span = max(abs(max_price) * 0.001, 1e-9)
+        min_price, max_price = min_price - half_span, max_price + half_span
+
+    price_edges = np.linspace(max_price, min_price, height)
+
+    def price_to_row(prices: np.ndarray) -> np.ndarray:
+        rows = (max_price - prices) / (max_price - min_price) * (height - 1)
+        return np.clip(rows.round(), 0, height - 1).astype(np.intp)
+
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    image[:, :plot_width] = colorize(bin_intensity(heatmap, price_edges, plot_width))
+    draw_candles(image[:, :plot_width], times, ohlc, heatmap.times, price_to_row)
+
+    # The pair name and the price axis are the only things drawn with PIL, they're a handful of strings.
+    pil_image = Image.fromarray(image)
+    draw = ImageDraw.Draw(pil_image)
+    draw.text((10, 10), f"{heatmap.pair} Liquidation Heatmap", fill=TEXT_COLOR)
+    for price in np.linspace(max_price, min_price, 11):
+        row = int(price_to_row(np.array([price]))[0])
+        draw.text((plot_width + 8, min(max(row - 6, 0), height - 14)), f"{price:.6g}", fill=TEXT_COLOR)
+
+    pil_image.save(output_path, format="PNG", optimize=False, compress_level=1)
+
+    return output_path
+
+
+def _render_job(job: tuple) -> str:
+    # Runs in the renderer processes, which load the heatmap from disk themselves instead of receiving the arrays through a pipe.
+    pair, klines, output_path = job
+    return render_heatmap_image(HeatmapData.load(pair), klines, output_path)
+
+
+renderer_pool = None
+renderer_pool_lock = threading.Lock()
+
+
+def render_heatmap_images(jobs: list[tuple[str, pd.DataFrame | None, str]]) -> list[str]:
+    """
+    Renders several heatmaps in parallel in the renderer process pool. Blocks until all of them are done.
+
+    Args:
+        jobs (list[tuple[str, pd.DataFrame | None, str]]): (pair, klines, output path) of every image to render. The heatmap of every pair is
+            loaded from the heatmap data directory.
+
+    Returns:
+        list[str]: The path of every rendered image in the order of the jobs, or None for the ones that failed.
+    """
+    global renderer_pool
+    with renderer_pool_lock:
+        if renderer_pool is None:
+            renderer_pool = ProcessPoolExecutor(max_workers=constants.LOCAL_RENDER_WORKERS)
+
+    futures = [renderer_pool.submit(_render_job, job) for job in jobs]
+
+    rendered_paths = []
+    for job, future in zip(jobs, futures):
+        try:
+            rendered_paths.append(future.result())
+        except Exception as e:
+            logger.error(f"Error rendering the {job[0]} heatmap: {e}")
+            rendered_paths.append(None)
+
+    return rendered_paths
+
+
+def shutdown_renderer_pool():
+    if renderer_pool is not None:
+        renderer_pool.shutdown(wait=True, cancel_futures=True)
+
@@ -0,0 +1,126 @@
+# This module shrinks the rendered images before they're sent. The browser renders in a 4000px square window and its PNG goes out as is, even
+# though Telegram recompresses photos to at most 2560px anyway. Cropping the margins, downsizing and re-encoding here makes the uploads a
+# fraction of the size.
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+import constants
+from data.image_store import image_store
+from utils.logger import logger
+
+# The PIL format and the save options of every output format. Telegram sends photos as JPEG, WebP and PNG are there for quality over size.
+FORMATS = {
+    "jpeg": ("JPEG", ".jpg", {"optimize": True, "progressive": True}),
+    "webp": ("WEBP", ".webp", {"method": 4}),
+    "png": ("PNG", ".png", {"optimize": True}),
+}
+
+
+def postprocess_image(input_path: str, output_path: str, crop_x: int, crop_y: int, max_width: int, max_height: int, image_format: str,
+                      quality: int) -> tuple[str, int, int]:
+    """
+    Crops the margins off an image, downsizes it to fit the maximum size and re-encodes it.
+
+    Args:
+        input_path (str): The rendered image.
+        output_path (str): The path to save the processed image to.
+        crop_x (int): The pixels cropped off the left and the right side.
+        crop_y (int): The pixels cropped off the top and the bottom.
+        max_width (int): The most pixels the image is wide after downsizing, the aspect ratio is kept.
+        max_height (int): The most pixels the image is high after downsizing.
+        image_format (str): One of FORMATS.
+        quality (int): The JPEG or WebP quality, ignored for PNG.
+
+    Returns:
+        tuple[str, int, int]: The output path, and the size of the input and the output in bytes.
+    """
+    pil_format, _, save_options = FORMATS[image_format]
+
+    with Image.open(input_path) as image:
+        width, height = image.size
+        if crop_x or crop_y:
+            image = image.crop((crop_x, crop_y, max(width - crop_x, crop_x + 1), max(height - crop_y, crop_y + 1)))
+
+        image.thumbnail((max_width, max_height), Image.LANCZOS)
+
+        # JPEG has no alpha channel
+        if pil_format == "JPEG" and image.mode != "RGB":
+            image = image.convert("RGB")
+
+        if pil_format != "PNG":
+            save_options = {**save_options, "quality": quality}
+
+        image.save(output_path, format=pil_format, **save_options)
+
+    return output_path, os.path.getsize(input_path), os.path.getsize(output_path)
+
+
+def _postprocess_job(job: tuple) -> tuple[str, int, int]:
+    return postprocess_image(*job)
+
+
+postprocessor_pool = None
+postprocessor_pool_lock = threading.Lock()
+
+
+def postprocess_images(image_paths: dict[str, str]) -> dict[str, str]:
+    """
+    Post-processes the rendered images in the post-processor process pool and publishes the results to the image store. Blocks until all of
+    them are done. Images that fail to process are sent as they were rendered.
+
+    Args:
+        image_paths (dict[str, str]): The path to the rendered image of every pair.
+
+    Returns:
+        dict[str, str]: The path to the processed image of every pair.
+    """
+    if constants.POSTPROCESS_FORMAT == "none" or not image_paths:
+        return image_paths
+
+    global postprocessor_pool
+    with postprocessor_pool_lock:
+        if postprocessor_pool is None:
+            postprocessor_pool = ProcessPoolExecutor(max_workers=constants.POSTPROCESS_WORKERS)
+
+    # The margins belong to the chart website's page, the locally rendered images have none.
+    crop_x, crop_y = (0, 0) if constants.CHART_MODE == "local" else (constants.CHART_X_OFFSET, constants.CHART_Y_OFFSET)
+    extension = FORMATS[constants.POSTPROCESS_FORMAT][1]
+
+    work_dir = image_store.create_work_dir()
+    try:
+        futures = {
+            pair: postprocessor_pool.submit(
+                _postprocess_job,
+                (image_path, os.path.join(work_dir, f"{pair}{extension}"), crop_x, crop_y, constants.POSTPROCESS_MAX_WIDTH,
+                 constants.POSTPROCESS_MAX_HEIGHT, constants.POSTPROCESS_FORMAT, constants.POSTPROCESS_QUALITY),
+            )
+            for pair, image_path in image_paths.items()
+        }
+
+        processed_paths = {}
+        for pair, future in futures.items():
+            try:
+                output_path, input_bytes, output_bytes = future.result()
+            except Exception as e:
+                logger.error(f"Error post-processing the {pair} image, sending it as rendered: {e}")
+                processed_paths[pair] = image_paths[pair]
+                continue
+
+            logger.info(
+                f"Post-processed the {pair} image: {input_bytes / 1024:.0f} KB -> {output_bytes / 1024:.0f} KB, "
+                f"saved {input_bytes - output_bytes} bytes ({1 - output_bytes / max(input_bytes, 1):.0%})"
+            )
+            processed_paths[pair] = image_store.publish(output_path)
+
+        return processed_paths
+
+    finally:
+        image_store.remove_work_dir(work_dir)
+
+
+def shutdown_postprocessor_pool():
+    if postprocessor_pool is not None:
+        postprocessor_pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,100 @@
+# This module contains the image store. Every render works in a directory of its own, and its finished images are published atomically into a
+# content-addressed store, so concurrent renders can never delete or overwrite each other's files.
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+import constants
+from utils.logger import logger
+
+
+class ImageStore:
+    def __init__(self, root_dir: str, retention_seconds: int):
+        """
+        Args:
+            root_dir (str): The directory holding the work directories and the store.
+            retention_seconds (int): How long images and abandoned work directories are kept before being garbage collected.
+        """
+        self.work_root = os.path.join(root_dir, "work")
+        self.store_dir = os.path.join(root_dir, "store")
+        self.retention_seconds = retention_seconds
+
+        os.makedirs(self.work_root, exist_ok=True)
+        os.makedirs(self.store_dir, exist_ok=True)
+
+    def create_work_dir(self) -> str:
+        # A fresh, uniquely named directory for a single render.
+        return tempfile.mkdtemp(prefix="render_", dir=self.work_root)
+
+    @staticmethod
+    def remove_work_dir(work_dir: str):
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    @staticmethod
+    def __hash_file(file_path: str) -> str:
+        file_hash = hashlib.sha256()
+        with open(file_path, "rb") as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                file_hash.update(chunk)
+
+        return file_hash.hexdigest()
+
+    def get_image_hash(self, file_path: str) -> str:
+        # The hash of an image's content. Images in the store are named after it, so only the ones outside the store get read.
+        if os.path.dirname(os.path.abspath(file_path)) == os.path.abspath(self.store_dir):
+            return os.path.splitext(os.path.basename(file_path))[0]
+
+        return self.__hash_file(file_path)
+
+    def publish(self, file_path: str) -> str:
+        """
+        Moves a finished image from a work directory into the store, named after the hash of its content. Identical images end up as a single
+        file, and since the move is a rename within the same filesystem, readers never see a partially written image.
+
+        Returns:
+            str: The path to the image in the store.
+        """
+        extension = os.path.splitext(file_path)[1].lower()
+        store_path = os.path.join(self.store_dir, f"{self.__hash_file(file_path)}{extension}")
+
+        if os.path.exists(store_path):
+            # Same content is already published, refresh its age so the garbage collector keeps it around.
+            os.unlink(file_path)
+            os.utime(store_path)
+
+        else:
+            os.replace(file_path, store_path)
+
+        return store_path
+
+    def collect_garbage(self):
+        """Removes the images and work directories older than the retention period."""
+        expiry = time.time() - self.retention_seconds
+        n_removed = 0
+
+        with os.scandir(self.store_dir) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file() and entry.stat().st_mtime < expiry:
+                        os.unlink(entry.path)
+                        n_removed += 1
+                except FileNotFoundError:
+                    pass
+
+        # Work directories are removed by their render once it's done, the old ones left here belong to crashed renders.
+        with os.scandir(self.work_root) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir() and entry.stat().st_mtime < expiry:
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                        n_removed += 1
+                except FileNotFoundError:
+                    pass
+
+        if n_removed:
+            logger.info(f"Image store garbage collection removed {n_removed} old images and work directories")
+
+
+image_store = ImageStore(root_dir=os.path.abspath("output_images"), retention_seconds=constants.IMAGE_STORE_RETENTION_SECONDS)
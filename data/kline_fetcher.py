@@ -0,0 +1,187 @@
+# This module fetches candles from Binance over pooled connections, concurrently for many symbols, and keeps the latest candles of every symbol
+# and timeframe in memory, so repeated requests only download the candles newer than the ones already cached.
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import constants
+from data.kline_store import kline_store
+from utils.logger import logger
+
+KLINE_COLUMNS = [
+    'open_time', 'open', 'high', 'low', 'close', 'volume',
+    'close_time', 'quote_asset_volume', 'number_of_trades',
+    'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume', 'ignore'
+]
+
+# The Binance intervals in milliseconds.
+BINANCE_INTERVALS = {
+    "1m": 60000,
+    "3m": 180000,
+    "5m": 300000,
+    "15m": 900000,
+    "30m": 1800000,
+    "1h": 3600000,
+    "2h": 7200000,
+    "4h": 14400000,
+    "6h": 21600000,
+    "12h": 43200000,
+    "1d": 86400000,
+}
+
+# The most candles Binance returns for a single request.
+MAX_KLINES_PER_REQUEST = 1000
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def klines_to_dataframe(response: list) -> pd.DataFrame:
+    df = pd.DataFrame(response, columns=KLINE_COLUMNS)
+    df['time'] = pd.to_datetime(df['open_time'], unit='ms')
+    df[['open', 'high', 'low', 'close', 'volume']] = df[['open', 'high', 'low', 'close', 'volume']].astype(float)
+    df = df[['time', 'open', 'high', 'low', 'close', 'volume']]
+    df = df.set_index('time')
+
+    return df
+
+
+class KlineCache:
+    def __init__(self, max_candles: int):
+        """
+        Args:
+            max_candles (int): The number of latest candles kept for every symbol and timeframe.
+        """
+        self.max_candles = max_candles
+
+        # (symbol, timeframe) -> DataFrame of the latest candles
+        self.candles = {}
+        self.lock = threading.Lock()
+
+    def seed_from_store(self, symbol: str, timeframe: str, limit: int):
+        # Fills an empty cache with the candles stored on disk, so after a restart only the candles since the last stored one are fetched.
+        with self.lock:
+            if (symbol, timeframe) in self.candles:
+                return
+
+        stored = kline_store.read_dataframe(symbol, timeframe, last_n=max(limit, self.max_candles))
+        if not len(stored):
+            return
+
+        with self.lock:
+            self.candles.setdefault((symbol, timeframe), stored)
+
+    def get_request_params(self, symbol: str, timeframe: str, limit: int) -> dict:
+        """
+        Returns the query parameters for fetching the candles that are missing from the cache. If enough candles are cached, only the ones from
+        the last cached candle onwards are requested, the last one included since it was probably still forming when it was fetched.
+        """
+        self.seed_from_store(symbol, timeframe, limit)
+
+        params = {"symbol": symbol, "interval": timeframe, "limit": min(limit, MAX_KLINES_PER_REQUEST)}
+
+        with self.lock:
+            cached = self.candles.get((symbol, timeframe))
+
+        # The store only holds the closed candles, so a cache seeded from it is allowed to be one candle, the forming one, short.
+        if cached is None or len(cached) < limit - 1 or timeframe not in BINANCE_INTERVALS:
+            return params
+
+        last_open_time = int(cached.index[-1].value // 1_000_000)
+        n_missing_candles = (time.time() * 1000 - last_open_time) // BINANCE_INTERVALS[timeframe] + 1
+
+        # If too much time has passed for a single request to bridge the gap, fetch the whole window again.
+        if n_missing_candles >= MAX_KLINES_PER_REQUEST:
+            return params
+
+        params["startTime"] = last_open_time
+        params["limit"] = int(n_missing_candles) + 1
+        return params
+
+    def merge(self, symbol: str, timeframe: str, response: list, limit: int) -> pd.DataFrame:
+        """
+        Merges the fetched candles into the cache, newer fetches replacing the older versions of the same candles, and returns the last limit.
+        The closed candles are also appended to the on-disk store.
+        """
+        new_candles = klines_to_dataframe(response)
+
+        if timeframe in BINANCE_INTERVALS:
+            kline_store.append(symbol, timeframe, new_candles, BINANCE_INTERVALS[timeframe])
+
+        with self.lock:
+            cached = self.candles.get((symbol, timeframe))
+
+            if cached is not None and len(new_candles) and new_candles.index[0] <= cached.index[-1]:
+                merged = pd.concat([cached[cached.index < new_candles.index[0]], new_candles])
+            else:
+                merged = new_candles
+
+            merged = merged.iloc[-max(limit, self.max_candles):]
+            self.candles[(symbol, timeframe)] = merged
+
+        return merged.iloc[-limit:]
+
+
+kline_cache = KlineCache(max_candles=constants.KLINE_CACHE_SIZE)
+
+
+def _create_session() -> requests.Session:
+    session = requests.Session()
+
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=RETRY_STATUSES, respect_retry_after_header=True)
+    session.mount("https://", HTTPAdapter(pool_maxsize=constants.KLINE_MAX_CONNECTIONS, max_retries=retry))
+    session.mount("http://", HTTPAdapter(pool_maxsize=constants.KLINE_MAX_CONNECTIONS, max_retries=retry))
+
+    return session
+
+
+# The session used by the blocking fetches, shared so its connections are reused.
+kline_session = _create_session()
+
+
+def fetch_klines(symbol: str, timeframe: str, limit: int = 70) -> pd.DataFrame:
+    """
+    Fetches the latest candles of a symbol, blocking. Only the candles newer than the cached ones are downloaded.
+
+    Args:
+        symbol (str): The Binance symbol, e.g. BTCUSDT
+        timeframe (str): The Binance interval, e.g. 4h
+        limit (int): The number of candles to return.
+    """
+    params = kline_cache.get_request_params(symbol, timeframe, limit)
+
+    response = kline_session.get(f"{constants.BINANCE_API_URL}/api/v3/klines", params=params, timeout=constants.KLINE_TIMEOUT_SECONDS)
+    response.raise_for_status()
+
+    return kline_cache.merge(symbol, timeframe, response.json(), limit)
+
+
+def fetch_many(symbol_requests: list[tuple[str, str, int]]) -> dict[str, pd.DataFrame | None]:
+    """
+    Fetches the candles of many symbols concurrently, over the shared session's connection pool.
+
+    Args:
+        symbol_requests (list[tuple[str, str, int]]): The (symbol, timeframe, limit) of every fetch.
+
+    Returns:
+        dict[str, pd.DataFrame | None]: The candles of every symbol, or None for the ones that failed.
+    """
+    if not symbol_requests:
+        return {}
+
+    klines = {}
+    with ThreadPoolExecutor(max_workers=min(len(symbol_requests), constants.KLINE_MAX_CONNECTIONS), thread_name_prefix="klines") as executor:
+        futures = {symbol: executor.submit(fetch_klines, symbol, timeframe, limit) for symbol, timeframe, limit in symbol_requests}
+
+        for symbol, future in futures.items():
+            try:
+                klines[symbol] = future.result()
+            except Exception as e:
+                logger.error(f"Error fetching the {symbol} candles: {e}")
+                klines[symbol] = None
+
+    return klines
@@ -0,0 +1,158 @@
+# This module keeps the closed candles of every symbol and timeframe on disk, as append-only column files that are read through memory maps.
+# Reading a time range is a binary search and a slice of the maps, nothing gets copied or parsed, and the history survives restarts.
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.logger import logger
+
+# The stored columns and their types. Every column lives in its own raw little-endian file.
+COLUMNS = {
+    "open_time": np.dtype("<i8"),
+    "open": np.dtype("<f8"),
+    "high": np.dtype("<f8"),
+    "low": np.dtype("<f8"),
+    "close": np.dtype("<f8"),
+    "volume": np.dtype("<f8"),
+}
+
+
+class KlineStore:
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+
+        # (symbol, timeframe) -> (number of rows mapped, column name -> memmap), remapped whenever the files grow.
+        self.maps = {}
+        self.lock = threading.Lock()
+
+        # Held for the whole of an append, so two appends of the same candles can't both see them as new.
+        self.append_lock = threading.Lock()
+
+    def __get_series_dir(self, symbol: str, timeframe: str) -> str:
+        return os.path.join(self.root_dir, symbol, timeframe)
+
+    def __count_rows(self, series_dir: str) -> int:
+        # An append interrupted halfway can leave the columns at different lengths, only the rows present in every column count. The next
+        # append writes over the rest.
+        n_rows = None
+        for column, dtype in COLUMNS.items():
+            column_path = os.path.join(series_dir, f"{column}.bin")
+            if not os.path.exists(column_path):
+                return 0
+
+            column_rows = os.path.getsize(column_path) // dtype.itemsize
+            n_rows = column_rows if n_rows is None else min(n_rows, column_rows)
+
+        return n_rows or 0
+
+    def __get_maps(self, symbol: str, timeframe: str) -> dict[str, np.ndarray]:
+        series_dir = self.__get_series_dir(symbol, timeframe)
+        n_rows = self.__count_rows(series_dir)
+
+        with self.lock:
+            mapped = self.maps.get((symbol, timeframe))
+            if mapped is not None and mapped[0] == n_rows:
+                return mapped[1]
+
+            if n_rows == 0:
+                column_maps = {column: np.empty(0, dtype=dtype) for column, dtype in COLUMNS.items()}
+            else:
+                column_maps = {
+                    column: np.memmap(os.path.join(series_dir, f"{column}.bin"), dtype=dtype, mode="r", shape=(n_rows,))
+                    for column, dtype in COLUMNS.items()
+                }
+
+            self.maps[(symbol, timeframe)] = (n_rows, column_maps)
+            return column_maps
+
+    def get_last_open_time(self, symbol: str, timeframe: str) -> int | None:
+        open_times = self.__get_maps(symbol, timeframe)["open_time"]
+        return int(open_times[-1]) if len(open_times) else None
+
+    def append(self, symbol: str, timeframe: str, klines: pd.DataFrame, interval_ms: int) -> int:
+        """
+        Appends the closed candles that are newer than the stored ones. The candle that's still forming is left out, since the store never
+        rewrites rows.
+
+        Args:
+            symbol (str): The Binance symbol.
+            timeframe (str): The Binance interval.
+            klines (pd.DataFrame): Candles in the get_pair_data format.
+            interval_ms (int): The length of a candle, used to tell the closed candles apart.
+
+        Returns:
+            int: The number of candles appended.
+        """
+        if not len(klines):
+            return 0
+
+        with self.append_lock:
+            return self.__append(symbol, timeframe, klines, interval_ms)
+
+    def __append(self, symbol: str, timeframe: str, klines: pd.DataFrame, interval_ms: int) -> int:
+        open_times = klines.index.values.astype("datetime64[ms]").astype(np.int64)
+        is_closed = open_times + interval_ms <= time.time() * 1000
+
+        last_open_time = self.get_last_open_time(symbol, timeframe)
+        is_new = open_times > last_open_time if last_open_time is not None else np.ones(len(open_times), dtype=bool)
+
+        rows = is_closed & is_new
+        if not rows.any():
+            return 0
+
+        columns = {"open_time": open_times[rows]}
+        for column in ["open", "high", "low", "close", "volume"]:
+            columns[column] = klines[column].to_numpy()[rows]
+
+        series_dir = self.__get_series_dir(symbol, timeframe)
+        os.makedirs(series_dir, exist_ok=True)
+
+        # Every column is written from the end of the rows present in all of them, not from the end of its file, so the leftovers of an
+        # interrupted append are overwritten instead of shifting that column against the others.
+        n_rows = self.__count_rows(series_dir)
+        for column, dtype in COLUMNS.items():
+            column_path = os.path.join(series_dir, f"{column}.bin")
+            with open(column_path, "r+b" if os.path.exists(column_path) else "wb") as file:
+                file.seek(n_rows * dtype.itemsize)
+                file.write(columns[column].astype(dtype).tobytes())
+
+        n_appended = int(rows.sum())
+        logger.info(f"Stored {n_appended} new {symbol} {timeframe} candles")
+        return n_appended
+
+    def read(self, symbol: str, timeframe: str, start_ms: int = None, end_ms: int = None, last_n: int = None) -> dict[str, np.ndarray]:
+        """
+        Returns the stored candles in the time range as zero-copy slices of the memory-mapped columns.
+
+        Args:
+            symbol (str): The Binance symbol.
+            timeframe (str): The Binance interval.
+            start_ms (int): The earliest open time to include, in milliseconds.
+            end_ms (int): The latest open time to include, in milliseconds.
+            last_n (int): Only return the last n candles of the range.
+        """
+        column_maps = self.__get_maps(symbol, timeframe)
+        open_times = column_maps["open_time"]
+
+        start_index = int(np.searchsorted(open_times, start_ms, side="left")) if start_ms is not None else 0
+        end_index = int(np.searchsorted(open_times, end_ms, side="right")) if end_ms is not None else len(open_times)
+        if last_n is not None:
+            start_index = max(start_index, end_index - last_n)
+
+        return {column: column_map[start_index:end_index] for column, column_map in column_maps.items()}
+
+    def read_dataframe(self, symbol: str, timeframe: str, start_ms: int = None, end_ms: int = None, last_n: int = None) -> pd.DataFrame:
+        # The same as read, in the get_pair_data format.
+        columns = self.read(symbol, timeframe, start_ms, end_ms, last_n)
+
+        df = pd.DataFrame({column: np.asarray(columns[column]) for column in ["open", "high", "low", "close", "volume"]})
+        df.index = pd.to_datetime(np.asarray(columns["open_time"]), unit="ms")
+        df.index.name = "time"
+
+        return df
+
+
+kline_store = KlineStore(root_dir=os.path.abspath("kline_store"))
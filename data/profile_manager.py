@@ -0,0 +1,166 @@
+# This module gives every browser a Chrome profile of its own. Chrome locks its profile directory, so drivers sharing chrome_profile can't run
+# at the same time. The chrome_profile directory is kept as the logged-in template, every driver gets a clone of it on tmpfs, and the session
+# state the driver changed is synced back to the template when it quits.
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import psutil
+
+import constants
+from utils.logger import logger
+
+# Chrome's lock files, a clone must not start out looking locked by another browser.
+LOCK_FILES = {"SingletonLock", "SingletonCookie", "SingletonSocket", "lockfile"}
+
+# Caches Chrome rebuilds on its own. Skipping them keeps the clones small and quick to make.
+CACHE_DIRS = {"Cache", "Code Cache", "GPUCache", "ShaderCache", "GrShaderCache", "GraphiteDawnCache", "DawnCache", "Service Worker", "Crashpad",
+              "BrowserMetrics", "component_crx_cache", "optimization_guide_model_store"}
+
+# The profile files that hold the session, relative to the profile directory. Only these are synced back to the template.
+SESSION_PATHS = [
+    "Local State",
+    os.path.join("Default", "Cookies"),
+    os.path.join("Default", "Cookies-journal"),
+    os.path.join("Default", "Network", "Cookies"),
+    os.path.join("Default", "Network", "Cookies-journal"),
+    os.path.join("Default", "Local Storage"),
+    os.path.join("Default", "Session Storage"),
+    os.path.join("Default", "Preferences"),
+]
+
+
+def _get_clone_root() -> str:
+    # tmpfs if there is one, the profile I/O then never touches the disk.
+    if constants.CHROME_PROFILE_CLONE_DIR:
+        return constants.CHROME_PROFILE_CLONE_DIR
+
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return os.path.join("/dev/shm", "heatmap_chrome_profiles")
+
+    return os.path.join(tempfile.gettempdir(), "heatmap_chrome_profiles")
+
+
+def _get_newest_mtime(path: str) -> float:
+    # A directory's own mtime only changes when entries are added or removed, not when a file in it is written.
+    if not os.path.isdir(path):
+        return os.path.getmtime(path)
+
+    return max([os.path.getmtime(path)] + [os.path.getmtime(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names])
+
+
+def _ignore_uncloned(directory: str, names: list[str]) -> set[str]:
+    return {name for name in names if name in LOCK_FILES or name in CACHE_DIRS}
+
+
+class ProfileManager:
+    def __init__(self, template_dir: str, clone_root: str):
+        """
+        Args:
+            template_dir (str): The authoritative profile, the one that's logged in.
+            clone_root (str): The directory the clones are made in.
+        """
+        self.template_dir = template_dir
+        self.clone_root = clone_root
+
+        # Held while the template is read or written, so a clone never copies a half-synced template.
+        self.lock = threading.Lock()
+
+        os.makedirs(self.template_dir, exist_ok=True)
+        self.__remove_leftover_clones()
+
+    def __get_process_dir(self) -> str:
+        # Every process makes its clones in a directory of its own, named after its pid, so the clones a killed process left behind can be
+        # told apart from the ones of the render processes still running. Looked up on every clone, a forked process gets its own.
+        return os.path.join(self.clone_root, f"pid_{os.getpid()}")
+
+    def __remove_leftover_clones(self):
+        # The clones of a process that crashed or was killed are never released, and on tmpfs they hold on to the memory until they're removed.
+        if not os.path.isdir(self.clone_root):
+            return
+
+        n_removed = 0
+        for name in os.listdir(self.clone_root):
+            if name.startswith("pid_"):
+                pid = name.removeprefix("pid_")
+                if pid.isdigit() and int(pid) != os.getpid() and psutil.pid_exists(int(pid)):
+                    continue
+            elif not name.startswith("profile_"):
+                continue
+
+            shutil.rmtree(os.path.join(self.clone_root, name), ignore_errors=True)
+            n_removed += 1
+
+        if n_removed:
+            logger.info(f"Removed {n_removed} leftover Chrome profile clone directories from {self.clone_root}")
+
+    def create_clone(self) -> str:
+        """
+        Copies the template, without its lock files and caches, into a new directory under the clone root.
+
+        Returns:
+            str: The clone's profile directory.
+        """
+        process_dir = self.__get_process_dir()
+        os.makedirs(process_dir, exist_ok=True)
+        clone_dir = tempfile.mkdtemp(prefix="profile_", dir=process_dir)
+
+        clone_start = time.perf_counter()
+        with self.lock:
+            shutil.copytree(self.template_dir, clone_dir, ignore=_ignore_uncloned, dirs_exist_ok=True, symlinks=True)
+
+        logger.info(f"Cloned the Chrome profile to {clone_dir} in {time.perf_counter() - clone_start:.2f}s")
+        return clone_dir
+
+    def sync_back(self, clone_dir: str):
+        """
+        Copies the session files the browser changed from its clone back to the template. Call it after the browser has quit, so its files are
+        complete. Every file or directory replaces the template's with a rename, so a concurrent clone sees either the old or the new one.
+        """
+        n_synced = 0
+
+        with self.lock:
+            for session_path in SESSION_PATHS:
+                clone_path = os.path.join(clone_dir, session_path)
+                template_path = os.path.join(self.template_dir, session_path)
+                if not os.path.exists(clone_path):
+                    continue
+
+                if os.path.exists(template_path) and _get_newest_mtime(template_path) >= _get_newest_mtime(clone_path):
+                    continue
+
+                os.makedirs(os.path.dirname(template_path), exist_ok=True)
+                temp_path = f"{template_path}.{os.getpid()}.sync"
+
+                if os.path.isdir(clone_path):
+                    shutil.copytree(clone_path, temp_path, ignore=_ignore_uncloned, dirs_exist_ok=True)
+                    old_path = f"{template_path}.{os.getpid()}.old"
+                    if os.path.exists(template_path):
+                        os.replace(template_path, old_path)
+                    os.replace(temp_path, template_path)
+                    shutil.rmtree(old_path, ignore_errors=True)
+                else:
+                    shutil.copy2(clone_path, temp_path)
+                    os.replace(temp_path, template_path)
+
+                n_synced += 1
+
+        if n_synced:
+            logger.info(f"Synced {n_synced} session files from {clone_dir} back to the template profile")
+
+    def remove_clone(self, clone_dir: str):
+        shutil.rmtree(clone_dir, ignore_errors=True)
+
+    def release_clone(self, clone_dir: str):
+        # Syncs the clone's session back to the template and removes the clone.
+        try:
+            self.sync_back(clone_dir)
+        except Exception as e:
+            logger.error(f"Error syncing the Chrome profile {clone_dir} back to the template: {e}")
+
+        self.remove_clone(clone_dir)
+
+
+profile_manager = ProfileManager(template_dir=os.path.abspath("chrome_profile"), clone_root=_get_clone_root())
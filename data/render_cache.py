@@ -0,0 +1,90 @@
+# This module contains the render cache, which lets every job and /currentchart within the same time slot reuse a single rendered image per pair.
+import time
+from collections import OrderedDict
+
+import constants
+from data.utils import normalize_pair
+from utils.logger import logger
+
+
+class RenderCache:
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        """
+        Args:
+            ttl_seconds (int): The length of a time slot. Entries expire at the end of the slot they were rendered in.
+            max_entries (int): The maximum number of images kept, the least recently used ones are evicted first.
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        # (pair, slot start) -> (image path, expiry timestamp), ordered from least to most recently used.
+        self.entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+        # Misses that joined a render another job had already started, rather than starting their own.
+        self.coalesced = 0
+
+        # The total time spent rendering the misses, used to estimate how much browser time the hits saved.
+        self.render_seconds = 0.0
+        self.rendered_pairs = 0
+
+    def get_slot_start(self, now: float = None) -> int:
+        """
+        Returns the start of the slot that the given time falls in, as a unix timestamp. The slots are aligned to 00:00 UTC plus
+        CHART_DELAY_SECONDS, the same instants the periodic jobs fire at, so all the jobs of a posting time land in the same slot.
+        """
+        if now is None:
+            now = time.time()
+
+        delay = constants.CHART_DELAY_SECONDS
+        return int((now - delay) // self.ttl_seconds * self.ttl_seconds + delay)
+
+    def get(self, pair: str, slot_start: int) -> str | None:
+        key = (normalize_pair(pair), slot_start)
+        entry = self.entries.get(key)
+
+        if entry is None or entry[1] <= time.time():
+            self.entries.pop(key, None)
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, pair: str, slot_start: int, image_path: str):
+        key = (normalize_pair(pair), slot_start)
+        self.entries[key] = (image_path, slot_start + self.ttl_seconds)
+        self.entries.move_to_end(key)
+
+        self.__evict()
+
+    def record_render_time(self, n_pairs: int, seconds: float):
+        self.rendered_pairs += n_pairs
+        self.render_seconds += seconds
+
+    def __evict(self):
+        # Drop the expired entries first, then the least recently used ones until the cache is within its size.
+        now = time.time()
+        for key in [key for key, entry in self.entries.items() if entry[1] <= now]:
+            del self.entries[key]
+
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def compose_stats(self) -> str:
+        average_render_seconds = self.render_seconds / self.rendered_pairs if self.rendered_pairs else 0
+        saved_seconds = (self.hits + self.coalesced) * average_render_seconds
+
+        return (
+            f"Render cache: {self.hits} hits, {self.misses} misses ({self.coalesced} joined an in-flight render), {len(self.entries)} entries, "
+            f"~{saved_seconds:.0f}s of browser time saved"
+        )
+
+    def log_stats(self):
+        logger.info(self.compose_stats())
+
+
+render_cache = RenderCache(ttl_seconds=constants.RENDER_CACHE_TTL_SECONDS, max_entries=constants.RENDER_CACHE_MAX_ENTRIES)
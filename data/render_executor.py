@@ -0,0 +1,188 @@
+# This module runs the blocking chart rendering in a worker pool, so the bot's event loop keeps handling commands and other jobs meanwhile.
+import asyncio
+import multiprocessing.util
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Executor
+
+import constants
+from data.driver_pool import chart_pool
+from data.heatmap_renderer import get_binance_interval, render_heatmap_images, shutdown_renderer_pool
+from data.image_postprocessor import postprocess_images, shutdown_postprocessor_pool
+from data.image_store import image_store
+from data.kline_fetcher import fetch_many
+from data.render_cache import render_cache
+from data.utils import normalize_pair
+from utils.logger import logger
+from utils.metrics import span
+
+
+def _init_render_process():
+    # Every worker process has its own driver pool, make sure its browsers are quit when the process exits.
+    multiprocessing.util.Finalize(None, chart_pool.shutdown, exitpriority=10)
+
+
+def _create_executor() -> Executor:
+    if constants.RENDER_EXECUTOR == "process":
+        # Every process has a driver pool of its own, and only one browser at a time can run on the shared chrome_profile.
+        n_workers = constants.RENDER_WORKERS
+        if not constants.CHROME_PROFILE_CLONES and n_workers > 1:
+            logger.warning(f"RENDER_EXECUTOR=process runs a single process with CHROME_PROFILE_CLONES off, not {n_workers}")
+            n_workers = 1
+
+        return ProcessPoolExecutor(max_workers=n_workers, initializer=_init_render_process)
+
+    elif constants.RENDER_EXECUTOR == "thread":
+        return ThreadPoolExecutor(max_workers=constants.RENDER_WORKERS, thread_name_prefix="render")
+
+    raise ValueError(f"Invalid RENDER_EXECUTOR {constants.RENDER_EXECUTOR}, must be either 'thread' or 'process'")
+
+
+render_executor = _create_executor()
+
+# The renders currently running, as (pair, slot start) -> future of the image path, so concurrent jobs wait for the same render instead of
+# starting their own.
+in_flight_renders = {}
+
+
+def render_charts_blocking(pair_list: list[str]) -> dict[str, str]:
+    """
+    Renders the charts for the pairs with a pooled driver and returns the path to each pair's image. This is the part that runs in the workers.
+    Batches of several pairs are loaded in parallel tabs. The rendered images are cropped, downsized and re-encoded before they're returned.
+    """
+    if constants.CHART_MODE == "local":
+        image_paths = render_charts_locally_blocking(pair_list)
+        with span("postprocess"):
+            return postprocess_images(image_paths)
+
+    with chart_pool.checkout() as chart:
+        if len(pair_list) > 1 and constants.RENDER_MAX_TABS > 1:
+            image_paths = chart.download_chart_batch(pair_list)
+        else:
+            image_paths = chart.download_chart(pair_list)
+
+    # The browser goes back to the pool before the post-processing, it isn't needed for it.
+    with span("postprocess"):
+        return postprocess_images(image_paths)
+
+
+def render_charts_locally_blocking(pair_list: list[str]) -> dict[str, str]:
+    """
+    Captures the heatmap data of the pairs with a pooled driver, then renders the images locally in the renderer process pool, with the
+    latest candles from Binance on top.
+    """
+    heatmaps = {}
+    with chart_pool.checkout() as chart:
+        for pair in pair_list:
+            try:
+                heatmaps[pair] = chart.capture_chart_data(pair)
+            except Exception as e:
+                logger.error(f"Error capturing the {pair} heatmap data: {e}")
+
+    work_dir = image_store.create_work_dir()
+    try:
+        # The candles of every pair are fetched at once. fetch_many logs the fetches that fail, and the candles captured along with the
+        # heatmap are used for those pairs instead.
+        pair_klines = fetch_many(
+            [(f"{pair}USDT", get_binance_interval(heatmap), min(len(heatmap.times), 1000)) for pair, heatmap in heatmaps.items()]
+        )
+
+        jobs = [(pair, pair_klines.get(f"{pair}USDT"), os.path.join(work_dir, f"heatmap_{pair}.png")) for pair in heatmaps]
+
+        rendered_paths = render_heatmap_images(jobs)
+
+        return {job[0]: image_store.publish(rendered_path) for job, rendered_path in zip(jobs, rendered_paths) if rendered_path}
+
+    finally:
+        image_store.remove_work_dir(work_dir)
+
+
+async def render_charts(pair_list: list[str] | str) -> dict[str, str]:
+    """
+    Renders the charts for one or more pairs in the render executor without blocking the event loop. Pairs already rendered in the current
+    time slot are served from the render cache, and pairs that another job is rendering right now are awaited instead of rendered again.
+
+    Args:
+        pair_list (list[str] | str): The pair or the list of pairs to render.
+
+    Returns:
+        dict[str, str]: The path to the image of every pair, or None for the pairs that failed to render.
+    """
+    if not isinstance(pair_list, list):
+        pair_list = [pair_list]
+
+    loop = asyncio.get_running_loop()
+    slot_start = render_cache.get_slot_start()
+
+    image_paths = {}
+    pairs_to_render = []
+    awaited_renders = {}
+    for pair in pair_list:
+        render_key = (normalize_pair(pair), slot_start)
+
+        cached_path = render_cache.get(pair, slot_start)
+        if cached_path and os.path.exists(cached_path):
+            image_paths[pair] = cached_path
+
+        elif render_key in in_flight_renders:
+            awaited_renders[pair] = in_flight_renders[render_key]
+            render_cache.coalesced += 1
+
+        else:
+            pairs_to_render.append(pair)
+            in_flight_renders[render_key] = loop.create_future()
+
+    if pairs_to_render:
+        render_start = time.perf_counter()
+
+        try:
+            # With RENDER_EXECUTOR=process, the spans of the stages inside render_charts_blocking are recorded in the worker processes and
+            # don't show up in this process's metrics, only this one does.
+            with span("render"):
+                rendered_paths = await loop.run_in_executor(render_executor, render_charts_blocking, pairs_to_render)
+            render_cache.record_render_time(len(pairs_to_render), time.perf_counter() - render_start)
+
+            for pair in pairs_to_render:
+                # download_chart logs and swallows its errors, so the pairs that failed to download are missing from its result.
+                image_path = rendered_paths.get(pair)
+                image_paths[pair] = image_path
+                in_flight_renders[(normalize_pair(pair), slot_start)].set_result(image_path)
+
+                if image_path:
+                    render_cache.put(pair, slot_start, image_path)
+
+        except Exception as e:
+            for pair in pairs_to_render:
+                future = in_flight_renders[(normalize_pair(pair), slot_start)]
+                if not future.done():
+                    future.set_exception(e)
+                    # Mark the exception as retrieved, the jobs waiting on this render (if any) get it when they await the future.
+                    future.exception()
+            raise
+
+        finally:
+            for pair in pairs_to_render:
+                future = in_flight_renders.pop((normalize_pair(pair), slot_start), None)
+
+                # The render was cancelled, e.g. its job timed out. The jobs waiting on it would otherwise wait forever.
+                if future is not None and not future.done():
+                    future.set_exception(RuntimeError(f"The {pair} render was cancelled"))
+                    future.exception()
+
+    for pair, future in awaited_renders.items():
+        # shield() so that a cancelled waiter doesn't cancel the render for everyone else.
+        image_paths[pair] = await asyncio.shield(future)
+
+    render_cache.log_stats()
+
+    return image_paths
+
+
+def shutdown_render_executor():
+    # Wait for the in-flight renders to finish, then quit the browsers of this process.
+    render_executor.shutdown(wait=True, cancel_futures=True)
+    shutdown_renderer_pool()
+    shutdown_postprocessor_pool()
+    chart_pool.shutdown()
+
+    logger.info("Render executor shut down")
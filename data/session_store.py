@@ -0,0 +1,143 @@
+# This module keeps the logged-in chart website session as an exported cookie jar, so new browsers start logged in by getting the cookies
+# injected, instead of going through the login form.
+import json
+import os
+import threading
+import time
+
+import constants
+from utils.logger import logger
+
+
+# The fields of a CDP Network.Cookie that Network.setCookies takes back.
+COOKIE_PARAM_KEYS = ["name", "value", "domain", "path", "secure", "httpOnly", "sameSite", "expires", "priority", "sourceScheme", "sourcePort"]
+
+
+def is_persistent(cookie: dict) -> bool:
+    return not cookie.get("session", False) and cookie.get("expires", -1) > 0
+
+
+def get_cookie_key(cookie: dict) -> str:
+    return f"{cookie.get('domain')}|{cookie.get('path')}|{cookie['name']}"
+
+
+def to_cookie_param(cookie: dict) -> dict:
+    # Strips a cookie from Network.getAllCookies down to what Network.setCookies accepts.
+    cookie_param = {key: cookie[key] for key in COOKIE_PARAM_KEYS if key in cookie}
+    if not is_persistent(cookie):
+        cookie_param.pop("expires", None)
+
+    return cookie_param
+
+
+class SessionStore:
+    def __init__(self, session_file: str):
+        self.session_file = session_file
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_expiry(cookies: list[dict], first_seen_times: dict) -> float | None:
+        """
+        Returns when the session expires, as a unix timestamp: the earliest expiry of the session cookies. None if none of them has an expiry.
+
+        The session cookies are SESSION_COOKIE_NAMES. If that's empty, they're the persistent cookies that were set to last longer than
+        SESSION_REFRESH_MARGIN_SECONDS. Short-lived cookies, like the bot protection ones that last half an hour, would otherwise always look
+        about to expire and have the session refreshed on every check.
+
+        Args:
+            cookies (list[dict]): The cookies as returned by CDP Network.getAllCookies.
+            first_seen_times (dict): When every cookie (by get_cookie_key) was first seen with its current expiry, as a unix timestamp.
+        """
+        session_cookie_names = [name.strip() for name in constants.SESSION_COOKIE_NAMES.split(",") if name.strip()]
+
+        # The cookies that have already expired are on their way out of the browser, they don't end the session.
+        now = time.time()
+        expiries = []
+        for cookie in cookies:
+            if not is_persistent(cookie) or cookie["expires"] <= now:
+                continue
+
+            if session_cookie_names:
+                if cookie["name"] in session_cookie_names:
+                    expiries.append(cookie["expires"])
+
+            elif cookie["expires"] - first_seen_times.get(get_cookie_key(cookie), now) >= constants.SESSION_REFRESH_MARGIN_SECONDS:
+                expiries.append(cookie["expires"])
+
+        return min(expiries) if expiries else None
+
+    def __get_first_seen_times(self, cookies: list[dict], now: float) -> dict:
+        # A cookie keeps the time it was first seen while its expiry stays the same, a cookie that was set again starts over.
+        try:
+            with open(self.session_file, 'r') as file:
+                previous_first_seen = json.load(file).get("first_seen", {})
+        except (FileNotFoundError, json.JSONDecodeError):
+            previous_first_seen = {}
+
+        first_seen_times = {}
+        for cookie in cookies:
+            if not is_persistent(cookie):
+                continue
+
+            cookie_key = get_cookie_key(cookie)
+            previous_expires, previous_first_seen_time = previous_first_seen.get(cookie_key, (None, None))
+            first_seen_times[cookie_key] = previous_first_seen_time if previous_expires == cookie["expires"] else now
+
+        return first_seen_times
+
+    def save(self, cookies: list[dict]):
+        """
+        Saves the cookies as returned by CDP Network.getAllCookies, through a temp file that atomically replaces the session file.
+        """
+        now = time.time()
+
+        temp_file = f"{self.session_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with self.lock:
+            first_seen_times = self.__get_first_seen_times(cookies, now)
+            session = {
+                "saved_at": now,
+                "expiry": self.get_expiry(cookies, first_seen_times),
+                "cookies": cookies,
+                "first_seen": {
+                    get_cookie_key(cookie): [cookie["expires"], first_seen_times[get_cookie_key(cookie)]]
+                    for cookie in cookies if is_persistent(cookie)
+                },
+            }
+
+            with open(temp_file, 'w') as file:
+                json.dump(session, file)
+            os.replace(temp_file, self.session_file)
+
+        logger.info(f"Saved {len(cookies)} session cookies, the session expires at {session['expiry']}")
+
+    def load(self) -> list[dict] | None:
+        # The saved cookies that haven't expired yet, or None if there's no session or it has expired.
+        try:
+            with open(self.session_file, 'r') as file:
+                session = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        now = time.time()
+        if session["expiry"] is not None and session["expiry"] <= now:
+            return None
+
+        return [cookie for cookie in session["cookies"] if not is_persistent(cookie) or cookie["expires"] > now]
+
+    def get_session_expiry(self) -> float | None:
+        try:
+            with open(self.session_file, 'r') as file:
+                return json.load(file)["expiry"]
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def needs_refresh(self) -> bool:
+        # True if there's no saved session, or it expires within SESSION_REFRESH_MARGIN_SECONDS.
+        expiry = self.get_session_expiry()
+        if expiry is None:
+            return not os.path.exists(self.session_file)
+
+        return expiry - time.time() < constants.SESSION_REFRESH_MARGIN_SECONDS
+
+
+session_store = SessionStore(session_file=os.path.abspath("session_cookies.json"))
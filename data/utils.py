@@ -1,25 +1,113 @@
-import requests
+from contextlib import AsyncExitStack
+from pathlib import Path
+
 import pandas as pd
+from telegram import InputMediaPhoto
+from telegram.error import BadRequest
+
 import constants
+from data.file_id_cache import file_id_cache
+from data.image_store import image_store
+from data.kline_fetcher import fetch_klines
+from utils.logger import logger
+from utils.outbound_dispatcher import outbound_dispatcher, PERIODIC_PRIORITY
+
+# The most photos Telegram accepts in a single media group.
+MAX_ALBUM_SIZE = 10
+
+
+def normalize_pair(pair: str) -> str:
+    # Strip the quote asset and whitespace off a pair, since the chart website only takes the coin, e.g. BTCUSDT -> BTC
+    return pair.replace("USDT", "").replace("USD", "").replace(" ", "").upper()
 
 
 def get_pair_data(symbol: str, timeframe: str, limit=70) -> pd.DataFrame:
-    response = requests.get(f"https://api.binance.com/api/v3/klines?symbol={symbol}&interval={timeframe}&limit={limit}").json()
-    df = pd.DataFrame(response, columns=[
-        'open_time', 'open', 'high', 'low', 'close', 'volume',
-        'close_time', 'quote_asset_volume', 'number_of_trades',
-        'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume', 'ignore'
-    ])
-    df['time'] = pd.to_datetime(df['open_time'], unit='ms')
-    df[['open', 'high', 'low', 'close', 'volume']] = df[['open', 'high', 'low', 'close', 'volume']].astype(float)
-    df = df[['time', 'open', 'high', 'low', 'close', 'volume']]
-    df = df.set_index('time')
+    # The candles are served from the on-disk store and the in-memory cache first, only the ones newer than those are downloaded, over a
+    # shared connection pool.
+    return fetch_klines(symbol, timeframe, limit)
+
+
+async def send_image_with_caption(image_path, context, chat_id, caption, priority: int = PERIODIC_PRIORITY):
+    # Send the chart image to the channel. Images already uploaded in this slot are sent by their file_id, without uploading them again.
+    image_hash = image_store.get_image_hash(image_path)
+
+    def send_photo(photo):
+        # Through the outbound dispatcher, which paces the sends and retries them on flood limits. The photo is a Path or a file_id, so a retry
+        # builds the upload again instead of reusing a read file.
+        return outbound_dispatcher.send(chat_id, lambda: context.bot.send_photo(chat_id=chat_id, photo=photo, caption=caption), priority)
+
+    file_id = file_id_cache.get(image_hash)
+    if file_id is None:
+        async with file_id_cache.get_upload_lock(image_hash):
+            # Another send may have uploaded the image while this one waited for the lock.
+            file_id = file_id_cache.get(image_hash)
+            if file_id is None:
+                message = await send_photo(Path(image_path))
+
+                # The largest size is the one Telegram keeps closest to the uploaded image.
+                file_id_cache.put(image_hash, message.photo[-1].file_id)
+                return
+
+    try:
+        await send_photo(file_id)
+
+    except BadRequest as e:
+        logger.warning(f"Telegram refused the cached file_id of {image_path}, uploading it again: {e}")
+        file_id_cache.discard(image_hash)
+
+        message = await send_photo(Path(image_path))
+        file_id_cache.put(image_hash, message.photo[-1].file_id)
+
+
+async def send_images_as_album(images: list[tuple[str, str]], context, chat_id, priority: int = PERIODIC_PRIORITY):
+    """
+    Send chart images to the channel as media group albums of up to 10, each image with its own caption. Images already uploaded in this slot
+    are sent by their file_id, and the file_ids of the ones uploaded now are remembered for the next channels.
+
+    Args:
+        images (list[tuple[str, str]]): (image path, caption) of every image, in the order they should appear.
+        context: The job or handler context.
+        chat_id: The ID of the channel.
+        priority (int): The outbound dispatcher priority of the albums.
+    """
+    for album_start in range(0, len(images), MAX_ALBUM_SIZE):
+        album = images[album_start:album_start + MAX_ALBUM_SIZE]
+
+        # Telegram doesn't accept an album of one
+        if len(album) == 1:
+            await send_image_with_caption(album[0][0], context, chat_id, album[0][1], priority)
+            continue
+
+        image_hashes = [image_store.get_image_hash(image_path) for image_path, _ in album]
+
+        async with AsyncExitStack() as stack:
+            # Hold the upload lock of every image that isn't uploaded yet, taken in hash order so two albums can't wait on each other.
+            for image_hash in sorted(set(image_hash for image_hash in image_hashes if image_hash not in file_id_cache.entries)):
+                await stack.enter_async_context(file_id_cache.get_upload_lock(image_hash))
+
+            media = []
+            for (image_path, caption), image_hash in zip(album, image_hashes):
+                file_id = file_id_cache.get(image_hash)
+                photo = file_id if file_id is not None else Path(image_path)
+                media.append(InputMediaPhoto(media=photo, caption=caption))
 
-    return df
+            try:
+                messages = await outbound_dispatcher.send(
+                    chat_id, lambda: context.bot.send_media_group(chat_id=chat_id, media=media), priority, cost=len(media)
+                )
+            except BadRequest as e:
+                logger.warning(f"Telegram refused the album for {chat_id}, sending the images one by one: {e}")
+                messages = None
 
+            if messages is not None:
+                for message, image_hash in zip(messages, image_hashes):
+                    if image_hash not in file_id_cache.entries:
+                        file_id_cache.put(image_hash, message.photo[-1].file_id)
 
-async def send_image_with_caption(image_path, context, chat_id, caption):
-    # Send the chart image to the channel
-    with open(image_path, 'rb') as photo:
-        await context.bot.send_photo(chat_id=chat_id, photo=photo, caption=caption)
+        # Sent after the upload locks are released, since the single sends take them too.
+        if messages is None:
+            for image_hash in image_hashes:
+                file_id_cache.discard(image_hash)
 
+            for image_path, caption in album:
+                await send_image_with_caption(image_path, context, chat_id, caption, priority)
@@ -0,0 +1,171 @@
+# Benchmarks Chart against the local stand-in chart website, so the numbers are repeatable and coinglass is never hit. It measures the driver
+# startup, the first load with the login, the latency of every single-pair download_chart, the throughput of download_chart_batch and the peak
+# RSS of the browser, and writes them as JSON, along with the commit and the settings, to compare runs across commits.
+#
+# Run from the project root, it reads .env.params and .env.secret like the bot does. The browser runs on a throwaway profile and session file.
+#
+# Usage:
+#   python -m devtools.benchmark_render --pairs BTC,ETH,SOL,XRP --runs 3 --data-delay 0.5 --output benchmark.json
+#
+# tests/test_benchmark_render.py runs it once, with --runs 1 on a free port, and checks that nothing failed.
+import argparse
+import json
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import constants
+from data.chart import Chart
+from data.profile_manager import profile_manager
+from data.session_store import session_store
+from devtools.benchmark_startup import summarize
+from devtools.standin_server import create_server, CHART_PATH, LOGIN_PATH
+
+
+class RssSampler:
+    def __init__(self, chart: Chart, interval: float = 0.1):
+        # Samples the browser's RSS in a background thread and keeps the peak.
+        self.chart = chart
+        self.interval = interval
+        self.peak_rss = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.__sample, daemon=True)
+
+    def __sample(self):
+        while not self.stop_event.is_set():
+            self.peak_rss = max(self.peak_rss, self.chart.get_memory_usage())
+            self.stop_event.wait(self.interval)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+
+def get_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(pairs: list[str], runs: int, max_tabs: int) -> dict:
+    results = {}
+
+    startup_start = time.perf_counter()
+    chart = Chart(headless_mode=True)
+    results["startup_seconds"] = round(time.perf_counter() - startup_start, 3)
+
+    rss_sampler = RssSampler(chart)
+    rss_sampler.start()
+
+    try:
+        # The first load logs in through the stand-in's login page.
+        warm_up_start = time.perf_counter()
+        chart.warm_up()
+        results["warm_up_seconds"] = round(time.perf_counter() - warm_up_start, 3)
+
+        latencies = []
+        n_failed = 0
+        for _ in range(runs):
+            for pair in pairs:
+                render_start = time.perf_counter()
+                image_paths = chart.download_chart(pair)
+                if pair in image_paths:
+                    latencies.append(time.perf_counter() - render_start)
+                else:
+                    n_failed += 1
+
+        results["pair_latency"] = {**(summarize(latencies) if latencies else {"runs": 0}), "failed": n_failed}
+        results["page_load"] = summarize([timing["load_seconds"] for timing in chart.load_timings]) if chart.load_timings else None
+
+        batch_seconds = []
+        n_downloaded = 0
+        for _ in range(runs):
+            batch_start = time.perf_counter()
+            image_paths = chart.download_chart_batch(pairs, max_tabs=max_tabs)
+            batch_seconds.append(time.perf_counter() - batch_start)
+            n_downloaded += len(image_paths)
+
+        results["batch"] = {
+            **summarize(batch_seconds),
+            "failed": runs * len(pairs) - n_downloaded,
+            "pairs_per_second": round(n_downloaded / sum(batch_seconds), 3),
+        }
+
+    finally:
+        rss_sampler.stop()
+        chart.quit()
+
+    results["peak_rss_mb"] = round(rss_sampler.peak_rss / (1024 * 1024), 1)
+    return results
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="Benchmark the chart renders against the local stand-in chart website")
+    parser.add_argument("--pairs", default="BTC,ETH,SOL,XRP", help="The pairs rendered, comma separated")
+    parser.add_argument("--runs", type=int, default=3, help="The times every pair and the batch are rendered")
+    parser.add_argument("--tabs", type=int, default=constants.RENDER_MAX_TABS, help="The tabs of the batch renders")
+    parser.add_argument("--port", type=int, default=8765, help="The port of the stand-in, 0 for any free one")
+    parser.add_argument("--page-delay", type=float, default=0.2, help="The seconds the chart page takes to be served")
+    parser.add_argument("--data-delay", type=float, default=0.5, help="The seconds the heatmap data takes to be served")
+    parser.add_argument("--render-delay", type=float, default=0.2, help="The seconds the page takes to draw the chart")
+    parser.add_argument("--jitter", type=float, default=0, help="Up to this many seconds added at random to the delays")
+    parser.add_argument("--no-consent", action="store_true", help="Don't show the consent overlay")
+    parser.add_argument("--no-login", action="store_true", help="Don't require a login")
+    parser.add_argument("--output", help="The file to write the results to, printed if not given")
+    args = parser.parse_args(argv)
+
+    pairs = [pair.strip() for pair in args.pairs.split(",") if pair.strip()]
+
+    server = create_server(
+        args.port, page_delay=args.page_delay, data_delay=args.data_delay, render_delay=args.render_delay, jitter=args.jitter,
+        consent=not args.no_consent, require_login=not args.no_login,
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    # Point the renders at the stand-in, and keep the real profile and session out of it.
+    constants.CHART_URL = f"http://127.0.0.1:{server.server_port}{CHART_PATH}"
+    constants.LOGIN_URL = f"http://127.0.0.1:{server.server_port}{LOGIN_PATH}"
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        profile_manager.template_dir = os.path.join(temp_dir, "chrome_profile")
+        os.makedirs(profile_manager.template_dir)
+        session_store.session_file = os.path.join(temp_dir, "session_cookies.json")
+
+        try:
+            results = {
+                "commit": get_commit(),
+                "started_at": datetime.now(timezone.utc).isoformat(),
+                "settings": {
+                    "pairs": pairs,
+                    "runs": args.runs,
+                    "tabs": args.tabs,
+                    "delays": server.delays,
+                    "consent": server.consent,
+                    "require_login": server.require_login,
+                    "request_blocking": constants.REQUEST_BLOCKING,
+                    "profile_clones": constants.CHROME_PROFILE_CLONES,
+                },
+                **run_benchmark(pairs, args.runs, args.tabs),
+                "logins": server.n_logins,
+            }
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
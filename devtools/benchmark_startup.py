@@ -0,0 +1,58 @@
+# Benchmarks the Chrome startup on the shared chrome_profile against the startup on a profile clone, and how long starting several browsers at
+# once takes with clones. Run from the project root, it reads .env.params like the bot does.
+#
+# Usage:
+#   python -m devtools.benchmark_startup --runs 5 --parallel 2
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from data.chart import Chart
+
+
+def start_and_quit(clone_profile: bool) -> float:
+    # The whole Chart construction, making the clone included.
+    startup_start = time.perf_counter()
+    chart = Chart(headless_mode=True, clone_profile=clone_profile)
+    startup_seconds = time.perf_counter() - startup_start
+    chart.quit()
+
+    return startup_seconds
+
+
+def summarize(timings: list[float]) -> dict:
+    return {
+        "runs": len(timings),
+        "mean": round(float(np.mean(timings)), 3),
+        "p50": round(float(np.percentile(timings, 50)), 3),
+        "p95": round(float(np.percentile(timings, 95)), 3),
+        "max": round(float(np.max(timings)), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Chrome startup on the shared profile and on profile clones")
+    parser.add_argument("--runs", type=int, default=5, help="The startups measured per mode")
+    parser.add_argument("--parallel", type=int, default=2, help="The browsers started at once with clones")
+    args = parser.parse_args()
+
+    # The shared profile can only run one browser at a time.
+    results = {
+        "shared": summarize([start_and_quit(clone_profile=False) for _ in range(args.runs)]),
+        "clone": summarize([start_and_quit(clone_profile=True) for _ in range(args.runs)]),
+    }
+
+    parallel_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.parallel) as executor:
+        parallel_timings = list(executor.map(lambda _: start_and_quit(clone_profile=True), range(args.parallel)))
+
+    results["clone_parallel"] = {**summarize(parallel_timings), "wall": round(time.perf_counter() - parallel_start, 3)}
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
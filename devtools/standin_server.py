@@ -0,0 +1,327 @@
+# A local stand-in for the chart website and the Binance klines API, for developing and testing without hitting coinglass or Binance. It serves a
+# minimal heatmap page and login page that match the selectors in .env.params, answers the page's heatmap data requests with recorded responses,
+# and serves deterministic synthetic candles on /api/v3/klines.
+#
+# Usage:
+#   python -m devtools.standin_server --port 8765
+#
+# Then point CHART_URL in .env.params to http://127.0.0.1:8765/pro/futures/LiquidationHeatMap, LOGIN_URL to http://127.0.0.1:8765/login and
+# BINANCE_API_URL to http://127.0.0.1:8765
+#
+# The chart page has the spinner, the blur, the consent overlay and the download button of the real one, and the page, the data and the drawing
+# can be slowed down with --page-delay, --data-delay and --render-delay. devtools/benchmark_render.py runs the renders against it.
+#
+# Recorded responses are read from devtools/recordings/<COIN>.json. Coins without a recording get a synthetic response of the same shape.
+# BTC.json is a small, fixed response in the recorded format, 60 price levels by 96 fifteen-minute columns from 2026-10-01 00:00 UTC, for the
+# tests in tests/test_capture_chart_data.py.
+import argparse
+import json
+import math
+import os
+import random
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+RECORDINGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recordings")
+
+CHART_PATH = "/pro/futures/LiquidationHeatMap"
+DATA_PATH = "/api/index/5/liqHeatMap"
+KLINES_PATH = "/api/v3/klines"
+LOGIN_PATH = "/login"
+
+# The Binance intervals in milliseconds, kept here too so the stand-in runs without the bot's constants.
+KLINE_INTERVALS = {
+    "1m": 60000, "3m": 180000, "5m": 300000, "15m": 900000, "30m": 1800000, "1h": 3600000,
+    "2h": 7200000, "4h": 14400000, "6h": 21600000, "12h": 43200000, "1d": 86400000,
+}
+
+CHART_PAGE = """<!DOCTYPE html>
+<html>
+<head><title>Liquidation Heatmap</title></head>
+<body>
+__LOGIN_LINK__
+<div>
+    <div class="MuiBox-root"><h1 class="MuiTypography-root">Liquidation Heatmap</h1></div>
+    <div class="toolbar">
+        <button class="MuiButton-root">1 day</button>
+        <button class="MuiButton-root">3 day</button>
+        <button class="MuiButton-root">1 week</button>
+        <button class="MuiButton-root MuiButton-variantSoft Mui-disabled" id="download">Download</button>
+    </div>
+    <div class="MuiBox-root" id="blur" style="position: absolute; inset: 0; backdrop-filter: blur(4px)"></div>
+    <div class="MuiBox-root" id="spinner"><span class="MuiCircularProgress-root">Loading...</span></div>
+    <canvas id="heatmap" width="1200" height="700"></canvas>
+</div>
+<script>
+    var coin = new URLSearchParams(window.location.search).get('coin') || 'BTC';
+
+    function draw(data) {
+        var canvas = document.getElementById('heatmap');
+        var context = canvas.getContext('2d');
+        var maxIntensity = Math.max.apply(null, data.liq.map(function (cell) { return cell[2]; }).concat([1]));
+        var cellWidth = canvas.width / data.prices.length;
+        var cellHeight = canvas.height / data.y.length;
+
+        context.fillStyle = '#440154';
+        context.fillRect(0, 0, canvas.width, canvas.height);
+        data.liq.forEach(function (cell) {
+            var level = cell[2] / maxIntensity;
+            context.fillStyle = 'rgb(' + Math.round(68 + 185 * level) + ',' + Math.round(1 + 230 * level) + ',' + Math.round(84 - 47 * level) + ')';
+            context.fillRect(cell[0] * cellWidth, canvas.height - (cell[1] + 1) * cellHeight, cellWidth, cellHeight);
+        });
+    }
+
+    // Like the real page, the download button stays disabled and the spinner and the blur stay up until the chart is drawn.
+    fetch('__DATA_PATH__?merge=true&symbol=Binance_' + coin + 'USDT&interval=5&limit=288')
+        .then(function (response) { return response.json(); })
+        .then(function (payload) {
+            setTimeout(function () {
+                draw(payload.data);
+                document.getElementById('spinner').remove();
+                document.getElementById('blur').remove();
+                document.getElementById('download').classList.remove('Mui-disabled');
+            }, __RENDER_DELAY_MS__);
+        });
+
+    document.getElementById('download').addEventListener('click', function () {
+        if (this.classList.contains('Mui-disabled')) {
+            return;
+        }
+        var link = document.createElement('a');
+        link.download = 'Liquidation Heatmap ' + coin + '.png';
+        link.href = document.getElementById('heatmap').toDataURL('image/png');
+        document.body.appendChild(link);
+        link.click();
+        link.remove();
+    });
+
+    // The consent manager shows up a moment after the page, like the real one that's loaded by a third party script.
+    if (__CONSENT__) {
+        setTimeout(function () {
+            var consentRoot = document.createElement('div');
+            consentRoot.className = 'fc-consent-root';
+            consentRoot.innerHTML = '<div class="fc-dialog-overlay" style="position: fixed; inset: 0; background: rgba(0, 0, 0, 0.5)"></div>' +
+                '<div class="fc-dialog" style="position: fixed; top: 40%; left: 40%; background: white">' +
+                'We value your privacy <button>Consent</button></div>';
+            document.body.appendChild(consentRoot);
+        }, 100);
+    }
+</script>
+</body>
+</html>
+""".replace("__DATA_PATH__", DATA_PATH)
+
+# The logged-out indicator of the chart page, shown while the stand-in requires a login and the browser hasn't logged in.
+LOGIN_LINK = '<header><a href="__LOGIN_PATH__">Log in</a></header>'.replace("__LOGIN_PATH__", LOGIN_PATH)
+
+# Matches the login selectors of Chart.login. The page links to the login itself, so it counts as logged out until the login has redirected.
+LOGIN_PAGE = """<!DOCTYPE html>
+<html>
+<head><title>Login</title></head>
+<body>
+<form method="post" action="__LOGIN_PATH__">
+    <input type="email" name="email">
+    <input type="password" name="password">
+    <button type="submit">Login</button>
+</form>
+<a href="__LOGIN_PATH__/forgot">Forgot password?</a>
+</body>
+</html>
+""".replace("__LOGIN_PATH__", LOGIN_PATH)
+
+SESSION_COOKIE_NAME = "standin_session"
+SESSION_MAX_AGE_SECONDS = 7 * 24 * 3600
+
+
+def generate_synthetic_response(coin: str, n_prices: int = 100, n_times: int = 288) -> dict:
+    # A deterministic, coinglass-shaped heatmap response, so the same coin always gets the same data.
+    rng = random.Random(coin)
+
+    base_price = rng.uniform(1, 100000)
+    price_levels = [round(base_price * (0.8 + 0.4 * i / n_prices), 6) for i in range(n_prices)]
+
+    interval_ms = 5 * 60 * 1000
+    start_time = int(time.time() * 1000) // interval_ms * interval_ms - n_times * interval_ms
+
+    prices = []
+    close = base_price
+    for i in range(n_times):
+        open_ = close
+        close = open_ * (1 + rng.gauss(0, 0.002))
+        high = max(open_, close) * (1 + abs(rng.gauss(0, 0.001)))
+        low = min(open_, close) * (1 - abs(rng.gauss(0, 0.001)))
+        prices.append([start_time + i * interval_ms, open_, high, low, close])
+
+    liquidations = [
+        [rng.randrange(n_times), rng.randrange(n_prices), round(rng.expovariate(1 / 1000000), 2)]
+        for _ in range(n_prices * n_times // 10)
+    ]
+
+    return {"code": "0", "msg": "success", "data": {"y": price_levels, "liq": liquidations, "prices": prices}}
+
+
+def generate_klines(symbol: str, interval: str, limit: int = 500, start_time: int = None, end_time: int = None) -> list:
+    # Deterministic Binance-shaped candles, the price of a candle only depends on the symbol and its open time, so refetches always agree.
+    interval_ms = KLINE_INTERVALS[interval]
+    last_open_time = int(time.time() * 1000) // interval_ms * interval_ms
+    if end_time is not None:
+        last_open_time = min(last_open_time, end_time // interval_ms * interval_ms)
+
+    if start_time is not None:
+        first_open_time = -(-start_time // interval_ms) * interval_ms
+        open_times = list(range(first_open_time, last_open_time + 1, interval_ms))[:limit]
+    else:
+        open_times = list(range(last_open_time - (limit - 1) * interval_ms, last_open_time + 1, interval_ms))
+
+    base_price = random.Random(symbol).uniform(1, 100000)
+
+    def price_at(timestamp):
+        return base_price * (1 + 0.05 * math.sin(timestamp / (interval_ms * 50)))
+
+    klines = []
+    for open_time in open_times:
+        open_ = price_at(open_time)
+        close = price_at(open_time + interval_ms)
+        high = max(open_, close) * 1.001
+        low = min(open_, close) * 0.999
+        klines.append([
+            open_time, f"{open_:.8f}", f"{high:.8f}", f"{low:.8f}", f"{close:.8f}", "100.0",
+            open_time + interval_ms - 1, "1000.0", 10, "50.0", "500.0", "0"
+        ])
+
+    return klines
+
+
+def load_response(coin: str) -> bytes:
+    recording_path = os.path.join(RECORDINGS_DIR, f"{coin}.json")
+    if os.path.exists(recording_path):
+        with open(recording_path, "rb") as file:
+            return file.read()
+
+    return json.dumps(generate_synthetic_response(coin)).encode()
+
+
+class StandInRequestHandler(BaseHTTPRequestHandler):
+    def __send(self, status: int, content_type: str, body: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def __delay(self, name: str):
+        # Sleeps for one of the server's configured delays, plus up to the configured jitter.
+        delay = self.server.delays[name]
+        if delay or self.server.delays["jitter"]:
+            time.sleep(delay + random.uniform(0, self.server.delays["jitter"]))
+
+    def __is_logged_in(self) -> bool:
+        return f"{SESSION_COOKIE_NAME}=" in self.headers.get("Cookie", "")
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+
+        if url.path == CHART_PATH:
+            self.__delay("page")
+            page = (
+                CHART_PAGE
+                .replace("__LOGIN_LINK__", LOGIN_LINK if self.server.require_login and not self.__is_logged_in() else "")
+                .replace("__RENDER_DELAY_MS__", str(int(self.server.delays["render"] * 1000)))
+                .replace("__CONSENT__", "true" if self.server.consent else "false")
+            )
+            self.__send(200, "text/html; charset=utf-8", page.encode())
+
+        elif url.path == LOGIN_PATH:
+            self.__send(200, "text/html; charset=utf-8", LOGIN_PAGE.encode())
+
+        elif url.path == DATA_PATH:
+            self.__delay("data")
+
+            # The symbol looks like Binance_BTCUSDT
+            symbol = query.get("symbol", ["Binance_BTCUSDT"])[0]
+            coin = symbol.split("_")[-1].removesuffix("USDT")
+            self.__send(200, "application/json", load_response(coin))
+
+        elif url.path == KLINES_PATH:
+            self.server.kline_requests.append(query)
+
+            if query.get("interval", [None])[0] not in KLINE_INTERVALS:
+                self.__send(400, "application/json", b'{"code": -1120, "msg": "Invalid interval."}')
+                return
+
+            klines = generate_klines(
+                query["symbol"][0],
+                query["interval"][0],
+                limit=int(query.get("limit", [500])[0]),
+                start_time=int(query["startTime"][0]) if "startTime" in query else None,
+                end_time=int(query["endTime"][0]) if "endTime" in query else None,
+            )
+            self.__send(200, "application/json", json.dumps(klines).encode())
+
+        else:
+            self.__send(404, "text/plain", b"Not found")
+
+    def do_POST(self):
+        # Any credentials log in: the session cookie is set and the browser is sent on to the chart page.
+        if urlparse(self.path).path != LOGIN_PATH:
+            self.__send(404, "text/plain", b"Not found")
+            return
+
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.n_logins += 1
+
+        self.send_response(303)
+        self.send_header("Set-Cookie", f"{SESSION_COOKIE_NAME}={random.getrandbits(64):x}; Max-Age={SESSION_MAX_AGE_SECONDS}; Path=/")
+        self.send_header("Location", CHART_PATH)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        # Keep the console quiet, the scraper's own logs are what matter.
+        pass
+
+
+def create_server(port: int = 8765, page_delay: float = 0, data_delay: float = 0, render_delay: float = 0, jitter: float = 0,
+                  consent: bool = True, require_login: bool = False) -> ThreadingHTTPServer:
+    """
+    Args:
+        port (int): The port to listen on.
+        page_delay (float): The seconds the chart page takes to be served.
+        data_delay (float): The seconds the heatmap data takes to be served, the spinner is up and the download button disabled meanwhile.
+        render_delay (float): The seconds the page takes to draw the chart after the data has arrived.
+        jitter (float): Up to this many seconds are added at random to the page and the data delays.
+        consent (bool): Show the consent overlay on the chart page.
+        require_login (bool): Show the logged-out indicator on the chart page until the browser has logged in through the login page.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), StandInRequestHandler)
+
+    server.delays = {"page": page_delay, "data": data_delay, "render": render_delay, "jitter": jitter}
+    server.consent = consent
+    server.require_login = require_login
+
+    # The query of every klines request, so tests can check what was actually fetched.
+    server.kline_requests = []
+    server.n_logins = 0
+
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for the chart website.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--page-delay", type=float, default=0, help="The seconds the chart page takes to be served")
+    parser.add_argument("--data-delay", type=float, default=0, help="The seconds the heatmap data takes to be served")
+    parser.add_argument("--render-delay", type=float, default=0, help="The seconds the page takes to draw the chart")
+    parser.add_argument("--jitter", type=float, default=0, help="Up to this many seconds added at random to the delays")
+    parser.add_argument("--no-consent", action="store_true", help="Don't show the consent overlay")
+    parser.add_argument("--require-login", action="store_true", help="Require a login through the stand-in login page")
+    args = parser.parse_args()
+
+    server = create_server(
+        args.port, page_delay=args.page_delay, data_delay=args.data_delay, render_delay=args.render_delay, jitter=args.jitter,
+        consent=not args.no_consent, require_login=args.require_login,
+    )
+    print(f"Serving the stand-in chart page on http://127.0.0.1:{args.port}{CHART_PATH}")
+    server.serve_forever()
@@ -0,0 +1,56 @@
+# Runs the render benchmark once against the local stand-in, as an end-to-end check of Chart: the login, the single-pair and the batch
+# downloads. Needs Chrome, it's skipped where there is none. Run from the project root with python -m pytest.
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import constants
+from data.profile_manager import profile_manager
+from data.session_store import session_store
+from devtools import benchmark_render
+
+CHROME_BINARIES = ("google-chrome", "google-chrome-stable", "chromium", "chromium-browser", "chrome")
+
+
+@unittest.skipUnless(any(shutil.which(binary) for binary in CHROME_BINARIES), "Chrome is not installed")
+class BenchmarkRenderTest(unittest.TestCase):
+    def setUp(self):
+        # The benchmark points these at the stand-in and a throwaway profile, put them back for the other tests.
+        self.originals = {
+            (constants, "CHART_URL"): constants.CHART_URL,
+            (constants, "LOGIN_URL"): constants.LOGIN_URL,
+            (profile_manager, "template_dir"): profile_manager.template_dir,
+            (session_store, "session_file"): session_store.session_file,
+        }
+
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        for (owner, name), value in self.originals.items():
+            setattr(owner, name, value)
+
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+
+    def test_single_run_renders_every_pair(self):
+        output_file = os.path.join(self.output_dir, "benchmark.json")
+        benchmark_render.main([
+            "--pairs", "BTC,ETH", "--runs", "1", "--port", "0",
+            "--page-delay", "0", "--data-delay", "0.1", "--render-delay", "0.1",
+            "--output", output_file,
+        ])
+
+        with open(output_file) as file:
+            results = json.load(file)
+
+        self.assertEqual(results["pair_latency"]["runs"], 2)
+        self.assertEqual(results["pair_latency"]["failed"], 0)
+        self.assertEqual(results["batch"]["runs"], 1)
+        self.assertEqual(results["batch"]["failed"], 0)
+        self.assertGreater(results["peak_rss_mb"], 0)
+        self.assertGreaterEqual(results["logins"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
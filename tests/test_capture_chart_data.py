@@ -0,0 +1,90 @@
+# Tests the heatmap data capture against the recorded response the local stand-in serves for BTC. The capture itself needs Chrome, it's skipped
+# where there is none. Run from the project root with python -m pytest.
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+import constants
+from data import heatmap_data
+from data.chart import Chart
+from data.heatmap_data import HeatmapData
+from data.profile_manager import profile_manager
+from data.session_store import session_store
+from devtools.standin_server import create_server, load_response, RECORDINGS_DIR, CHART_PATH, LOGIN_PATH
+
+CHROME_BINARIES = ("google-chrome", "google-chrome-stable", "chromium", "chromium-browser", "chrome")
+
+PAIR = "BTC"
+
+
+def load_recording() -> dict:
+    with open(os.path.join(RECORDINGS_DIR, f"{PAIR}.json")) as file:
+        return json.load(file)["data"]
+
+
+class HeatmapDataTest(unittest.TestCase):
+    def test_recording_parses_into_the_grid(self):
+        recording = load_recording()
+        heatmap = HeatmapData.from_response(PAIR, load_response(PAIR))
+
+        self.assertEqual(heatmap.intensity.shape, (len(recording["y"]), len(recording["prices"])))
+        self.assertEqual(heatmap.klines.shape, (len(recording["prices"]), 4))
+        self.assertTrue(np.all(np.diff(heatmap.price_levels) > 0))
+        # The grid is float32, close enough for the intensities.
+        total_intensity = sum(liquidation[2] for liquidation in recording["liq"])
+        self.assertAlmostEqual(float(heatmap.intensity.sum(dtype=np.float64)), total_intensity, delta=total_intensity * 1e-6)
+
+
+@unittest.skipUnless(any(shutil.which(binary) for binary in CHROME_BINARIES), "Chrome is not installed")
+class CaptureChartDataTest(unittest.TestCase):
+    def setUp(self):
+        self.server = create_server(0)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.temp_dir = tempfile.mkdtemp()
+
+        # Point the capture at the stand-in, and keep the real profile, session and heatmap data out of it.
+        self.patched = {
+            (constants, "CHART_URL"): f"http://127.0.0.1:{self.server.server_port}{CHART_PATH}",
+            (constants, "LOGIN_URL"): f"http://127.0.0.1:{self.server.server_port}{LOGIN_PATH}",
+            (profile_manager, "template_dir"): os.path.join(self.temp_dir, "chrome_profile"),
+            (session_store, "session_file"): os.path.join(self.temp_dir, "session_cookies.json"),
+            (heatmap_data, "HEATMAP_DATA_DIR"): os.path.join(self.temp_dir, "heatmap_data"),
+        }
+        self.originals = {target: getattr(*target) for target in self.patched}
+        for (owner, name), value in self.patched.items():
+            setattr(owner, name, value)
+
+        os.makedirs(profile_manager.template_dir)
+
+    def tearDown(self):
+        for (owner, name), value in self.originals.items():
+            setattr(owner, name, value)
+
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_capture_matches_the_recording(self):
+        chart = Chart(headless_mode=True, capture_data=True)
+        try:
+            heatmap = chart.capture_chart_data(PAIR)
+        finally:
+            chart.quit()
+
+        recording = load_recording()
+        self.assertEqual(heatmap.intensity.shape, (len(recording["y"]), len(recording["prices"])))
+        self.assertEqual((heatmap.price_levels[0], heatmap.price_levels[-1]), (recording["y"][0], recording["y"][-1]))
+        self.assertEqual((heatmap.times[0], heatmap.times[-1]), (recording["prices"][0][0], recording["prices"][-1][0]))
+
+        # The capture is saved as well.
+        self.assertTrue(os.path.exists(os.path.join(heatmap_data.HEATMAP_DATA_DIR, f"{PAIR}.npz")))
+
+
+if __name__ == "__main__":
+    unittest.main()
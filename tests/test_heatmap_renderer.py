@@ -0,0 +1,65 @@
+# Tests the local heatmap renderer on small synthetic heatmaps.
+import os
+import shutil
+import tempfile
+import unittest
+import warnings
+
+import numpy as np
+from PIL import Image
+
+from data.heatmap_data import HeatmapData
+from data.heatmap_renderer import bin_intensity, render_heatmap_image
+
+WIDTH = 300
+HEIGHT = 120
+
+
+def create_heatmap(price_levels: list[float], n_times: int = 12) -> HeatmapData:
+    price_levels = np.asarray(price_levels, dtype=np.float64)
+    times = np.arange(n_times, dtype=np.int64) * 900000
+    intensity = (np.arange(len(price_levels))[:, None] + 1) * np.ones((1, n_times), dtype=np.float32)
+    klines = np.tile([price_levels[0], price_levels[-1], price_levels[0], price_levels[-1]], (n_times, 1))
+
+    return HeatmapData("TEST", price_levels, times, intensity, klines)
+
+
+class BinIntensityTest(unittest.TestCase):
+    def test_every_pixel_row_takes_the_nearest_price_level(self):
+        heatmap = create_heatmap([10, 20, 30, 40], n_times=3)
+
+        row_intensities = bin_intensity(heatmap, np.array([0, 11, 14, 16, 24, 26, 39, 100.0]), 3)[:, 0]
+
+        self.assertEqual(list(row_intensities), [1, 1, 1, 2, 2, 3, 4, 4])
+
+
+class RenderHeatmapImageTest(unittest.TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+
+    def render(self, heatmap: HeatmapData) -> np.ndarray:
+        output_path = os.path.join(self.output_dir, "heatmap.png")
+
+        # A zero price span used to show up as divide by zero warnings.
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            render_heatmap_image(heatmap, None, output_path, WIDTH, HEIGHT)
+
+        with Image.open(output_path) as image:
+            return np.asarray(image)
+
+    def test_renders_a_heatmap(self):
+        self.assertEqual(self.render(create_heatmap([100, 101, 102, 103])).shape, (HEIGHT, WIDTH, 3))
+
+    def test_renders_a_single_price_level(self):
+        self.assertEqual(self.render(create_heatmap([100])).shape, (HEIGHT, WIDTH, 3))
+
+    def test_renders_equal_price_levels(self):
+        self.assertEqual(self.render(create_heatmap([100, 100, 100])).shape, (HEIGHT, WIDTH, 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+# Tests the incremental kline fetching against the klines API of the local stand-in. Run from the project root with python -m pytest, it reads
+# .env.params and .env.secret like the bot does.
+import tempfile
+import threading
+import time
+import unittest
+
+import constants
+from data import kline_fetcher
+from data.kline_fetcher import KlineCache, BINANCE_INTERVALS, MAX_KLINES_PER_REQUEST, fetch_klines, fetch_many
+from data.kline_store import kline_store
+from devtools.standin_server import create_server, generate_klines
+
+SYMBOL = "BTCUSDT"
+TIMEFRAME = "1h"
+LIMIT = 50
+
+
+class KlineCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.server = create_server(0)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        # Point the fetches at the stand-in, and keep the real cache and store out of it.
+        self.patched = {
+            (constants, "BINANCE_API_URL"): f"http://127.0.0.1:{self.server.server_port}",
+            (kline_fetcher, "kline_cache"): KlineCache(max_candles=LIMIT),
+            (kline_store, "root_dir"): tempfile.mkdtemp(),
+            (kline_store, "maps"): {},
+        }
+        self.originals = {target: getattr(*target) for target in self.patched}
+        for (owner, name), value in self.patched.items():
+            setattr(owner, name, value)
+
+    def tearDown(self):
+        for (owner, name), value in self.originals.items():
+            setattr(owner, name, value)
+
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_request(self, index: int) -> dict:
+        return {key: values[0] for key, values in self.server.kline_requests[index].items()}
+
+    def test_first_fetch_requests_the_whole_window(self):
+        klines = fetch_klines(SYMBOL, TIMEFRAME, LIMIT)
+
+        self.assertEqual(len(klines), LIMIT)
+        self.assertEqual(len(self.server.kline_requests), 1)
+        self.assertNotIn("startTime", self.get_request(0))
+        self.assertEqual(int(self.get_request(0)["limit"]), LIMIT)
+
+    def test_refetch_only_requests_from_the_last_cached_candle(self):
+        first_klines = fetch_klines(SYMBOL, TIMEFRAME, LIMIT)
+        last_open_time = int(first_klines.index[-1].value // 1_000_000)
+
+        klines = fetch_klines(SYMBOL, TIMEFRAME, LIMIT)
+
+        request = self.get_request(1)
+        self.assertEqual(int(request["startTime"]), last_open_time)
+        # The last cached candle and the one after it, in case a new candle has opened since.
+        n_missing_candles = (time.time() * 1000 - last_open_time) // BINANCE_INTERVALS[TIMEFRAME] + 1
+        self.assertEqual(int(request["limit"]), n_missing_candles + 1)
+
+        # The merged candles are the same as a fresh fetch of the whole window.
+        self.assertEqual(len(klines), LIMIT)
+        self.assertTrue(klines.index.is_monotonic_increasing and klines.index.is_unique)
+        self.assertEqual(list(klines.index), list(kline_fetcher.klines_to_dataframe(generate_klines(SYMBOL, TIMEFRAME, LIMIT)).index))
+
+    def test_cache_seeded_from_the_store_requests_from_the_last_stored_candle(self):
+        fetch_klines(SYMBOL, TIMEFRAME, LIMIT)
+
+        # A restart, the candles in memory are gone but the closed ones are on disk.
+        kline_fetcher.kline_cache = KlineCache(max_candles=LIMIT)
+        klines = fetch_klines(SYMBOL, TIMEFRAME, LIMIT)
+
+        self.assertIn("startTime", self.get_request(1))
+        self.assertEqual(len(klines), LIMIT)
+
+    def test_stale_cache_requests_the_whole_window(self):
+        # Candles that ended longer ago than a single request can bridge.
+        end_time = int(time.time() * 1000) - 2 * MAX_KLINES_PER_REQUEST * BINANCE_INTERVALS[TIMEFRAME]
+        kline_fetcher.kline_cache.merge(SYMBOL, TIMEFRAME, generate_klines(SYMBOL, TIMEFRAME, LIMIT, end_time=end_time), LIMIT)
+
+        klines = fetch_klines(SYMBOL, TIMEFRAME, LIMIT)
+
+        self.assertNotIn("startTime", self.get_request(0))
+        self.assertEqual(int(self.get_request(0)["limit"]), LIMIT)
+        self.assertGreater(klines.index[0].value // 1_000_000, end_time)
+
+    def test_fetch_many_returns_none_for_the_failed_fetches(self):
+        klines = fetch_many([(SYMBOL, TIMEFRAME, LIMIT), ("ETHUSDT", TIMEFRAME, LIMIT), ("SOLUSDT", "7m", LIMIT)])
+
+        self.assertEqual(len(klines[SYMBOL]), LIMIT)
+        self.assertEqual(len(klines["ETHUSDT"]), LIMIT)
+        self.assertIsNone(klines["SOLUSDT"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+# Tests the on-disk kline store, with the candles of the local stand-in.
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from data.kline_fetcher import BINANCE_INTERVALS, klines_to_dataframe
+from data.kline_store import KlineStore
+from devtools.standin_server import generate_klines
+
+SYMBOL = "BTCUSDT"
+TIMEFRAME = "1h"
+
+
+def get_klines(limit: int, end_time: int):
+    return klines_to_dataframe(generate_klines(SYMBOL, TIMEFRAME, limit, end_time=end_time))
+
+
+class KlineStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp()
+        self.store = KlineStore(self.root_dir)
+
+        # Far enough in the past for every candle to be closed.
+        self.end_time = int(time.time() * 1000) - 100 * BINANCE_INTERVALS[TIMEFRAME]
+
+    def tearDown(self):
+        shutil.rmtree(self.root_dir, ignore_errors=True)
+
+    def test_append_after_an_interrupted_append_keeps_the_columns_in_step(self):
+        klines = get_klines(10, self.end_time)
+        self.store.append(SYMBOL, TIMEFRAME, klines.iloc[:8], BINANCE_INTERVALS[TIMEFRAME])
+
+        # An append that was killed after writing a few rows of one column only.
+        with open(os.path.join(self.root_dir, SYMBOL, TIMEFRAME, "open_time.bin"), "ab") as file:
+            file.write(np.array([1, 2, 3], dtype="<i8").tobytes())
+
+        self.assertEqual(len(self.store.read(SYMBOL, TIMEFRAME)["open_time"]), 8)
+
+        self.assertEqual(self.store.append(SYMBOL, TIMEFRAME, klines, BINANCE_INTERVALS[TIMEFRAME]), 2)
+
+        stored = self.store.read_dataframe(SYMBOL, TIMEFRAME)
+        self.assertEqual(list(stored.index), list(klines.index))
+        self.assertTrue(np.array_equal(stored["close"].to_numpy(), klines["close"].to_numpy()))
+
+    def test_append_skips_the_stored_and_the_forming_candles(self):
+        klines = get_klines(5, self.end_time)
+        self.assertEqual(self.store.append(SYMBOL, TIMEFRAME, klines, BINANCE_INTERVALS[TIMEFRAME]), 5)
+        self.assertEqual(self.store.append(SYMBOL, TIMEFRAME, klines, BINANCE_INTERVALS[TIMEFRAME]), 0)
+
+        # The latest candle is still forming.
+        latest_klines = klines_to_dataframe(generate_klines(SYMBOL, TIMEFRAME, 3))
+        self.store.append(SYMBOL, TIMEFRAME, latest_klines, BINANCE_INTERVALS[TIMEFRAME])
+        self.assertLess(self.store.get_last_open_time(SYMBOL, TIMEFRAME), int(latest_klines.index[-1].value // 1_000_000))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+# Tests the coalescing of concurrent renders in render_charts, with a stand-in for the blocking render.
+import asyncio
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from data import render_executor
+from data.render_executor import render_charts, in_flight_renders
+
+PAIR = "TESTCOIN"
+
+
+class RenderChartsTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.render_started = threading.Event()
+        self.render_released = threading.Event()
+        self.n_renders = 0
+
+        def render_charts_blocking(pair_list):
+            self.n_renders += 1
+            self.render_started.set()
+            self.render_released.wait(5)
+            return {pair: f"/tmp/{pair}.png" for pair in pair_list}
+
+        self.originals = {
+            "render_charts_blocking": render_executor.render_charts_blocking,
+            "render_executor": render_executor.render_executor,
+        }
+        render_executor.render_charts_blocking = render_charts_blocking
+        render_executor.render_executor = ThreadPoolExecutor(max_workers=2)
+
+    def tearDown(self):
+        self.render_released.set()
+        render_executor.render_executor.shutdown(wait=True)
+
+        for name, value in self.originals.items():
+            setattr(render_executor, name, value)
+
+    async def start_leader_and_waiter(self) -> tuple[asyncio.Task, asyncio.Task]:
+        leader = asyncio.create_task(render_charts([PAIR]))
+        await asyncio.to_thread(self.render_started.wait, 5)
+
+        waiter = asyncio.create_task(render_charts([PAIR]))
+        await asyncio.sleep(0)
+
+        return leader, waiter
+
+    async def test_waiter_gets_the_leaders_render(self):
+        leader, waiter = await self.start_leader_and_waiter()
+        self.render_released.set()
+
+        self.assertEqual(await asyncio.wait_for(waiter, 5), {PAIR: f"/tmp/{PAIR}.png"})
+        self.assertEqual(await leader, {PAIR: f"/tmp/{PAIR}.png"})
+        self.assertEqual(self.n_renders, 1)
+
+    async def test_waiter_fails_when_the_leader_is_cancelled(self):
+        leader, waiter = await self.start_leader_and_waiter()
+        leader.cancel()
+
+        with self.assertRaises(asyncio.CancelledError):
+            await leader
+
+        # The waiter gets an error instead of hanging on the abandoned render.
+        with self.assertRaises(RuntimeError):
+            await asyncio.wait_for(waiter, 5)
+
+        self.assertFalse(in_flight_renders)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,24 +1,226 @@
+import copy
 import json
+import os
+import threading
+import time
 
+import constants
 from utils.logger import logger
 
 # The file path to the config file
 CONFIG_FILE = 'utils/configs.json'
 
+# How long a write waits for more changes to batch with, in seconds.
+CONFIG_WRITE_DELAY_SECONDS = 2
+
+# How often, at most, the config file's modification time is checked for changes made outside the bot, in seconds.
+CONFIG_MTIME_CHECK_SECONDS = 1
+
+
+def get_default_channel_config() -> dict:
+    return {
+        "posting_interval": 14400,  # 4 hours by default
+        "mode": "simultaneous",
+        "pair_list": [],
+        "channel_link": None,
+        "album": False
+    }
+
+
+class ConfigStore:
+    """
+    Process-wide config cache. Reads are served from memory, and the file is only read again when its modification time changes. Changes are
+    applied under a per-channel lock and written back in batches, through a temp file that atomically replaces the config file.
+    """
+
+    def __init__(self, config_file: str):
+        self.config_file = config_file
+
+        self.config = None
+        self.file_mtime = None
+        self.last_mtime_check = 0
+
+        # Guards the config dict itself, the per-channel locks serialize the read-modify-write of each channel.
+        self.lock = threading.RLock()
+        self.channel_locks = {}
+
+        self.is_dirty = False
+        self.write_timer = None
+
+        # Serializes the writes of the file, so a shutdown flush and a timer flush can't interleave on the temp file.
+        self.write_lock = threading.Lock()
+
+    def __get_file_mtime(self):
+        try:
+            return os.stat(self.config_file).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def __read_file(self):
+        try:
+            with open(self.config_file, 'r') as file:
+                self.config = json.load(file)
+        except FileNotFoundError:
+            self.config = {}
+
+        self.file_mtime = self.__get_file_mtime()
+
+    def __refresh(self):
+        # Load the config on first use, and reload it if the file was changed by something other than the bot.
+        if self.config is None:
+            self.__read_file()
+            return
+
+        now = time.monotonic()
+        if now - self.last_mtime_check < CONFIG_MTIME_CHECK_SECONDS:
+            return
+        self.last_mtime_check = now
+
+        if self.__get_file_mtime() == self.file_mtime:
+            return
+
+        if self.is_dirty:
+            logger.warning("Config file changed on disk while there are unsaved changes, the unsaved changes will overwrite it")
+            return
+
+        logger.info("Config file changed on disk, reloading it")
+        self.__read_file()
+
+    def get_config(self) -> dict:
+        # The returned dict is shared, it must not be modified. Use update_channel_config to make changes.
+        with self.lock:
+            self.__refresh()
+            return self.config
+
+    def get_channel_config(self, chat_id: str) -> dict | None:
+        # The channel's config, or None if it has none. Shared like get_config's dict, it must not be modified.
+        return self.get_config().get(chat_id)
+
+    def get_channels_for_pair(self, pair: str) -> list[str]:
+        # The IDs of the channels that have the pair on their list. The JSON backend has no index, so this scans every channel.
+        return [chat_id for chat_id, channel_config in self.get_config().items() if pair in channel_config["pair_list"]]
+
+    def __get_channel_lock(self, chat_id: str) -> threading.RLock:
+        with self.lock:
+            return self.channel_locks.setdefault(chat_id, threading.RLock())
+
+    def update_channel_config(self, chat_id: str, mutate):
+        """
+        Applies a change to a channel's config, initializing the channel to the defaults first if it has no config. The change is made on a copy
+        that replaces the channel's config once it's done, so readers never see a half-applied change.
+
+        Args:
+            chat_id (str): The ID of the channel.
+            mutate (callable): Called with the channel's config dict to modify it in place.
+
+        Returns:
+            Whatever mutate returns.
+        """
+        with self.__get_channel_lock(chat_id):
+            with self.lock:
+                self.__refresh()
+                channel_config = copy.deepcopy(self.config.get(chat_id, get_default_channel_config()))
+
+            result = mutate(channel_config)
+
+            with self.lock:
+                self.config = {**self.config, chat_id: channel_config}
+                self.__schedule_write()
+
+        return result
+
+    def replace_config(self, config: dict):
+        # Replaces the whole config, for the callers that still save the full dict.
+        with self.lock:
+            self.config = copy.deepcopy(config)
+            self.__schedule_write()
+
+    def __schedule_write(self):
+        # Called with self.lock held. The first change starts the timer, the changes made before it fires are written along with it.
+        self.is_dirty = True
+
+        if self.write_timer is None:
+            self.write_timer = threading.Timer(CONFIG_WRITE_DELAY_SECONDS, self.flush)
+            self.write_timer.daemon = True
+            self.write_timer.start()
+
+    def flush(self):
+        """Writes the pending changes to the config file, through a temp file that atomically replaces it."""
+        with self.write_lock:
+            # The config dict is replaced rather than modified on every change, so a reference to it is a snapshot that can be written without
+            # holding self.lock, and the readers on the event loop don't wait for the disk.
+            with self.lock:
+                self.write_timer = None
+                if not self.is_dirty:
+                    return
+
+                config = self.config
+                self.is_dirty = False
+
+            try:
+                config_json = json.dumps(config, indent=4)
+
+                temp_file = f"{self.config_file}.tmp"
+                with open(temp_file, 'w') as file:
+                    file.write(config_json)
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.replace(temp_file, self.config_file)
+
+            except Exception as e:
+                # The changes are still only in memory, mark them unsaved again so the next write retries them.
+                logger.error(f"Error writing the config file, retrying in {CONFIG_WRITE_DELAY_SECONDS}s: {e}")
+                with self.lock:
+                    self.__schedule_write()
+                return
+
+            with self.lock:
+                # The bot's own write shouldn't count as an outside change.
+                self.file_mtime = self.__get_file_mtime()
+
+    def shutdown(self):
+        with self.lock:
+            if self.write_timer is not None:
+                self.write_timer.cancel()
+
+        self.flush()
+
+
+def _create_config_store():
+    # The SQLite backend imports the JSON config the first time it starts, the JSON file is left in place as a backup.
+    if constants.CONFIG_BACKEND == "sqlite":
+        from utils.config_sqlite import SqliteConfigStore
+        return SqliteConfigStore(constants.CONFIG_DB_FILE, json_file=CONFIG_FILE)
+
+    return ConfigStore(CONFIG_FILE)
+
+
+config_store = _create_config_store()
+
 
 def load_config() -> dict:
-    # Load the configuration file if it exists, otherwise return an empty dictionary
-    try:
-        with open(CONFIG_FILE, 'r') as file:
-            return json.load(file)
-    except FileNotFoundError:
-        return {}
+    # Return the configuration, served from memory. The returned dict must not be modified, use update_channel_config instead.
+    return config_store.get_config()
+
+
+def get_channel_config(chat_id: str) -> dict | None:
+    # Return a single channel's configuration, or None if it has none. The returned dict must not be modified.
+    return config_store.get_channel_config(chat_id)
+
+
+def get_channels_for_pair(pair: str) -> list[str]:
+    # Return the IDs of the channels that post the pair, as it's written on their pair lists.
+    return config_store.get_channels_for_pair(pair)
 
 
 def save_config(config) -> None:
-    # Save the config dict to the config file
-    with open(CONFIG_FILE, 'w') as file:
-        json.dump(config, file, indent=4)
+    # Replace the whole config. The write to the config file happens in the background, batched with the other changes.
+    config_store.replace_config(config)
+
+
+def update_channel_config(chat_id: str, mutate):
+    # Apply a change to a single channel's config under its lock, see ConfigStore.update_channel_config.
+    return config_store.update_channel_config(chat_id, mutate)
 
 
 def initiate_channel_config(chat_id: str):
@@ -29,20 +231,11 @@ def initiate_channel_config(chat_id: str):
         chat_id (str): The ID of the channel.
     """
 
-    config = load_config()
-
-    if chat_id not in config:
-        config[chat_id] = {
-            "posting_interval": 14400,  # 4 hours by default
-            "mode": "simultaneous",
-            "pair_list": [],
-            "channel_link": None
-        }
-
-        save_config(config)
+    if chat_id not in load_config():
+        update_channel_config(chat_id, lambda channel_config: None)
         logger.info(f"Initialized configuration for channel {chat_id}")
 
     else:
         logger.info(f"Configuration for channel {chat_id} already exists")
 
-    return config
+    return load_config()
@@ -0,0 +1,220 @@
+# This module keeps the channel configs in a SQLite database, one row per channel and one row per pair, so a change to a channel only rewrites
+# that channel's rows, and looking up the channels that post a pair goes through an index instead of a scan of every channel.
+import json
+import os
+import sqlite3
+import threading
+
+from utils.logger import logger
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS channels (
+    chat_id TEXT PRIMARY KEY,
+    posting_interval INTEGER NOT NULL,
+    mode TEXT NOT NULL,
+    channel_link TEXT,
+    pair_interval INTEGER,
+    options TEXT NOT NULL DEFAULT '{}'
+);
+
+CREATE TABLE IF NOT EXISTS channel_pairs (
+    chat_id TEXT NOT NULL REFERENCES channels (chat_id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    pair TEXT NOT NULL,
+    PRIMARY KEY (chat_id, position)
+);
+
+CREATE INDEX IF NOT EXISTS channel_pairs_pair ON channel_pairs (pair);
+
+CREATE TABLE IF NOT EXISTS metadata (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# The config keys that have their own column. Any other key of a channel's config is kept in the options column as JSON.
+CHANNEL_COLUMNS = ["posting_interval", "mode", "channel_link", "pair_interval"]
+
+
+def _row_to_channel_config(row: tuple, pair_list: list[str]) -> dict:
+    posting_interval, mode, channel_link, pair_interval, options = row
+
+    channel_config = {"posting_interval": posting_interval, "mode": mode, "pair_list": pair_list, "channel_link": channel_link}
+    if pair_interval is not None:
+        channel_config["pair_interval"] = pair_interval
+    channel_config.update(json.loads(options))
+
+    return channel_config
+
+
+def _channel_config_to_row(chat_id: str, channel_config: dict) -> tuple:
+    options = {key: value for key, value in channel_config.items() if key not in CHANNEL_COLUMNS and key != "pair_list"}
+
+    return (
+        chat_id,
+        channel_config["posting_interval"],
+        channel_config["mode"],
+        channel_config.get("channel_link"),
+        channel_config.get("pair_interval"),
+        json.dumps(options),
+    )
+
+
+class SqliteConfigStore:
+    """
+    The SQLite counterpart of ConfigStore, with the same methods. Every change is its own transaction, so there is nothing to batch or flush.
+    """
+
+    def __init__(self, db_file: str, json_file: str = None):
+        self.db_file = db_file
+
+        # A single connection shared by the bot's threads, in autocommit mode so the transactions are explicit.
+        self.connection = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None)
+        self.lock = threading.RLock()
+
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode = WAL")
+            self.connection.execute("PRAGMA synchronous = NORMAL")
+            self.connection.execute("PRAGMA foreign_keys = ON")
+            self.connection.executescript(SCHEMA)
+
+        if json_file is not None:
+            self.migrate_from_json(json_file)
+
+    def __read_pair_lists(self, chat_id: str = None) -> dict[str, list[str]]:
+        if chat_id is None:
+            rows = self.connection.execute("SELECT chat_id, pair FROM channel_pairs ORDER BY chat_id, position")
+        else:
+            rows = self.connection.execute("SELECT chat_id, pair FROM channel_pairs WHERE chat_id = ? ORDER BY position", (chat_id,))
+
+        pair_lists = {}
+        for pair_chat_id, pair in rows:
+            pair_lists.setdefault(pair_chat_id, []).append(pair)
+
+        return pair_lists
+
+    def get_config(self) -> dict:
+        # The whole config in the JSON layout, read in two queries. Only needed at startup, the rest of the bot reads single channels.
+        with self.lock:
+            pair_lists = self.__read_pair_lists()
+            rows = self.connection.execute(
+                "SELECT chat_id, posting_interval, mode, channel_link, pair_interval, options FROM channels"
+            ).fetchall()
+
+        return {row[0]: _row_to_channel_config(row[1:], pair_lists.get(row[0], [])) for row in rows}
+
+    def get_channel_config(self, chat_id: str) -> dict | None:
+        with self.lock:
+            return self.__get_channel_config(chat_id)
+
+    def __get_channel_config(self, chat_id: str) -> dict | None:
+        row = self.connection.execute(
+            "SELECT posting_interval, mode, channel_link, pair_interval, options FROM channels WHERE chat_id = ?", (chat_id,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        return _row_to_channel_config(row, self.__read_pair_lists(chat_id).get(chat_id, []))
+
+    def get_channels_for_pair(self, pair: str) -> list[str]:
+        # Served by the index on channel_pairs.pair.
+        with self.lock:
+            rows = self.connection.execute("SELECT DISTINCT chat_id FROM channel_pairs WHERE pair = ?", (pair,)).fetchall()
+
+        return [row[0] for row in rows]
+
+    def __write_channel_config(self, chat_id: str, channel_config: dict):
+        # Called inside a transaction. Only the channel's own rows are touched. Imported here, config_manager imports this module.
+        from utils.config_manager import get_default_channel_config
+
+        # Older JSON configs can be missing keys, the defaults fill them in.
+        channel_config = {**get_default_channel_config(), **channel_config}
+
+        self.connection.execute(
+            "INSERT INTO channels (chat_id, posting_interval, mode, channel_link, pair_interval, options) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (chat_id) DO UPDATE SET posting_interval = excluded.posting_interval, mode = excluded.mode, "
+            "channel_link = excluded.channel_link, pair_interval = excluded.pair_interval, options = excluded.options",
+            _channel_config_to_row(chat_id, channel_config),
+        )
+        self.connection.execute("DELETE FROM channel_pairs WHERE chat_id = ?", (chat_id,))
+        self.connection.executemany(
+            "INSERT INTO channel_pairs (chat_id, position, pair) VALUES (?, ?, ?)",
+            [(chat_id, position, pair) for position, pair in enumerate(channel_config["pair_list"])],
+        )
+
+    def update_channel_config(self, chat_id: str, mutate):
+        """
+        Applies a change to a channel's config in a single transaction, initializing the channel to the defaults first if it has no config.
+
+        Args:
+            chat_id (str): The ID of the channel.
+            mutate (callable): Called with the channel's config dict to modify it in place.
+
+        Returns:
+            Whatever mutate returns.
+        """
+        from utils.config_manager import get_default_channel_config
+
+        with self.lock:
+            # BEGIN IMMEDIATE takes the write lock before the read, so another process can't change the channel in between.
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                channel_config = self.__get_channel_config(chat_id) or get_default_channel_config()
+                result = mutate(channel_config)
+                self.__write_channel_config(chat_id, channel_config)
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+
+        return result
+
+    def replace_config(self, config: dict):
+        # Replaces every channel, for the callers that still save the full dict.
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                self.__replace_config(config)
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+
+    def __replace_config(self, config: dict):
+        self.connection.execute("DELETE FROM channels WHERE chat_id NOT IN (SELECT value FROM json_each(?))", (json.dumps(list(config)),))
+        for chat_id, channel_config in config.items():
+            self.__write_channel_config(chat_id, channel_config)
+
+    def migrate_from_json(self, json_file: str):
+        """
+        Imports the channels of the JSON config file, once. Later starts find the migration recorded in the metadata table and skip it, so
+        the JSON file can stay in place without overwriting the changes made since.
+        """
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                migrated = self.connection.execute("SELECT value FROM metadata WHERE key = 'migrated_from_json'").fetchone()
+                if migrated is not None or not os.path.exists(json_file):
+                    self.connection.execute("ROLLBACK")
+                    return
+
+                with open(json_file, 'r') as file:
+                    config = json.load(file)
+
+                for chat_id, channel_config in config.items():
+                    self.__write_channel_config(chat_id, channel_config)
+                self.connection.execute("INSERT INTO metadata (key, value) VALUES ('migrated_from_json', ?)", (json_file,))
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+
+        logger.info(f"Migrated {len(config)} channel configs from {json_file} to {self.db_file}")
+
+    def flush(self):
+        # Every change is committed as it's made.
+        pass
+
+    def shutdown(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,208 @@
+# This module times the stages of the render and send pipeline. Every stage is timed as a span, labelled with its pair and job, and the spans
+# are aggregated into histograms that are served in the Prometheus text format on a local HTTP endpoint, and dumped to a file on shutdown.
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import constants
+from utils.logger import logger
+
+# The upper bounds of the histogram buckets, in seconds, from a quick script to a render that times out.
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+
+def _escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in labels.items()) + "}"
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, label_names: list[str], buckets: tuple = DEFAULT_BUCKETS):
+        """
+        Args:
+            name (str): The metric name.
+            documentation (str): The HELP text of the metric.
+            label_names (list[str]): The names of the labels every observation carries.
+            buckets (tuple): The upper bounds of the buckets, in increasing order. The +Inf bucket is implied.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+
+        # label values -> [the count of every bucket, the sum, the count]
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        label_values = tuple(str(labels.get(label_name, "")) for label_name in self.label_names)
+
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+
+            for i, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    series[0][i] += 1
+
+            series[1] += value
+            series[2] += 1
+
+    def compose(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+
+        with self.lock:
+            series_items = [(label_values, (list(series[0]), series[1], series[2])) for label_values, series in self.series.items()]
+
+        for label_values, (bucket_counts, total, count) in series_items:
+            labels = dict(zip(self.label_names, label_values))
+
+            for upper_bound, bucket_count in zip(self.buckets, bucket_counts):
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': upper_bound})} {bucket_count}")
+
+            lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.histograms = {}
+
+        # name -> (type, documentation, callback), read when the metrics are composed, for the stats other modules already keep.
+        self.callbacks = {}
+
+        self.lock = threading.Lock()
+
+    def histogram(self, name: str, documentation: str, label_names: list[str], buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram(name, documentation, label_names, buckets)
+
+            return self.histograms[name]
+
+    def register_callback(self, name: str, metric_type: str, documentation: str, callback):
+        """
+        Registers a metric whose value is read when the metrics are composed.
+
+        Args:
+            name (str): The metric name.
+            metric_type (str): "counter" or "gauge".
+            documentation (str): The HELP text of the metric.
+            callback (callable): Called without arguments, returns the current value.
+        """
+        self.callbacks[name] = (metric_type, documentation, callback)
+
+    def compose(self) -> str:
+        lines = []
+        for histogram in list(self.histograms.values()):
+            lines += histogram.compose()
+
+        for name, (metric_type, documentation, callback) in list(self.callbacks.items()):
+            try:
+                value = callback()
+            except Exception as e:
+                logger.warning(f"Error reading the {name} metric: {e}")
+                continue
+
+            lines += [f"# HELP {name} {documentation}", f"# TYPE {name} {metric_type}", f"{name} {value}"]
+
+        return "\n".join(lines) + "\n"
+
+    def dump(self, file_path: str):
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        with open(file_path, 'w') as file:
+            file.write(self.compose())
+
+        logger.info(f"Dumped the metrics to {file_path}")
+
+
+metrics = MetricsRegistry()
+
+stage_seconds = metrics.histogram(
+    "heatmap_stage_seconds", "The time spent in every stage of the render and send pipeline.", ["stage", "pair", "job"]
+)
+
+
+@contextmanager
+def span(stage: str, pair: str = "", job: str = ""):
+    """
+    Times the code in the with block as one of the pipeline's stages, whether it finishes or raises.
+
+    A render is shared by every job that asked for its pairs in the same slot, so the spans of the render stages only carry the pair, the spans
+    of the send stages carry the job as well. The chat isn't a label, every channel would multiply the series of every pair and stage.
+
+    Args:
+        stage (str): The stage, e.g. "navigation" or "telegram_upload".
+        pair (str): The pair the stage is working on, if any.
+        job (str): The kind of job the stage is part of, "periodic" or "on_demand".
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, stage=stage, pair=pair, job=job)
+
+
+def observe_stage(stage: str, seconds: float, pair: str = "", job: str = ""):
+    # For the stages that don't fit a with block, like the ones the batch mode polls for.
+    stage_seconds.observe(seconds, stage=stage, pair=pair, job=job)
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+
+        body = metrics.compose().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Every scrape would end up in the bot's logs otherwise.
+        pass
+
+
+metrics_server = None
+
+
+def start_metrics_server():
+    # Serves the metrics on http://METRICS_HOST:METRICS_PORT/metrics in a background thread. METRICS_PORT=0 turns the endpoint off.
+    global metrics_server
+    if not constants.METRICS_PORT or metrics_server is not None:
+        return
+
+    metrics_server = ThreadingHTTPServer((constants.METRICS_HOST, constants.METRICS_PORT), _MetricsRequestHandler)
+    threading.Thread(target=metrics_server.serve_forever, name="metrics", daemon=True).start()
+
+    logger.info(f"Serving the metrics on http://{constants.METRICS_HOST}:{constants.METRICS_PORT}/metrics")
+
+
+def shutdown_metrics():
+    # Stops the endpoint and dumps the metrics to METRICS_DUMP_FILE, if it's set.
+    global metrics_server
+    if metrics_server is not None:
+        metrics_server.shutdown()
+        metrics_server.server_close()
+        metrics_server = None
+
+    if constants.METRICS_DUMP_FILE:
+        try:
+            metrics.dump(constants.METRICS_DUMP_FILE)
+        except OSError as e:
+            logger.error(f"Error dumping the metrics to {constants.METRICS_DUMP_FILE}: {e}")
@@ -0,0 +1,300 @@
+# This module paces everything the bot sends to Telegram. Sends wait in a priority queue per chat, on-demand replies ahead of periodic posts,
+# and go out as fast as a global token bucket and a token bucket per chat allow. A send that hits the flood limit holds every chat off for Telegram's
+# retry_after and goes again, instead of being dropped.
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from datetime import timedelta
+
+import numpy as np
+from telegram.error import RetryAfter
+
+import constants
+from utils.logger import logger
+from utils.metrics import span
+
+# Lower goes first. Replies to commands shouldn't wait behind a tick's worth of periodic posts.
+ON_DEMAND_PRIORITY = 0
+PERIODIC_PRIORITY = 1
+
+# The job label of the telegram_upload spans of every priority.
+PRIORITY_JOBS = {ON_DEMAND_PRIORITY: "on_demand", PERIODIC_PRIORITY: "periodic"}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        """
+        Args:
+            rate (float): The tokens added per second.
+            capacity (float): The most tokens the bucket holds, i.e. the largest burst.
+        """
+        self.rate = rate
+        self.capacity = capacity
+
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0
+
+        # Waiters get their tokens in the order they asked for them.
+        self.lock = asyncio.Lock()
+
+    def __refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, cost: int = 1) -> float:
+        """
+        Takes cost tokens if there are enough, without waiting. A cost larger than the capacity is taken from a full bucket, which then stays
+        in debt until it has refilled the difference.
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise the seconds until there are enough.
+        """
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+
+        self.__refill(now)
+        needed = min(cost, self.capacity)
+        if self.tokens >= needed:
+            self.tokens -= cost
+            return 0
+
+        return (needed - self.tokens) / self.rate
+
+    async def acquire(self, cost: int = 1):
+        async with self.lock:
+            while True:
+                wait_seconds = self.try_acquire(cost)
+                if not wait_seconds:
+                    return
+
+                await asyncio.sleep(wait_seconds)
+
+    def pause(self, seconds: float):
+        # Hand out nothing for the given time, and start empty afterwards, for when Telegram asks to back off.
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+class OutboundDispatcher:
+    def __init__(self, global_rate: float, chat_rate: float, chat_burst: float, n_workers: int, max_retries: int):
+        """
+        Args:
+            global_rate (float): The most sends per second over all chats.
+            chat_rate (float): The most sends per second to a single chat.
+            chat_burst (float): How many sends to a single chat can go out back to back.
+            n_workers (int): The number of sends in progress at once.
+            max_retries (int): How many times a send is retried after a flood limit error before it fails.
+        """
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.n_workers = n_workers
+        self.max_retries = max_retries
+
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_buckets = {}
+
+        # Every chat has a queue of its own, as a heap of (priority, sequence number, send). The sequence number keeps the sends of the same
+        # priority in order.
+        self.chat_queues = {}
+        self.sequence = itertools.count()
+
+        # The workers take (priority, sequence number, chat_id) tickets of the chats that have something to send, most urgent first. A worker
+        # only takes a send off a chat whose bucket has a token. A chat that has to wait gets its ticket back once its bucket refills, so a
+        # busy chat never holds up the workers, the other chats or the on-demand replies.
+        self.ready_chats = None
+        self.waiting_chats = set()
+        self.workers = []
+
+        # The sends queued or in progress, for the shutdown to wait for.
+        self.n_pending = 0
+        self.idle_event = None
+
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.latencies = deque(maxlen=1000)
+
+    def __start(self):
+        # The queue and the workers belong to the running event loop, so they're created on the first send.
+        self.ready_chats = asyncio.PriorityQueue()
+        self.idle_event = asyncio.Event()
+        self.workers = [asyncio.create_task(self.__work()) for _ in range(self.n_workers)]
+
+    def __get_chat_bucket(self, chat_id) -> TokenBucket:
+        chat_bucket = self.chat_buckets.get(chat_id)
+        if chat_bucket is None:
+            chat_bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+
+        return chat_bucket
+
+    def __put_ticket(self, chat_id):
+        chat_queue = self.chat_queues.get(chat_id)
+        if chat_queue:
+            priority, sequence_number, _ = chat_queue[0]
+            self.ready_chats.put_nowait((priority, sequence_number, chat_id))
+
+    def __wake_chat(self, chat_id):
+        self.waiting_chats.discard(chat_id)
+        self.__put_ticket(chat_id)
+
+    def __enqueue(self, chat_id, priority: int, sequence_number: int, send: tuple):
+        heapq.heappush(self.chat_queues.setdefault(chat_id, []), (priority, sequence_number, send))
+
+        # A chat waiting for its bucket gets its ticket when the bucket refills. Otherwise the chat gets a ticket for this send, a chat can
+        # have several, the extra ones are dropped by the workers.
+        if chat_id not in self.waiting_chats:
+            self.__put_ticket(chat_id)
+
+    async def send(self, chat_id, send_call, priority: int = PERIODIC_PRIORITY, cost: int = 1):
+        """
+        Queues a send and waits for it to go out.
+
+        Args:
+            chat_id: The chat the send goes to, for its rate limit.
+            send_call (callable): Called without arguments to make the Bot API call, e.g. lambda: context.bot.send_message(...). It's called
+                again on every retry, so it has to build a fresh request each time.
+            priority (int): ON_DEMAND_PRIORITY or PERIODIC_PRIORITY.
+            cost (int): The number of messages the call sends, e.g. the number of photos of a media group, taken from both buckets.
+
+        Returns:
+            Whatever the Bot API call returns.
+        """
+        if self.ready_chats is None:
+            self.__start()
+
+        future = asyncio.get_running_loop().create_future()
+
+        self.n_pending += 1
+        self.idle_event.clear()
+        self.__enqueue(chat_id, priority, next(self.sequence), (send_call, future, time.perf_counter(), 0, cost))
+
+        return await future
+
+    async def __work(self):
+        while True:
+            _, _, chat_id = await self.ready_chats.get()
+
+            chat_queue = self.chat_queues.get(chat_id)
+            if not chat_queue or chat_id in self.waiting_chats:
+                continue
+
+            _, _, (_, _, _, _, cost) = chat_queue[0]
+            wait_seconds = self.__get_chat_bucket(chat_id).try_acquire(cost)
+            if wait_seconds:
+                self.waiting_chats.add(chat_id)
+                asyncio.get_running_loop().call_later(wait_seconds, self.__wake_chat, chat_id)
+                continue
+
+            priority, sequence_number, send = heapq.heappop(chat_queue)
+            if not chat_queue:
+                del self.chat_queues[chat_id]
+            else:
+                self.__put_ticket(chat_id)
+
+            try:
+                await self.__dispatch(chat_id, priority, sequence_number, send)
+            except Exception as e:
+                logger.error(f"Error dispatching a message to {chat_id}: {e}")
+
+    def __finish(self):
+        self.n_pending -= 1
+        if not self.n_pending:
+            self.idle_event.set()
+
+    async def __dispatch(self, chat_id, priority: int, sequence_number: int, send: tuple):
+        send_call, future, queued_at, attempt, cost = send
+
+        # The global bucket is shared by every chat, waiting on it holds up nobody in particular.
+        await self.global_bucket.acquire(cost)
+
+        try:
+            # Only the Bot API call itself, the time the send spent queued and paced shows up in the callers' send_wait spans.
+            with span("telegram_upload", job=PRIORITY_JOBS.get(priority, "")):
+                result = await send_call()
+
+        except RetryAfter as e:
+            retry_after = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else e.retry_after
+
+            # Telegram doesn't say whether the limit hit was the chat's or the bot's, so every chat holds off, or the other chats' sends would
+            # run into the same limit.
+            self.global_bucket.pause(retry_after)
+            self.__get_chat_bucket(chat_id).pause(retry_after)
+
+            if attempt == self.max_retries:
+                self.failed += 1
+                if not future.done():
+                    future.set_exception(e)
+                self.__finish()
+                return
+
+            # Back into the chat's queue in its old place, the paused bucket keeps the chat waiting until Telegram allows it again.
+            logger.warning(f"Flood limit hit sending to {chat_id}, retrying in {retry_after}s")
+            self.retried += 1
+            self.__enqueue(chat_id, priority, sequence_number, (send_call, future, queued_at, attempt + 1, cost))
+            return
+
+        except Exception as e:
+            self.failed += 1
+            if not future.done():
+                future.set_exception(e)
+            self.__finish()
+            return
+
+        self.sent += 1
+        self.latencies.append(time.perf_counter() - queued_at)
+        if not future.done():
+            future.set_result(result)
+        self.__finish()
+
+    def get_queue_depth(self) -> int:
+        return self.n_pending
+
+    def compose_stats(self) -> str:
+        latencies = np.array(self.latencies) if self.latencies else np.zeros(1)
+
+        return (
+            f"Outbound dispatcher: "
+            f"queue depth = {self.get_queue_depth()}, "
+            f"sent = {self.sent}, "
+            f"failed = {self.failed}, "
+            f"retried = {self.retried}, "
+            f"latency p50 = {np.percentile(latencies, 50):.2f}s, "
+            f"p95 = {np.percentile(latencies, 95):.2f}s"
+        )
+
+    def log_stats(self):
+        logger.info(self.compose_stats())
+
+    async def shutdown(self, timeout: float = 30):
+        # Give the queued sends a chance to go out, then stop the workers.
+        if self.ready_chats is None:
+            return
+
+        if self.n_pending:
+            try:
+                await asyncio.wait_for(self.idle_event.wait(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Outbound dispatcher shut down with {self.get_queue_depth()} messages still queued")
+
+        for worker in self.workers:
+            worker.cancel()
+
+        self.log_stats()
+
+
+outbound_dispatcher = OutboundDispatcher(
+    global_rate=constants.DISPATCH_GLOBAL_RATE,
+    chat_rate=constants.DISPATCH_CHAT_RATE_PER_MINUTE / 60,
+    chat_burst=constants.DISPATCH_CHAT_BURST,
+    n_workers=constants.DISPATCH_WORKERS,
+    max_retries=constants.DISPATCH_MAX_RETRIES,
+)
+
+
+async def send_message(context, priority: int = ON_DEMAND_PRIORITY, **kwargs):
+    # context.bot.send_message through the outbound dispatcher. Messages are mostly replies to commands, so they go ahead of the periodic posts.
+    return await outbound_dispatcher.send(kwargs["chat_id"], lambda: context.bot.send_message(**kwargs), priority)